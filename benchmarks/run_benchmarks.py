@@ -0,0 +1,232 @@
+"""End-to-end benchmarks of the updater, watchlist, add-to-watchlist and search
+paths against local stand-ins for the Notion and TMDB APIs (stubservers.py).
+
+Every scenario starts from the same synthetic library, an empty TMDB cache and
+fresh connection pools, and reports wall time, API calls per endpoint and
+peak Python memory, e.g.:
+
+  python benchmarks/run_benchmarks.py --shows 2000 --seasons 15000 \\
+      --notion-latency-ms 150 --tmdb-latency-ms 40 --notion-rps 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from stubservers import NotionStubServer, SyntheticLibrary, TmdbStubServer
+from stubservers import kShowsDbId, kSeasonsDbId, kWatchlistDbId
+
+kRepoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+kScenarios = ["update_shows_and_seasons", "update_watchlist", "add_from_tmdb",
+              "add_from_tmdb_async", "search"]
+kSearchQueries = ["the office", "breaking", "star", "doctor", "the", "house",
+                  "lost", "friends"]
+
+
+def configure_environment(notion_url: str, tmdb_url: str, work_dir: str):
+  """Point the repo's modules at the stubs. Must run before they are imported,
+  since the TMDB base URL is read at import time."""
+  os.environ["NOTION_TOKEN"] = "stub-token"
+  os.environ["TMDB_API_KEY"] = "stub-key"
+  os.environ["SHOWS_DB"] = kShowsDbId
+  os.environ["SEASONS_DB"] = kSeasonsDbId
+  os.environ["FUTURE_SHOWS_DB"] = kWatchlistDbId
+  os.environ["NOTION_BASE_URL"] = notion_url
+  os.environ["TMDB_BASE_URL"] = tmdb_url
+  os.environ["TMDB_CACHE_DIR"] = os.path.join(work_dir, "tmdbcache")
+  os.environ["NOTION_MIRROR_PATH"] = os.path.join(work_dir, "mirror.db")
+  os.environ["RUN_JOURNAL_DIR"] = os.path.join(work_dir, "runjournals")
+  sys.path.insert(0, kRepoDir)
+
+
+def run_benchmarks(args) -> list:
+  new_library = lambda: SyntheticLibrary(args.shows, args.seasons, args.
+                                         watchlist, args.seed)
+  notion_stub = NotionStubServer(new_library(), args.notion_latency_ms / 1000,
+                                 args.notion_rate_limit)
+  tmdb_stub = TmdbStubServer(new_library(), args.tmdb_latency_ms / 1000,
+                             args.tmdb_rate_limit)
+  notion_stub.start()
+  tmdb_stub.start()
+  work_dir = tempfile.mkdtemp(prefix="tvshows-benchmark-")
+  configure_environment(notion_stub.get_base_url(), tmdb_stub.get_base_url(),
+                        work_dir)
+
+  from tvshowsupdater import AddFromTmdb, UpdateFromTmdb
+  from tvshowsupdater import configure_connection_pools, search_from_tmdb
+  from tvshowsupdater import configure_logging
+  from notionhelpers import configure_notion_scheduler, get_notion_write_stats
+  from notionhelpers import new_async_notion_client
+  from runmetrics import RunMetrics, get_run_metrics, use_run_metrics
+  from tmdbhelpers import AsyncTmdbClient, configure_tmdb_cache
+
+  def update_shows_and_seasons(library: SyntheticLibrary) -> int:
+    updater = UpdateFromTmdb(max_workers=args.max_workers,
+                             use_mirror=args.mirror,
+                             metrics=get_run_metrics())
+    updater.update_shows_and_seasons()
+    return len(library.show_tmdb_ids)
+
+  def update_watchlist(library: SyntheticLibrary) -> int:
+    updater = UpdateFromTmdb(is_watchlist=True,
+                             max_workers=args.max_workers,
+                             use_mirror=args.mirror,
+                             metrics=get_run_metrics())
+    updater.update_watchlist()
+    return len(library.watchlist_tmdb_ids)
+
+  def add_from_tmdb(library: SyntheticLibrary) -> int:
+    # One add at a time, like the add-to-watchlist route.
+    tmdb_ids = library.show_tmdb_ids[:args.adds]
+    for tmdb_id in tmdb_ids:
+      AddFromTmdb(tmdb_id=str(tmdb_id),
+                  is_watchlist=True).create_show_notion_row()
+    return len(tmdb_ids)
+
+  def add_from_tmdb_async(library: SyntheticLibrary) -> int:
+    # All adds at once on one event loop and one pair of clients, like the
+    # add-to-watchlist route under load.
+    tmdb_ids = library.show_tmdb_ids[:args.adds]
+
+    async def add(tmdb_id: int, tmdb_client, notion):
+      add_from_tmdb = await AddFromTmdb.fetch_async(tmdb_id=str(tmdb_id),
+                                                    is_watchlist=True,
+                                                    tmdb_client=tmdb_client,
+                                                    notion=notion)
+      await add_from_tmdb.create_show_notion_row_async()
+
+    async def add_all():
+      async with AsyncTmdbClient() as tmdb_client:
+        async with new_async_notion_client() as notion:
+          await asyncio.gather(
+              *[add(tmdb_id, tmdb_client, notion) for tmdb_id in tmdb_ids])
+
+    asyncio.run(add_all())
+    return len(tmdb_ids)
+
+  def search(library: SyntheticLibrary) -> int:
+    for i in range(args.searches):
+      search_from_tmdb(kSearchQueries[i % len(kSearchQueries)])
+    return args.searches
+
+  scenario_fns = {
+      "update_shows_and_seasons": update_shows_and_seasons,
+      "update_watchlist": update_watchlist,
+      "add_from_tmdb": add_from_tmdb,
+      "add_from_tmdb_async": add_from_tmdb_async,
+      "search": search,
+  }
+
+  configure_logging("INFO" if args.verbose else "WARNING")
+  results = []
+  for name in args.scenarios:
+    library = new_library()
+    notion_stub.reset(library)
+    tmdb_stub.reset(library)
+    scenario_dir = tempfile.mkdtemp(dir=work_dir)
+    os.environ["NOTION_MIRROR_PATH"] = os.path.join(scenario_dir, "mirror.db")
+    tmdb_cache = configure_tmdb_cache(
+        cache_dir=os.path.join(scenario_dir, "tmdbcache"))
+    configure_connection_pools(args.max_workers)
+    configure_notion_scheduler(requests_per_second=args.notion_rps,
+                               burst_size=args.notion_rps)
+    # The updaters record into the scenario's metrics too.
+    metrics = RunMetrics()
+
+    if not args.no_memory:
+      tracemalloc.start()
+    start = time.perf_counter()
+    with use_run_metrics(metrics):
+      items = scenario_fns[name](library)
+    wall_secs = time.perf_counter() - start
+    peak_mb = 0.0
+    if not args.no_memory:
+      peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+      tracemalloc.stop()
+
+    results.append({
+        "scenario": name,
+        "items": items,
+        "wall_secs": round(wall_secs, 3),
+        "peak_memory_mb": round(peak_mb, 1),
+        "notion_calls": notion_stub.get_calls(),
+        "tmdb_calls": tmdb_stub.get_calls(),
+        "notion_write_stats": get_notion_write_stats(metrics),
+        "tmdb_cache_stats": tmdb_cache.get_stats(),
+        "run_metrics": metrics.get_snapshot(),
+    })
+
+  notion_stub.stop()
+  tmdb_stub.stop()
+  return results
+
+
+def print_results(results: list):
+  for result in results:
+    print("%-26s %5d items  %8.2fs  %7.1f MB peak" %
+          (result["scenario"], result["items"], result["wall_secs"],
+           result["peak_memory_mb"]))
+    print("  Notion: " + str(result["notion_calls"]))
+    print("  TMDB:   " + str(result["tmdb_calls"]))
+    print("  Writes: " + str(result["notion_write_stats"]))
+    print("  Phases: " + str(result["run_metrics"]["phases_secs"]))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--shows", type=int, default=200)
+  parser.add_argument("--seasons", type=int, default=1500)
+  parser.add_argument("--watchlist", type=int, default=50)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--adds",
+                      type=int,
+                      default=20,
+                      help="Shows added by the add_from_tmdb scenario")
+  parser.add_argument("--searches",
+                      type=int,
+                      default=40,
+                      help="Queries run by the search scenario, cycling "
+                      "through a few distinct ones")
+  parser.add_argument("--notion-latency-ms", type=float, default=0)
+  parser.add_argument("--tmdb-latency-ms", type=float, default=0)
+  parser.add_argument("--notion-rate-limit",
+                      type=float,
+                      default=0,
+                      help="Requests/sec before the Notion stub answers 429, "
+                      "0 for no limit")
+  parser.add_argument("--tmdb-rate-limit",
+                      type=float,
+                      default=0,
+                      help="Requests/sec before the TMDB stub answers 429, "
+                      "0 for no limit")
+  parser.add_argument("--notion-rps",
+                      type=float,
+                      default=1000,
+                      help="Pace of the client-side Notion scheduler, use 3 "
+                      "for the production setting")
+  parser.add_argument("--max-workers", type=int, default=8)
+  parser.add_argument("--mirror",
+                      action="store_true",
+                      help="Read the databases through the local mirror")
+  parser.add_argument("--scenarios",
+                      nargs="+",
+                      choices=kScenarios,
+                      default=kScenarios)
+  parser.add_argument("--no-memory",
+                      action="store_true",
+                      help="Skip tracemalloc, which slows down the run")
+  parser.add_argument("--json", help="Also write the results to this file")
+  parser.add_argument("--verbose",
+                      action="store_true",
+                      help="Show the log output of the scenarios")
+  args = parser.parse_args()
+
+  results = run_benchmarks(args)
+  print_results(results)
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(results, f, indent=2)
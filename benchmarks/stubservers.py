@@ -0,0 +1,659 @@
+"""Local stand-ins for the Notion and TMDB APIs, used by the benchmarks.
+
+Both servers hold a synthetic library (see SyntheticLibrary), add a fixed
+latency to every request, can rate limit with 429 responses like the real
+APIs, and count the calls they serve per endpoint.
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+kShowsDbId = "stub-shows-db"
+kSeasonsDbId = "stub-seasons-db"
+kWatchlistDbId = "stub-watchlist-db"
+kFirstTmdbId = 1000
+kSearchResultsPerPage = 20
+
+# Property types of the stub databases, including a few that the updater
+# neither reads nor writes, like a real workspace would have.
+kShowSchema = {
+    "Title": "title",
+    "IMDB ID": "rich_text",
+    "Original Title": "rich_text",
+    "Tagline": "rich_text",
+    "Plot": "rich_text",
+    "Backdrop": "files",
+    "Release Date": "date",
+    "Status": "select",
+    "Type": "select",
+    "Content Rating (US)": "select",
+    "Cast": "multi_select",
+    "Creators": "multi_select",
+    "Production Companies": "multi_select",
+    "Networks": "multi_select",
+    "Watch Providers (US)": "multi_select",
+    "Countries": "multi_select",
+    "Languages": "multi_select",
+    "Genres": "multi_select",
+    "Keywords": "multi_select",
+    "Number of Seasons": "number",
+    "TMDB Rating": "number",
+    "Date Added": "date",
+    "Shows DB Reference": "relation",
+    "Notes": "rich_text",
+    "Watched By": "people",
+    "[IMPORT] Next Import Hint": "select",
+    "[IMPORT] Last Import Date": "date",
+    "[IMPORT] Errors": "rich_text",
+}
+kSeasonSchema = {
+    "Season Index": "title",
+    "Show": "relation",
+    "Air Date": "date",
+    "Finale Date": "date",
+    "Overview": "rich_text",
+    "Number of Episodes": "number",
+    "Total Runtime (mins)": "number",
+    "Per Episode Runtimes (mins)": "rich_text",
+    "Backdrop": "files",
+    "Watch Status": "select",
+    "Notes": "rich_text",
+    "[IMPORT] Last Import Date": "date",
+}
+
+############################### Helper Functions ###############################
+
+
+def _now_iso() -> str:
+  # Notion rounds last_edited_time to the minute.
+  return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:00.000Z')
+
+
+def _rich_text(text: str) -> list:
+  return [{
+      "type": "text",
+      "text": {
+          "content": text,
+          "link": None
+      },
+      "annotations": {
+          "bold": False,
+          "italic": False,
+          "strikethrough": False,
+          "underline": False,
+          "code": False,
+          "color": "default"
+      },
+      "plain_text": text,
+      "href": None
+  }]
+
+
+def _option(name: str) -> dict:
+  return {"id": name[:4], "name": name, "color": "default"}
+
+
+def _raw_value(prop_type: str, value):
+  """Convert a property value from a create/update request into the shape
+  Notion returns."""
+  if prop_type == "rich_text" or prop_type == "title":
+    return [_rich_text(item["text"]["content"])[0] for item in value]
+  elif prop_type == "select":
+    return None if value == None else _option(value["name"])
+  elif prop_type == "multi_select":
+    return [_option(item["name"]) for item in value]
+  elif prop_type == "date":
+    return None if value == None else {
+        "start": value["start"],
+        "end": None,
+        "time_zone": None
+    }
+  elif prop_type == "relation":
+    return [{"id": item["id"]} for item in value]
+  return value
+
+
+def _empty_value(prop_type: str):
+  if prop_type in ["select", "date", "number"]:
+    return None
+  if prop_type == "checkbox":
+    return False
+  return []
+
+
+def _raw_properties(schema: dict, values: dict) -> dict:
+  properties = {}
+  for name, prop_type in schema.items():
+    properties[name] = {
+        "id": name[:4],
+        "type": prop_type,
+        prop_type: values.get(name, _empty_value(prop_type))
+    }
+  return properties
+
+
+def _plain_text(value: list) -> str:
+  return "".join(item["plain_text"] for item in value)
+
+
+def _matches(page: dict, notion_filter: dict) -> bool:
+  """Evaluate the subset of Notion database filters used by the updater."""
+  if "or" in notion_filter:
+    return any(_matches(page, f) for f in notion_filter["or"])
+  if "and" in notion_filter:
+    return all(_matches(page, f) for f in notion_filter["and"])
+  if notion_filter.get("timestamp") == "last_edited_time":
+    return page["last_edited_time"] >= notion_filter["last_edited_time"][
+        "on_or_after"]
+
+  prop = page["properties"][notion_filter["property"]]
+  value = prop[prop["type"]]
+  condition = notion_filter[prop["type"]]
+  if "equals" in condition and prop["type"] == "rich_text":
+    return _plain_text(value) == condition["equals"]
+  if "equals" in condition and prop["type"] == "select":
+    return value != None and value["name"] == condition["equals"]
+  if "is_empty" in condition:
+    return not value
+  if "is_not_empty" in condition:
+    return bool(value)
+  if "on_or_before" in condition:
+    return value != None and value["start"][:10] <= condition["on_or_before"]
+  if "contains" in condition and prop["type"] == "relation":
+    return any(item["id"] == condition["contains"] for item in value)
+  raise ValueError("Unsupported filter: " + json.dumps(notion_filter))
+
+
+class _TokenBucket():
+
+  def __init__(self, requests_per_second: float):
+    self.__requests_per_second = requests_per_second
+    self.__tokens = requests_per_second
+    self.__last_refill = time.monotonic()
+    self.__lock = threading.Lock()
+
+  def try_acquire(self) -> bool:
+    if self.__requests_per_second <= 0:
+      return True
+    with self.__lock:
+      now = time.monotonic()
+      self.__tokens = min(
+          self.__requests_per_second, self.__tokens +
+          (now - self.__last_refill) * self.__requests_per_second)
+      self.__last_refill = now
+      if self.__tokens < 1:
+        return False
+      self.__tokens -= 1
+      return True
+
+
+class _StubHttpServer():
+  """JSON server on a free local port. Every request waits latency_secs, may
+  be rejected by the rate limit, and is then answered by
+  handle(method, path, params, body) -> (endpoint name, response). Calls are
+  counted per endpoint name."""
+
+  def __init__(self, handle, error_body, error_status: int,
+               latency_secs: float, requests_per_second: float):
+    self.__handle = handle
+    self.__error_body = error_body
+    self.__error_status = error_status
+    self.__latency_secs = latency_secs
+    self.__limiter = _TokenBucket(requests_per_second)
+    self.__lock = threading.Lock()
+    self.__calls = Counter()
+    self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__make_handler())
+    self.__server.daemon_threads = True
+
+  def __serve(self, method: str, url: str, body: dict):
+    """Return (status, response, headers) for a request."""
+    time.sleep(self.__latency_secs)
+    if not self.__limiter.try_acquire():
+      with self.__lock:
+        self.__calls["rate_limited"] += 1
+      return 429, self.__error_body(429, "rate_limited",
+                                    "Rate limited by the stub server"), {
+                                        "Retry-After": "1"
+                                    }
+    url = urlparse(url)
+    params = {k: v[0] for k, v in parse_qs(url.query).items()}
+    try:
+      with self.__lock:
+        endpoint, data = self.__handle(method, url.path, params, body)
+        self.__calls[endpoint] += 1
+    except Exception as e:
+      return self.__error_status, self.__error_body(self.__error_status,
+                                                    "validation_error",
+                                                    str(e)), {}
+    return 200, data, {}
+
+  def __make_handler(self):
+    serve = self.__serve
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def log_message(self, format, *args):
+        pass
+
+      def do_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        status, data, headers = serve(self.command, self.path, body)
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+          self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+      do_GET = do_PATCH = do_POST = do_request
+
+    return Handler
+
+  def get_address(self) -> str:
+    return "http://%s:%d" % self.__server.server_address
+
+  def get_calls(self) -> dict:
+    with self.__lock:
+      return dict(self.__calls)
+
+  def reset(self, update_state):
+    """Zero the call counts and run update_state() while no request is being
+    handled."""
+    with self.__lock:
+      self.__calls = Counter()
+      update_state()
+
+  def start(self):
+    threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+  def stop(self):
+    self.__server.shutdown()
+    self.__server.server_close()
+
+
+############################## Synthetic Library ###############################
+
+
+class SyntheticLibrary():
+  """A reproducible library of shows, seasons and watchlist rows.
+
+  Shows have 1 to 2 * seasons_per_show - 1 seasons on TMDB. The newest season
+  of every third show is missing from Notion, so updates create rows as well.
+  """
+
+  def __init__(self,
+               num_shows: int = 2000,
+               num_seasons: int = 15000,
+               num_watchlist: int = 200,
+               seed: int = 0):
+    self.random = random.Random(seed)
+    seasons_per_show = max(1, round(num_seasons / max(1, num_shows)))
+    self.num_seasons = {}
+    for i in range(num_shows + num_watchlist):
+      self.num_seasons[kFirstTmdbId + i] = self.random.randint(
+          1, 2 * seasons_per_show - 1)
+    self.show_tmdb_ids = list(self.num_seasons)[:num_shows]
+    self.watchlist_tmdb_ids = list(self.num_seasons)[num_shows:]
+
+  def new_id(self) -> str:
+    return str(uuid.UUID(int=self.random.getrandbits(128)))
+
+  def imdb_id(self, tmdb_id: int) -> str:
+    return "tt%07d" % tmdb_id
+
+  def tmdb_id(self, imdb_id: str) -> int:
+    return int(imdb_id[2:])
+
+
+################################# Notion Stub ##################################
+
+
+class NotionStubServer():
+  """Serves databases.query, pages.create and pages.update for the Shows,
+  Seasons and watchlist databases."""
+
+  def __init__(self,
+               library: SyntheticLibrary,
+               latency_secs: float = 0.0,
+               requests_per_second: float = 0):
+    self.__http = _StubHttpServer(self.__handle, self.__error_body, 400,
+                                  latency_secs, requests_per_second)
+    self.reset(library)
+
+  ############################## Helper Functions ##############################
+
+  def __populate(self):
+    library = self.__library
+    old_import = (date.today() - timedelta(days=30)).isoformat()
+    hints = ["Automate"] * 7 + ["Update", "Check Status", "Force Update"]
+    for tmdb_id in library.show_tmdb_ids:
+      show_id = self.__add_page(
+          kShowsDbId, kShowSchema, {
+              "Title": _rich_text("Show " + str(tmdb_id)),
+              "IMDB ID": _rich_text(library.imdb_id(tmdb_id)),
+              "Notes": _rich_text("Some personal notes. " * 10),
+              "[IMPORT] Next Import Hint":
+                  _option(library.random.choice(hints)),
+              "[IMPORT] Last Import Date": {
+                  "start": old_import,
+                  "end": None,
+                  "time_zone": None
+              }
+          })
+      num_seasons = library.num_seasons[tmdb_id]
+      if tmdb_id % 3 == 0:
+        num_seasons -= 1
+      for season_number in range(1, num_seasons + 1):
+        self.__add_page(
+            kSeasonsDbId, kSeasonSchema, {
+                "Season Index": _rich_text("Season " + str(season_number)),
+                "Show": [{
+                    "id": show_id
+                }],
+                "Watch Status": _option("Not Started"),
+            })
+    for i, tmdb_id in enumerate(library.watchlist_tmdb_ids):
+      values = {
+          "Title": _rich_text("Watchlist show " + str(tmdb_id)),
+          "IMDB ID": _rich_text(library.imdb_id(tmdb_id)),
+          "[IMPORT] Next Import Hint": _option("Automate"),
+      }
+      # A few watchlist shows have moved to the Shows DB already.
+      if i % 10 == 0:
+        values["Shows DB Reference"] = [{"id": library.new_id()}]
+      self.__add_page(kWatchlistDbId, kShowSchema, values)
+
+  def __add_page(self, database_id: str, schema: dict, values: dict) -> str:
+    page_id = self.__library.new_id()
+    self.__databases[database_id][page_id] = {
+        "object": "page",
+        "id": page_id,
+        "created_time": _now_iso(),
+        "last_edited_time": _now_iso(),
+        "archived": False,
+        "parent": {
+            "type": "database_id",
+            "database_id": database_id
+        },
+        "properties": _raw_properties(schema, values),
+    }
+    self.__page_db[page_id] = database_id
+    return page_id
+
+  def __schema(self, database_id: str) -> dict:
+    return kSeasonSchema if database_id == kSeasonsDbId else kShowSchema
+
+  def __request_values(self, schema: dict, properties: dict) -> dict:
+    values = {}
+    for name, prop in properties.items():
+      prop_type = schema[name]
+      values[name] = _raw_value(prop_type, prop[prop_type])
+    return values
+
+  def __query(self, database_id: str, body: dict):
+    rows = [
+        page for page in self.__databases[database_id].values()
+        if not page["archived"] and
+        (not "filter" in body or _matches(page, body["filter"]))
+    ]
+    start = int(body.get("start_cursor") or 0)
+    end = start + min(100, body.get("page_size", 100))
+    has_more = end < len(rows)
+    return {
+        "object": "list",
+        "results": rows[start:end],
+        "next_cursor": str(end) if has_more else None,
+        "has_more": has_more
+    }
+
+  def __create(self, body: dict):
+    database_id = body["parent"]["database_id"]
+    schema = self.__schema(database_id)
+    page_id = self.__add_page(
+        database_id, schema, self.__request_values(schema,
+                                                   body["properties"]))
+    return self.__databases[database_id][page_id]
+
+  def __update(self, page_id: str, body: dict):
+    database_id = self.__page_db[page_id]
+    page = self.__databases[database_id][page_id]
+    if body.get("archived"):
+      page["archived"] = True
+    values = self.__request_values(self.__schema(database_id),
+                                   body.get("properties", {}))
+    for name, value in values.items():
+      page["properties"][name][page["properties"][name]["type"]] = value
+    page["last_edited_time"] = _now_iso()
+    return page
+
+  def __error_body(self, status: int, code: str, message: str) -> dict:
+    return {
+        "object": "error",
+        "status": status,
+        "code": code,
+        "message": message
+    }
+
+  def __handle(self, method: str, path: str, params: dict, body: dict):
+    """Return (endpoint name, response) for a request."""
+    match = re.fullmatch(r"/v1/databases/([^/]+)/query", path)
+    if method == "POST" and match:
+      return "databases.query", self.__query(match.group(1), body)
+    if method == "POST" and path == "/v1/pages":
+      return "pages.create", self.__create(body)
+    match = re.fullmatch(r"/v1/pages/([^/]+)", path)
+    if method == "PATCH" and match:
+      return "pages.update", self.__update(match.group(1), body)
+    raise KeyError(method + " " + path)
+
+  ################################ API Functions ###############################
+
+  def reset(self, library: SyntheticLibrary):
+    """Replace the databases with the given library and zero the counts."""
+
+    def update_state():
+      self.__library = library
+      self.__databases = {kShowsDbId: {}, kSeasonsDbId: {}, kWatchlistDbId: {}}
+      self.__page_db = {}
+      self.__populate()
+
+    self.__http.reset(update_state)
+
+  def get_base_url(self) -> str:
+    return self.__http.get_address()
+
+  def get_calls(self) -> dict:
+    return self.__http.get_calls()
+
+  def start(self):
+    self.__http.start()
+
+  def stop(self):
+    self.__http.stop()
+
+
+################################## TMDB Stub ###################################
+
+
+class TmdbStubServer():
+  """Serves the find, tv (with append_to_response), search/tv and tv/changes
+  endpoints."""
+
+  def __init__(self,
+               library: SyntheticLibrary,
+               latency_secs: float = 0.0,
+               requests_per_second: float = 0,
+               search_pages: int = 10):
+    self.__search_pages = search_pages
+    self.__http = _StubHttpServer(self.__handle, self.__error_body, 404,
+                                  latency_secs, requests_per_second)
+    self.reset(library)
+
+  ############################## Helper Functions ##############################
+
+  def __season(self, tmdb_id: int, season_number: int) -> dict:
+    first_air_date = date(2000 + season_number, 1 + tmdb_id % 12, 1)
+    return {
+        "season_number": season_number,
+        "air_date": first_air_date.isoformat(),
+        "overview": "Season %d of show %d. " % (season_number, tmdb_id) * 5,
+        "episodes": [{
+            "episode_number": e,
+            "name": "Episode %d" % e,
+            "air_date": (first_air_date + timedelta(days=7 * e)).isoformat(),
+            "runtime": 30 + tmdb_id % 30,
+            "overview": "Episode overview. " * 5
+        } for e in range(1, 11)]
+    }
+
+  def __sub_resource(self, tmdb_id: int, name: str) -> dict:
+    if name == "external_ids":
+      return {"imdb_id": self.__library.imdb_id(tmdb_id)}
+    if name == "credits":
+      return {
+          "cast": [{
+              "name": "Actor %d" % (tmdb_id + i),
+              "character": "Character %d" % i
+          } for i in range(20)]
+      }
+    if name == "content_ratings":
+      return {"results": [{"iso_3166_1": "US", "rating": "TV-14"}]}
+    if name == "keywords":
+      return {"results": [{"name": "keyword %d" % i} for i in range(10)]}
+    if name == "watch/providers":
+      return {
+          "results": {
+              "US": {
+                  "flatrate": [{
+                      "provider_name": "Provider %d" % (tmdb_id % 5)
+                  }]
+              }
+          }
+      }
+    raise KeyError(name)
+
+  def __tv(self, tmdb_id: int, params: dict) -> dict:
+    num_seasons = self.__library.num_seasons[tmdb_id]
+    data = {
+        "id": tmdb_id,
+        "name": "Show %d" % tmdb_id,
+        "original_name": "Show %d" % tmdb_id,
+        "tagline": "A tagline",
+        "overview": "An overview of the show. " * 10,
+        "backdrop_path": "/backdrop%d.jpg" % tmdb_id,
+        "first_air_date": "2001-01-01",
+        "status": "Ended" if tmdb_id % 4 == 0 else "Returning Series",
+        "type": "Scripted",
+        "created_by": [{
+            "name": "Creator %d" % tmdb_id
+        }],
+        "production_companies": [{
+            "name": "Studio %d" % (tmdb_id % 20)
+        }],
+        "networks": [{
+            "name": "Network %d" % (tmdb_id % 10)
+        }],
+        "production_countries": [{
+            "name": "United States of America"
+        }],
+        "spoken_languages": [{
+            "english_name": "English"
+        }],
+        "genres": [{
+            "name": "Drama"
+        }],
+        "number_of_seasons": num_seasons,
+        "vote_average": 5 + tmdb_id % 50 / 10,
+    }
+    for item in params.get("append_to_response", "").split(","):
+      if item.startswith("season/"):
+        season_number = int(item.split("/")[1])
+        if season_number <= num_seasons:
+          data[item] = self.__season(tmdb_id, season_number)
+      elif item:
+        data[item] = self.__sub_resource(tmdb_id, item)
+    return data
+
+  def __search(self, params: dict) -> dict:
+    page = int(params.get("page", 1))
+    return {
+        "page": page,
+        "total_pages": self.__search_pages,
+        "results": [{
+            "id": kFirstTmdbId + (page * kSearchResultsPerPage + i) % 1000,
+            "name": "%s %d" % (params.get("query", ""), i),
+            "original_name": "Result %d" % i,
+            "overview": "A search result. " * 5,
+            "first_air_date": "20%02d-01-01" % (i % 25),
+            "vote_average": (page * 7 + i) % 100 / 10,
+            "vote_count": i * 10,
+            "popularity": float(i),
+            "poster_path": "/poster.jpg",
+            "origin_country": ["US"],
+            "original_language": "en"
+        } for i in range(kSearchResultsPerPage)]
+    }
+
+  def __error_body(self, status: int, code: str, message: str) -> dict:
+    # TMDB status codes: 25 is the rate limit, 34 is "not found".
+    return {
+        "status_code": 25 if status == 429 else 34,
+        "status_message": message
+    }
+
+  def __handle(self, method: str, path: str, params: dict, body: dict):
+    """Return (endpoint name, response) for a request."""
+    match = re.fullmatch(r"/3/find/(.+)", path)
+    if match:
+      return "find", {
+          "tv_results": [{
+              "id": self.__library.tmdb_id(match.group(1))
+          }]
+      }
+    if path == "/3/search/tv":
+      return "search/tv", self.__search(params)
+    if path == "/3/tv/changes":
+      # Every other show changed since the previous run.
+      return "tv/changes", {
+          "page": 1,
+          "total_pages": 1,
+          "results": [{
+              "id": tmdb_id
+          } for tmdb_id in self.__library.num_seasons if tmdb_id % 2 == 0]
+      }
+    match = re.fullmatch(r"/3/tv/(\d+)", path)
+    if match:
+      return "tv", self.__tv(int(match.group(1)), params)
+    raise KeyError(path)
+
+  ################################ API Functions ###############################
+
+  def reset(self, library: SyntheticLibrary):
+
+    def update_state():
+      self.__library = library
+
+    self.__http.reset(update_state)
+
+  def get_base_url(self) -> str:
+    return self.__http.get_address() + "/3"
+
+  def get_calls(self) -> dict:
+    return self.__http.get_calls()
+
+  def start(self):
+    self.__http.start()
+
+  def stop(self):
+    self.__http.stop()
@@ -1,81 +1,154 @@
+"""The web app for searching TMDB, adding shows and running updates.
+
+Despite its name (it started as a Flask app), this is a Quart ASGI app. Serve
+it with an ASGI server, e.g. "hypercorn flask_server:app"."""
+import json
+import logging
+import os
 import sys
-from pprint import pprint
-from datetime import datetime
-from tvshowsupdater import search_from_tmdb
+from notion_client import AsyncClient
+from tvshowsupdater import search_from_tmdb_async
+from tvshowsupdater import search_from_tmdb_async_iter
 from tvshowsupdater import AddFromTmdb
-from tvshowsupdater import UpdateFromTmdb
-from flask import Flask, render_template, request
-
-app = Flask(__name__)
+from tvshowsupdater import configure_connection_pools
+from tvshowsupdater import configure_logging
+# tvshowsupdater puts the helper modules on the path
+from notionhelpers import new_async_notion_client
+from tmdbhelpers import AsyncTmdbClient
+from updatejobs import UpdateJobQueue
+from updatejobs import kDefaultJobWorkers
+from quart import Quart, Response, jsonify, render_template, request
+
+logger = logging.getLogger(__name__)
+
+configure_logging()
+# An ASGI app, so requests that wait on TMDB or Notion don't hold a thread.
+app = Quart(__name__)
+update_max_workers = int(os.environ.get("UPDATE_MAX_WORKERS", "8"))
+update_jobs = UpdateJobQueue(update_max_workers=update_max_workers)
+# Every page and update job shares the same keep-alive connections.
+configure_connection_pools(update_max_workers * kDefaultJobWorkers)
+# Created when the server starts, so that requests reuse their keep-alive
+# connections.
+tmdb_client: AsyncTmdbClient = None
+notion_client: AsyncClient = None
+
+
+@app.before_serving
+async def open_clients():
+  global tmdb_client, notion_client
+  tmdb_client = AsyncTmdbClient()
+  notion_client = new_async_notion_client()
+
+
+@app.after_serving
+async def close_clients():
+  await tmdb_client.aclose()
+  await notion_client.aclose()
 
 
 @app.route("/")
-def index():
-  return render_template("index.html")
+async def index():
+  return await render_template("index.html")
 
 
 @app.route("/search")
-def search():
-  return render_template("search.html")
+async def search():
+  return await render_template("search.html")
 
 
 @app.route("/search_results", methods=["POST"])
-def search_results():
-  search_query = request.form["searchQuery"]
-  search_results = search_from_tmdb(search_query)
-  return render_template("search_results.html", result=search_results)
+async def search_results():
+  search_query = (await request.form)["searchQuery"]
+  search_results = await search_from_tmdb_async(search_query, tmdb_client)
+  return await render_template("search_results.html", result=search_results)
+
+
+@app.route("/search_results_live", methods=["POST"])
+async def search_results_live():
+  # Renders an empty results page that fills itself in from /search_stream.
+  return await render_template("search_results.html",
+                               result=[],
+                               search_query=(await request.form)["searchQuery"])
+
+
+@app.route("/search_stream")
+async def search_stream():
+  """Server-sent events with one "results" event per page of search results,
+  then a "done" event."""
+  search_query = request.args.get("searchQuery", "")
+
+  async def generate():
+    async for page_results in search_from_tmdb_async_iter(
+        search_query, tmdb_client):
+      yield ("event: results\ndata: " + json.dumps(page_results) +
+             "\n\n").encode()
+    yield b"event: done\ndata: {}\n\n"
+
+  return Response(generate(),
+                  mimetype="text/event-stream",
+                  headers={"Cache-Control": "no-cache"})
 
 
 @app.route("/add_to_watchlist", methods=["POST"])
-def add_to_watchlist():
-  tmdb_id = request.form["tmdbId"]
+async def add_to_watchlist():
+  tmdb_id = (await request.form)["tmdbId"]
 
-  print("TMDB ID: " + tmdb_id, flush=True)
-  add_entity = AddFromTmdb(tmdb_id=tmdb_id, is_watchlist=True)
+  logger.debug("TMDB ID: %s", tmdb_id)
+  add_entity = await AddFromTmdb.fetch_async(tmdb_id=tmdb_id,
+                                             is_watchlist=True,
+                                             tmdb_client=tmdb_client,
+                                             notion=notion_client)
 
   # If there is an error message, then just return that, else return the
   # full entity.
   if add_entity.get_error_message():
-    return render_template("search.html", result=add_entity.get_error_message())
+    return await render_template("search.html",
+                                 result=add_entity.get_error_message())
 
   resp = ""
   try:
-    add_entity.create_show_notion_row()
+    await add_entity.create_show_notion_row_async()
     resp = "Successfully added " + add_entity.get_imdb_id() + " to Watchlist."
   except Exception as e:
     resp = "Could not add " + add_entity.get_imdb_id(
     ) + " to watchlist: " + str(e)
-  return render_template("search.html", result=resp)
+  return await render_template("search.html", result=resp)
 
 
 @app.route("/update_result", methods=["GET", "POST"])
-def update_result():
+async def update_result():
   imdb_ids = ""
   if request.method == "GET":
     imdb_ids = request.args.get("imdbIds", "").replace(" ", "")
   elif request.method == "POST":
-    imdb_ids = request.form["imdbIds"].replace(" ", "")
-  action_log = []
+    imdb_ids = (await request.form)["imdbIds"].replace(" ", "")
   if not imdb_ids:
-    action_log.append("Cannot import with empty IMDB IDs.")
-  elif imdb_ids == "updateall":
-    pprint("+++++++++++ Starting update run for all IMDB IDs: " + " at " +
-           str(datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-    updater = UpdateFromTmdb()
-    action_log = updater.update_shows_and_seasons()
-  else:
-    split_imdb_ids = imdb_ids.split(",")
-    pprint("+++++++++++ Starting update run for IMDB IDs: " + imdb_ids +
-           " at " + str(datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-    updater = UpdateFromTmdb(imdb_ids=split_imdb_ids)
-    action_log = updater.update_shows_and_seasons()
-
-  if action_log:
-    action_log.insert(
-        0, "Received some errors while importing IMDB IDs: " + imdb_ids)
+    return await render_template("update_result.html",
+                                 result=["Cannot import with empty IMDB IDs."])
+
+  # Updates can take many minutes, so they run in the background and the page
+  # polls /update_status for progress.
+  if imdb_ids == "updateall":
+    logger.info("+++++++++++ Queueing update run for all IMDB IDs")
+    job_id = update_jobs.submit([])
   else:
-    action_log.insert(0, "Successfully imported IMDB IDs: " + imdb_ids)
-  return render_template("update_result.html", result=action_log)
+    logger.info("+++++++++++ Queueing update run for IMDB IDs: %s", imdb_ids)
+    job_id = update_jobs.submit(imdb_ids.split(","))
+  return await render_template(
+      "update_result.html",
+      result=["Started import for IMDB IDs: " + imdb_ids],
+      job_id=job_id,
+      imdb_ids=imdb_ids)
+
+
+@app.route("/update_status/<job_id>")
+async def update_status(job_id):
+  status = update_jobs.get_job_status(job_id,
+                                      request.args.get("since", 0, type=int))
+  if status == None:
+    return jsonify({"error": "Unknown job ID: " + job_id}), 404
+  return jsonify(status)
 
 
 if __name__ == "__main__":
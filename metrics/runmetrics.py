@@ -0,0 +1,208 @@
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, the last bucket is open ended.
+kLatencyBucketsMs = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class LatencyHistogram():
+  """Fixed-bucket latency histogram. Not thread-safe, RunMetrics guards it."""
+  __bucket_counts: list
+  __count: int
+  __total_ms: float
+  __max_ms: float
+
+  def __init__(self):
+    self.__bucket_counts = [0] * (len(kLatencyBucketsMs) + 1)
+    self.__count = 0
+    self.__total_ms = 0.0
+    self.__max_ms = 0.0
+
+  ############################## Helper Functions ##############################
+
+  def __percentile_ms(self, fraction: float) -> float:
+    """Upper bound of the bucket holding the given fraction of the samples,
+    or the max for the open-ended bucket."""
+    rank = fraction * self.__count
+    seen = 0
+    for i, count in enumerate(self.__bucket_counts):
+      seen += count
+      if seen >= rank and count:
+        if i == len(kLatencyBucketsMs):
+          return self.__max_ms
+        return min(kLatencyBucketsMs[i], self.__max_ms)
+    return 0.0
+
+  ################################ API Functions ###############################
+
+  def record(self, latency_ms: float):
+    self.__bucket_counts[bisect.bisect_left(kLatencyBucketsMs,
+                                            latency_ms)] += 1
+    self.__count += 1
+    self.__total_ms += latency_ms
+    self.__max_ms = max(self.__max_ms, latency_ms)
+
+  def get_summary(self) -> dict:
+    buckets = {}
+    for i, count in enumerate(self.__bucket_counts):
+      name = ("<=" + str(kLatencyBucketsMs[i]) if i < len(kLatencyBucketsMs)
+              else ">" + str(kLatencyBucketsMs[-1]))
+      buckets[name] = count
+    return {
+        "count": self.__count,
+        "mean_ms": round(self.__total_ms / self.__count, 1)
+                   if self.__count else 0.0,
+        "p50_ms": round(self.__percentile_ms(0.5), 1),
+        "p95_ms": round(self.__percentile_ms(0.95), 1),
+        "max_ms": round(self.__max_ms, 1),
+        "buckets": buckets
+    }
+
+
+class RunMetrics():
+  """Counters, latency histograms and phase timings for one run, shared by
+  the Notion and TMDB helpers and the updater. Names are dotted, e.g.
+  "notion.calls.pages.update" or "tmdb.entities_fetched"."""
+  __counters: Counter
+  __histograms: dict
+  __phases: dict
+  __started_at: str
+  __lock: threading.Lock
+
+  def __init__(self):
+    self.__lock = threading.Lock()
+    self.reset()
+
+  ################################ API Functions ###############################
+
+  def reset(self, prefix: str = ""):
+    """Clear the counters and histograms whose names start with prefix, or
+    everything (including phases) if no prefix is given."""
+    with self.__lock:
+      if prefix:
+        for name in [n for n in self.__counters if n.startswith(prefix)]:
+          del self.__counters[name]
+        for name in [n for n in self.__histograms if n.startswith(prefix)]:
+          del self.__histograms[name]
+        return
+      self.__counters = Counter()
+      self.__histograms = {}
+      self.__phases = {}
+      self.__started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+  def increment(self, name: str, amount: int = 1):
+    with self.__lock:
+      self.__counters[name] += amount
+
+  def get_counter(self, name: str) -> int:
+    with self.__lock:
+      return self.__counters[name]
+
+  def record_latency(self, name: str, latency_secs: float):
+    with self.__lock:
+      if not name in self.__histograms:
+        self.__histograms[name] = LatencyHistogram()
+      self.__histograms[name].record(latency_secs * 1000)
+
+  @contextmanager
+  def time_call(self, name: str):
+    """Count a call to name, its latency and whether it raised."""
+    start = time.perf_counter()
+    try:
+      yield
+    except Exception:
+      self.increment(name + ".errors")
+      raise
+    finally:
+      self.increment(name + ".calls")
+      self.record_latency(name, time.perf_counter() - start)
+
+  @contextmanager
+  def time_phase(self, name: str):
+    """Add the time spent in the block to the phase. Phases may overlap
+    (e.g. when several workers are in the same phase), so they can add up to
+    more than the wall time."""
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      with self.__lock:
+        self.__phases[name] = self.__phases.get(
+            name, 0.0) + time.perf_counter() - start
+
+  def get_snapshot(self) -> dict:
+    with self.__lock:
+      return {
+          "started_at": self.__started_at,
+          "counters": dict(sorted(self.__counters.items())),
+          "latencies": {
+              name: self.__histograms[name].get_summary()
+              for name in sorted(self.__histograms)
+          },
+          "phases_secs": {
+              name: round(secs, 3) for name, secs in self.__phases.items()
+          }
+      }
+
+  def format_summary(self) -> str:
+    snapshot = self.get_snapshot()
+    lines = ["Run metrics (started at " + snapshot["started_at"] + ")"]
+    for name, secs in snapshot["phases_secs"].items():
+      lines.append("  phase %-32s %9.2fs" % (name, secs))
+    for name, summary in snapshot["latencies"].items():
+      lines.append("  latency %-30s n=%-6d mean=%.0fms p95<=%.0fms max=%.0fms" %
+                   (name, summary["count"], summary["mean_ms"],
+                    summary["p95_ms"], summary["max_ms"]))
+    for name, count in snapshot["counters"].items():
+      lines.append("  count %-32s %9d" % (name, count))
+    return "\n".join(lines)
+
+  def export(self, path: str, extra: dict = {}):
+    """Write the snapshot, plus the extra fields, to path as JSON."""
+    snapshot = self.get_snapshot()
+    snapshot.update(extra)
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+      json.dump(snapshot, f, indent=2)
+
+
+_run_metrics = RunMetrics()
+_current_run_metrics = contextvars.ContextVar("run_metrics", default=None)
+
+
+def get_run_metrics() -> RunMetrics:
+  """Return the metrics that the helpers record into: those of the run bound
+  by use_run_metrics, or else the process-wide metrics."""
+  return _current_run_metrics.get() or _run_metrics
+
+
+@contextmanager
+def use_run_metrics(metrics: RunMetrics):
+  """Record into metrics in the block, so that runs that overlap (e.g. on
+  different threads) keep separate counts."""
+  token = _current_run_metrics.set(metrics)
+  try:
+    yield metrics
+  finally:
+    _current_run_metrics.reset(token)
+
+
+def bind_run_metrics(fn):
+  """Wrap fn to record into the current metrics when it is called on another
+  thread, e.g. by an executor. Threads don't inherit use_run_metrics."""
+  metrics = get_run_metrics()
+
+  def bound(*args, **kwargs):
+    with use_run_metrics(metrics):
+      return fn(*args, **kwargs)
+
+  return bound
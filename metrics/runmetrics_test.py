@@ -0,0 +1,70 @@
+import os
+import sys
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_directory)
+
+from concurrent.futures import ThreadPoolExecutor
+from runmetrics import RunMetrics
+from runmetrics import bind_run_metrics
+from runmetrics import get_run_metrics
+from runmetrics import use_run_metrics
+from unittest import TestCase
+import threading
+
+
+def _count(name: str, amount: int = 1):
+  # Stands in for a helper, which records into whatever run is current.
+  get_run_metrics().increment(name, amount)
+
+
+class RunMetricsScopes(TestCase):
+
+  def test_outside_a_run_records_into_process_metrics(self):
+    process_metrics = get_run_metrics()
+    before = process_metrics.get_counter("test.outside")
+    _count("test.outside")
+    self.assertEqual(process_metrics.get_counter("test.outside"), before + 1)
+
+  def test_run_records_into_its_own_metrics(self):
+    process_metrics = get_run_metrics()
+    before = process_metrics.get_counter("test.inside")
+    run_metrics = RunMetrics()
+    with use_run_metrics(run_metrics):
+      _count("test.inside")
+    self.assertEqual(run_metrics.get_counter("test.inside"), 1)
+    self.assertEqual(process_metrics.get_counter("test.inside"), before)
+    self.assertIs(get_run_metrics(), process_metrics)
+
+  def test_overlapping_runs_keep_separate_counts(self):
+    first, second = RunMetrics(), RunMetrics()
+    first_started = threading.Event()
+    second_done = threading.Event()
+
+    def first_run():
+      with use_run_metrics(first):
+        _count("test.shows")
+        first_started.set()
+        second_done.wait()
+        _count("test.shows")
+
+    def second_run():
+      first_started.wait()
+      with use_run_metrics(second):
+        _count("test.shows", 5)
+      second_done.set()
+
+    threads = [threading.Thread(target=fn) for fn in [first_run, second_run]]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(first.get_counter("test.shows"), 2)
+    self.assertEqual(second.get_counter("test.shows"), 5)
+
+  def test_bound_function_records_into_run_on_worker_threads(self):
+    run_metrics = RunMetrics()
+    with use_run_metrics(run_metrics):
+      with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(bind_run_metrics(_count), ["test.workers"] * 8))
+    self.assertEqual(run_metrics.get_counter("test.workers"), 8)
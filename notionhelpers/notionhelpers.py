@@ -1,8 +1,40 @@
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from notion_client import Client
+from notion_client import AsyncClient, Client
 from pprint import pprint
+from runmetrics import RunMetrics
+from runmetrics import get_run_metrics
+import asyncio
+import httpx
+import json
+import logging
+import os
+import random
 import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Notion allows an average of 3 requests per second per integration.
+kNotionRequestsPerSecond = 3
+kNotionBurstSize = 3
+kNotionMaxRetries = 5
+kNotionRetryBaseDelaySecs = 1.0
+kNotionRetryMaxDelaySecs = 30.0
+kNotionRetryableStatuses = {409, 429, 500, 502, 503, 504}
+# Statuses for which Notion did not apply the request, so even calls that are
+# not idempotent (pages.create) can be retried without writing twice.
+kNotionNotAppliedStatuses = {409, 429, 503}
+# Invalid requests (validation_error) are not applied either, but sending them
+# again fails the same way.
+kNotionValidationErrorStatus = 400
+kNotionMaxPageSize = 100
+# Maximum number of conditions in a single compound ("or"/"and") filter.
+kNotionMaxFilterConditions = 100
+# Keep-alive connections in the shared client's pool. Requests are paced by
+# the scheduler, so this only needs to cover the calls in flight at once.
+kNotionPoolMaxConnections = 16
 
 
 class ColumnType(Enum):
@@ -24,14 +56,320 @@ class NotionRowUpdateConfig(Enum):
   SKIP_FILLED = 2
 
 
-def notion_database_query_all(notion: Client, database_id: str) -> dict:
-  """Return all rows for the database."""
-  data = notion.databases.query(database_id)
+class NotionRequestScheduler():
+  """Paces Notion API calls with a token bucket shared by all threads.
+
+  Rate limited (429) and transient (5xx, timeout) responses are retried with
+  jittered exponential backoff. A Retry-After header pauses every caller of the
+  scheduler, since Notion applies the limit to the whole integration.
+
+  Calls that are not idempotent are only retried when Notion did not apply
+  them, since e.g. a timed out pages.create may still have created the page.
+  """
+  __requests_per_second: float
+  __burst_size: float
+  __max_retries: int
+  __tokens: float
+  __last_refill: float
+  __paused_until: float
+  __queue_depth: int
+  __lock: threading.Lock
+
+  def __init__(self,
+               requests_per_second: float = kNotionRequestsPerSecond,
+               burst_size: float = kNotionBurstSize,
+               max_retries: int = kNotionMaxRetries):
+    if requests_per_second <= 0:
+      raise ValueError("requests_per_second must be positive, got: " +
+                       str(requests_per_second))
+    self.__requests_per_second = requests_per_second
+    self.__burst_size = max(1, burst_size)
+    self.__max_retries = max_retries
+    self.__tokens = self.__burst_size
+    self.__last_refill = time.monotonic()
+    self.__paused_until = 0.0
+    self.__queue_depth = 0
+    self.__lock = threading.Lock()
+
+  ############################## Helper Functions ##############################
+
+  def __try_acquire_token(self) -> float:
+    """Take a token if one is available and return 0, otherwise return how
+    long to wait before trying again."""
+    with self.__lock:
+      now = time.monotonic()
+      self.__tokens = min(
+          self.__burst_size,
+          self.__tokens + (now - self.__last_refill) * self.__requests_per_second)
+      self.__last_refill = now
+      if self.__paused_until > now:
+        return self.__paused_until - now
+      if self.__tokens >= 1:
+        self.__tokens -= 1
+        return 0
+      return (1 - self.__tokens) / self.__requests_per_second
+
+  def __pause(self, delay_secs: float):
+    with self.__lock:
+      self.__paused_until = max(self.__paused_until,
+                                time.monotonic() + delay_secs)
+
+  def __retry_after_secs(self, e: Exception) -> float:
+    headers = getattr(e, "headers", None)
+    if not headers:
+      return 0.0
+    try:
+      return float(headers.get("Retry-After", 0))
+    except (TypeError, ValueError):
+      return 0.0
+
+  def __is_retryable(self, e: Exception, idempotent: bool) -> bool:
+    if not idempotent:
+      return getattr(e, "status", None) in kNotionNotAppliedStatuses
+    if getattr(e, "status", None) in kNotionRetryableStatuses:
+      return True
+    # Timeouts raised by notion_client and the underlying HTTP client.
+    return "timeout" in type(e).__name__.lower()
+
+  def __backoff_secs(self, attempt: int) -> float:
+    cap = min(kNotionRetryMaxDelaySecs, kNotionRetryBaseDelaySecs * 2**attempt)
+    return random.uniform(cap / 2, cap)
+
+  def __retry_delay_secs(self, e: Exception, attempt: int,
+                         idempotent: bool) -> float:
+    """Return how long to wait before retrying after e, or -1 if the call
+    should not be retried."""
+    if attempt >= self.__max_retries or not self.__is_retryable(
+        e, idempotent):
+      return -1
+    logger.warning("Retrying Notion request (attempt %d) after exception: %s",
+                   attempt + 1, e)
+    retry_after_secs = self.__retry_after_secs(e)
+    if retry_after_secs:
+      # Everybody waits out the Retry-After window, the jitter spreads the
+      # retries of the waiting callers.
+      self.__pause(retry_after_secs)
+      return retry_after_secs + random.uniform(0, 1)
+    return self.__backoff_secs(attempt)
+
+  def __metric_name(self, fn) -> str:
+    # e.g. DatabasesEndpoint.query -> notion.databases.query
+    owner, _, method = getattr(fn, "__qualname__", "unknown").rpartition(".")
+    return "notion." + (owner.replace("Endpoint", "").lower() + "." +
+                        method).lstrip(".")
+
+  def __update_queue_depth(self, delta: int):
+    with self.__lock:
+      self.__queue_depth += delta
+
+  ################################ API Functions ###############################
+
+  def get_queue_depth(self) -> int:
+    """Number of calls that are waiting for a token or running right now."""
+    return self.__queue_depth
+
+  def call(self, fn, *args, idempotent: bool = True, **kwargs):
+    """Call fn(*args, **kwargs) once a token is available, retrying on rate
+    limits and transient errors. Raises the last error when retries run out.
+    Pass idempotent=False for calls that must not be applied twice."""
+    metrics = get_run_metrics()
+    metric_name = self.__metric_name(fn)
+    self.__update_queue_depth(1)
+    try:
+      attempt = 0
+      while True:
+        wait_start = time.perf_counter()
+        wait_secs = self.__try_acquire_token()
+        while wait_secs:
+          time.sleep(wait_secs)
+          wait_secs = self.__try_acquire_token()
+        metrics.record_latency("notion.scheduler_wait",
+                               time.perf_counter() - wait_start)
+        try:
+          with metrics.time_call(metric_name):
+            return fn(*args, **kwargs)
+        except Exception as e:
+          delay_secs = self.__retry_delay_secs(e, attempt, idempotent)
+          if delay_secs < 0:
+            raise
+          metrics.increment("notion.retries")
+          time.sleep(delay_secs)
+          attempt += 1
+    finally:
+      self.__update_queue_depth(-1)
+
+  async def call_async(self, fn, *args, idempotent: bool = True, **kwargs):
+    """Same as call, for coroutine functions such as the methods of
+    notion_client.AsyncClient. Shares the token bucket with call."""
+    metrics = get_run_metrics()
+    metric_name = self.__metric_name(fn)
+    self.__update_queue_depth(1)
+    try:
+      attempt = 0
+      while True:
+        wait_start = time.perf_counter()
+        wait_secs = self.__try_acquire_token()
+        while wait_secs:
+          await asyncio.sleep(wait_secs)
+          wait_secs = self.__try_acquire_token()
+        metrics.record_latency("notion.scheduler_wait",
+                               time.perf_counter() - wait_start)
+        try:
+          with metrics.time_call(metric_name):
+            return await fn(*args, **kwargs)
+        except Exception as e:
+          delay_secs = self.__retry_delay_secs(e, attempt, idempotent)
+          if delay_secs < 0:
+            raise
+          metrics.increment("notion.retries")
+          await asyncio.sleep(delay_secs)
+          attempt += 1
+    finally:
+      self.__update_queue_depth(-1)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def configure_notion_scheduler(
+    requests_per_second: float = kNotionRequestsPerSecond,
+    burst_size: float = kNotionBurstSize,
+    max_retries: int = kNotionMaxRetries) -> NotionRequestScheduler:
+  """Replace the shared scheduler, e.g. to pace calls to a test server
+  differently. Only affects rows and queries that start after the call."""
+  global _default_scheduler
+  with _default_scheduler_lock:
+    _default_scheduler = NotionRequestScheduler(requests_per_second,
+                                                burst_size, max_retries)
+    return _default_scheduler
+
+
+def get_notion_scheduler() -> NotionRequestScheduler:
+  """Return the process-wide scheduler used for all Notion calls."""
+  global _default_scheduler
+  with _default_scheduler_lock:
+    if _default_scheduler == None:
+      _default_scheduler = NotionRequestScheduler()
+    return _default_scheduler
+
+
+_notion_client = None
+_notion_client_max_connections = kNotionPoolMaxConnections
+_notion_client_lock = threading.Lock()
+
+
+def configure_notion_client(max_connections: int = kNotionPoolMaxConnections):
+  """Size the connection pool of the shared Notion client, e.g. for more
+  workers. The client is (re)created on the next get_notion_client call."""
+  global _notion_client, _notion_client_max_connections
+  with _notion_client_lock:
+    _notion_client = None
+    _notion_client_max_connections = max_connections
+
+
+def _notion_client_options() -> dict:
+  options = {"auth": os.environ["NOTION_TOKEN"]}
+  if os.environ.get("NOTION_BASE_URL"):
+    options["base_url"] = os.environ["NOTION_BASE_URL"]
+  return options
+
+
+def get_notion_client() -> Client:
+  """Return the process-wide Notion client, so that all callers share one
+  pool of keep-alive connections. NOTION_BASE_URL overrides the API URL, e.g.
+  for a stub server."""
+  global _notion_client
+  with _notion_client_lock:
+    if _notion_client == None:
+      options = _notion_client_options()
+      limits = httpx.Limits(
+          max_connections=_notion_client_max_connections,
+          max_keepalive_connections=_notion_client_max_connections)
+      _notion_client = Client(options, client=httpx.Client(limits=limits))
+    return _notion_client
+
+
+def new_async_notion_client(
+    max_connections: int = kNotionPoolMaxConnections) -> AsyncClient:
+  """Return a new async Notion client, configured like get_notion_client, with
+  a pool of up to max_connections keep-alive connections. An async client can
+  only be used on the event loop it was created on, so a server creates one
+  when it starts and closes it (aclose) when it stops."""
+  limits = httpx.Limits(max_connections=max_connections,
+                        max_keepalive_connections=max_connections)
+  return AsyncClient(_notion_client_options(),
+                     client=httpx.AsyncClient(limits=limits))
+
+
+kNotionWriteStats = [
+    "fields_changed", "fields_unchanged", "rows_created", "rows_written",
+    "rows_skipped"
+]
+kNotionWriteStatsPrefix = "notion.writes."
+
+
+def _count_write_stat(name: str):
+  get_run_metrics().increment(kNotionWriteStatsPrefix + name)
+
+
+def get_notion_write_stats(metrics: RunMetrics = None) -> dict:
+  """Return counts of changed/unchanged fields and of rows created, written and
+  skipped (no changes, so no API call) recorded in metrics, by default those
+  of the current run (see get_run_metrics)."""
+  metrics = metrics or get_run_metrics()
+  return {
+      name: metrics.get_counter(kNotionWriteStatsPrefix + name)
+      for name in kNotionWriteStats
+  }
+
+
+def reset_notion_write_stats():
+  get_run_metrics().reset(prefix=kNotionWriteStatsPrefix)
+
+
+def was_not_applied(e: Exception) -> bool:
+  """Whether Notion certainly did not apply the request that raised e. Other
+  errors (e.g. timeouts or 500s) may come after the request was applied."""
+  status = getattr(e, "status", None)
+  return status == kNotionValidationErrorStatus or (
+      status in kNotionNotAppliedStatuses)
+
+
+def notion_database_query_all(notion: Client,
+                              database_id: str,
+                              filter: dict = None,
+                              sorts: list = None,
+                              page_size: int = kNotionMaxPageSize,
+                              edited_since: str = "") -> dict:
+  """Return all rows for the database that match the optional Notion filter,
+  in the order given by sorts. If edited_since (an ISO 8601 timestamp) is set,
+  only rows edited on or after that time are returned."""
+  if edited_since:
+    edited_filter = {
+        "timestamp": "last_edited_time",
+        "last_edited_time": {
+            "on_or_after": edited_since
+        }
+    }
+    filter = {"and": [filter, edited_filter]} if filter else edited_filter
+
+  query_args = {"page_size": page_size}
+  if filter:
+    query_args["filter"] = filter
+  if sorts:
+    query_args["sorts"] = sorts
+
+  scheduler = get_notion_scheduler()
+  data = scheduler.call(notion.databases.query, database_id, **query_args)
   database_object = data['object']
   has_more = data['has_more']
   next_cursor = data['next_cursor']
   while has_more == True:
-    data_while = notion.databases.query(database_id, start_cursor=next_cursor)
+    data_while = scheduler.call(notion.databases.query,
+                                database_id,
+                                start_cursor=next_cursor,
+                                **query_args)
     for row in data_while['results']:
       data['results'].append(row)
     has_more = data_while['has_more']
@@ -46,30 +384,132 @@ def notion_database_query_all(notion: Client, database_id: str) -> dict:
   return new_database
 
 
-@dataclass
 class NotionRow():
+  """One Notion page, with its property values normalized into compact typed
+  values: a tuple of strings for text, titles, multi-selects and relations, a
+  tuple of (name, url) pairs for files, and a plain value (or None) for the
+  rest. The request payloads are only built when the row is written."""
+  __slots__ = ("__row_id", "__update_errors", "__values", "__pending_update",
+               "__keep", "__sync_client", "__async_client", "__scheduler",
+               "__on_written", "__write_error")
   __row_id: str
   __update_errors: str
-  __properties: dict
-  __pending_update: dict
+  __write_error: Exception
+  __values: dict
+  __pending_update: set
+  __keep: set
   __sync_client: Client
+  __async_client: AsyncClient
+  __scheduler: NotionRequestScheduler
+  __on_written: object
+
+  def __init__(self, row_id: str, properties: dict, keep: set = None):
+    """Basic constructor. Assumes that an empty row_id means the row is non-existent.
 
-  def __init__(self, row_id: str, properties: dict):
-    """Basic constructor. Assumes that an empty row_id means the row is non-existent"""
+    properties are in the shape returned by the Notion API. If keep is set,
+    only the properties named in it are kept. Properties of types that the
+    row cannot read or write (e.g. people or rollups) are dropped."""
     self.__row_id = row_id
     self.__update_errors = ""
-    self.__properties = properties
+    self.__write_error = None
+    self.__keep = keep
+    self.__values = self.__normalize_properties(properties)
+    self.__scheduler = get_notion_scheduler()
+    self.__on_written = None
 
     if not row_id:
-      self.__pending_update = properties
+      self.__pending_update = set(self.__values)
     else:
-      self.__pending_update = {}
+      self.__pending_update = set()
 
   ############################## Setup Functions ###############################
 
   def set_client(self, client: Client):
     self.__sync_client = client
 
+  def set_async_client(self, client: AsyncClient):
+    """Set the client used by the *_async DB call functions."""
+    self.__async_client = client
+
+  def set_scheduler(self, scheduler: NotionRequestScheduler):
+    """Override the shared scheduler that paces this row's Notion calls."""
+    self.__scheduler = scheduler
+
+  def set_on_written(self, on_written):
+    """Call on_written(page) with the page returned by Notion after each
+    successful write of this row (create, update or archive)."""
+    self.__on_written = on_written
+
+  ############################ Conversion Functions ############################
+
+  def __normalize_properties(self, properties: dict) -> dict:
+    values = {}
+    for name, prop in properties.items():
+      if self.__keep != None and not name in self.__keep:
+        continue
+      col_type = ColumnType.__members__.get(prop.get("type", "").upper())
+      if col_type == None or not prop["type"] in prop:
+        continue
+      values[name] = (col_type, self.__normalize_value(col_type, prop))
+    return values
+
+  def __normalize_value(self, col_type: ColumnType, prop: dict):
+    value = prop[prop["type"]]
+    if col_type == ColumnType.RICH_TEXT or col_type == ColumnType.TITLE:
+      return tuple(rt["plain_text"] for rt in value)
+    elif col_type == ColumnType.DATE:
+      return None if value == None else value["start"]
+    elif col_type == ColumnType.SELECT:
+      return None if value == None else value["name"]
+    elif col_type == ColumnType.MULTI_SELECT:
+      return tuple(ms["name"] for ms in value)
+    elif col_type == ColumnType.FILES:
+      return tuple((f.get("name"), f.get(f.get("type"), {}).get("url"))
+                   for f in value)
+    elif col_type == ColumnType.RELATION:
+      return tuple(rl["id"] for rl in value)
+    # NUMBER, CHECKBOX and FORMULA values are kept as they are.
+    return value
+
+  def __property_payload(self, col_type: ColumnType, value) -> dict:
+    if col_type == ColumnType.RICH_TEXT or col_type == ColumnType.TITLE:
+      return {
+          col_type.name.lower(): [{
+              "text": {
+                  "content": item
+              }
+          } for item in value]
+      }
+    elif col_type == ColumnType.DATE:
+      return {"date": None if value == None else {"start": value}}
+    elif col_type == ColumnType.SELECT:
+      return {"select": None if value == None else {"name": value}}
+    elif col_type == ColumnType.MULTI_SELECT:
+      return {"multi_select": [{"name": item} for item in value]}
+    elif col_type == ColumnType.FILES:
+      return {
+          "files": [{
+              "type": "external",
+              "name": name,
+              "external": {
+                  "url": url
+              }
+          } for (name, url) in value]
+      }
+    elif col_type == ColumnType.RELATION:
+      return {"relation": [{"id": item} for item in value]}
+    return {col_type.name.lower(): value}
+
+  def __payload(self) -> dict:
+    """Build the properties of a create/update request from the pending
+    fields. Formulas are computed by Notion, so they are never sent."""
+    payload = {}
+    for name in self.__pending_update:
+      col_type, value = self.__values[name]
+      if col_type != ColumnType.FORMULA:
+        payload[name] = self.__property_payload(col_type, value)
+    return payload
+
   ############################## Getter Functions ##############################
 
   def get_id(self) -> str:
@@ -78,82 +518,62 @@ class NotionRow():
 
   def is_commit_required(self) -> bool:
     """Check if the value of the row has been updated since the last commit."""
-    return (self.__pending_update == {})
+    return (len(self.__pending_update) == 0)
 
   def print(self):
     """Print the current version of the row (includes pending updates)."""
-    pprint(self.__properties)
+    pprint({name: value for name, (_, value) in self.__values.items()})
 
   def get_update_errors(self) -> str:
     """Returns update errors."""
     return self.__update_errors
 
+  def get_write_error(self) -> Exception:
+    """Return the exception of the last write, or None if it succeeded."""
+    return self.__write_error
+
+  def get_pending_changes(self) -> dict:
+    """Return the fields pending for the next commit as {name: [type name,
+    value]}, which can be saved as JSON and passed to from_pending_changes."""
+    changes = {}
+    for name in sorted(self.__pending_update):
+      col_type, value = self.__values[name]
+      if col_type != ColumnType.FORMULA:
+        changes[name] = [col_type.name, value]
+    return changes
+
   def get_value(self, col_type: ColumnType, name: str):
     """Get value of field given type and name. Field must exist."""
-    if col_type == ColumnType.RICH_TEXT:
-      return self.__get_text_value_internal(name)
-    elif col_type == ColumnType.TITLE:
-      return self.__get_title_value_internal(name)
-    elif col_type == ColumnType.DATE:
-      return self.__get_date_value_internal(name)
-    elif col_type == ColumnType.NUMBER:
-      return self.__get_number_value_internal(name)
+    value = self.__values[name][1]
+    if col_type == ColumnType.RICH_TEXT or col_type == ColumnType.TITLE:
+      return list(value)
+    elif col_type == ColumnType.DATE or col_type == ColumnType.NUMBER:
+      return value
     elif col_type == ColumnType.SELECT:
-      return self.__get_select_value_internal(name)
+      return value
     elif col_type == ColumnType.MULTI_SELECT:
-      return self.__get_multi_select_value_internal(name)
+      return list(value)
     elif col_type == ColumnType.FILES:
-      return self.__get_files_value_internal(name)
+      return [url for (_, url) in value]
     elif col_type == ColumnType.RELATION:
-      return self.__get_relation_value_internal(name)
+      return list(value)
     else:
       raise NotImplementedError("No get_value implementation yet for type: " +
-                                type.name)
-
-  def __get_text_value_internal(self, name: str):
-    value_list = []
-    for rt in self.__properties[name]["rich_text"]:
-      value_list.append(rt["plain_text"])
-    return value_list
-
-  def __get_title_value_internal(self, name: str):
-    value_list = []
-    for rt in self.__properties[name]["title"]:
-      value_list.append(rt["plain_text"])
-    return value_list
-
-  def __get_date_value_internal(self, name: str):
-    if self.__properties[name]["date"] == None:
-      return None
-    return self.__properties[name]["date"]["start"]
-
-  def __get_number_value_internal(self, name: str):
-    if self.__properties[name]["number"] == None:
-      return None
-    return self.__properties[name]["number"]
-
-  def __get_select_value_internal(self, name: str):
-    if self.__properties[name]["select"] == None:
-      return None
-    return self.__properties[name]["select"]["name"]
-
-  def __get_multi_select_value_internal(self, name: str):
-    value_list = []
-    for ms in self.__properties[name]["multi_select"]:
-      value_list.append(ms["name"])
-    return value_list
-
-  def __get_files_value_internal(self, name: str):
-    value_list = []
-    for f in self.__properties[name]["files"]:
-      value_list.append(f["external"]["url"])
-    return value_list
-
-  def __get_relation_value_internal(self, name: str):
-    value_list = []
-    for rl in self.__properties[name]["relation"]:
-      value_list.append(rl["id"])
-    return value_list
+                                col_type.name)
+
+  @classmethod
+  def from_pending_changes(cls, row_id: str, changes: dict) -> "NotionRow":
+    """Build a row whose only fields are the changes returned by
+    get_pending_changes, all pending, so a commit sends just those."""
+    row = cls(row_id, {})
+    for name, (type_name, value) in changes.items():
+      # JSON turns the tuples into lists.
+      if isinstance(value, list):
+        value = tuple(
+            tuple(item) if isinstance(item, list) else item for item in value)
+      row.__values[name] = (ColumnType[type_name], value)
+      row.__pending_update.add(name)
+    return row
 
   ############################## Creator Functions #############################
 
@@ -165,63 +585,28 @@ class NotionRow():
                    relation_db: str = ""):
     """Create new field given type, name, value, and optional fields that specify configurations. Field should not exist."""
     if col_type == ColumnType.RICH_TEXT:
-      self.__create_text_field_internal(name, value)
+      value = tuple(value)
     elif col_type == ColumnType.TITLE:
-      self.__create_title_field_internal(name, value)
-    elif col_type == ColumnType.RELATION:
-      self.__create_relation_field_internal(name, value)
-    elif col_type == ColumnType.SELECT:
-      self.__create_select_field_internal(name, value)
-    elif col_type == ColumnType.DATE:
-      self.__create_date_field_internal(name, value)
-    else:
-      raise NotImplementedError("No create_field implementation yet for type: " +
-                                type.name)
-
-  def __create_text_field_internal(self, name: str, value: list):
-    self.__properties[name] = {"type": "rich_text"}
-    list_tagged = []
-    for item in value:
-      list_tagged.append({"plain_text": item, "text": {"content": item}})
-    self.__properties[name]["rich_text"] = list_tagged
-    self.__pending_update[name] = self.__properties[name]
-
-  def __create_title_field_internal(self, name: str, value: str):
-    self.__properties[name] = {"id": "title", "type": "title"}
-    self.__properties[name]["title"] = [{
-        "plain_text": value,
-        "text": {
-            "content": value
-        }
-    }]
-    self.__pending_update[name] = self.__properties[name]
-
-  def __create_relation_field_internal(self, name: str, value: list):
-    self.__properties[name] = {"type": "relation", "has_more": False}
-    list_tagged = []
-    for item in value:
-      list_tagged.append({"id": item})
-    self.__properties[name]["relation"] = list_tagged
-    self.__pending_update[name] = self.__properties[name]
-
-  def __create_select_field_internal(self, name: str, value: str):
-    self.__properties[name] = {"type": "select"}
-    self.__properties[name]["select"] = {"name": value}
-    self.__pending_update[name] = self.__properties[name]
-
-  def __create_date_field_internal(self, name: str, value: str):
-    self.__properties[name] = {"type": "date"}
-    self.__properties[name]["date"] = {"start": value}
-    self.__pending_update[name] = self.__properties[name]
+      value = (value,)
+    elif col_type == ColumnType.MULTI_SELECT or col_type == ColumnType.RELATION:
+      value = tuple(value)
+    elif col_type == ColumnType.FILES:
+      value = ((self.__file_name(title), value),)
+    elif col_type == ColumnType.FORMULA:
+      raise ValueError("Cannot create FORMULA field " + name +
+                       ", formulas are computed by Notion")
+    self.__values[name] = (col_type, value)
+    self.__pending_update.add(name)
+
+  def __file_name(self, title: str) -> str:
+    if not title:
+      title = "Unnamed file"
+    return "Poster for " + title
 
   ############################## Setter Functions ##############################
-  # The setter functions only update the data values. It is assumed that the
-  # row provided in the constructor is a properly formed Notion row i.e. it has
-  # the field types and ids already set. This means that we don't need to worry
-  # about the full dictionaries for each property being empty - just the values
-  # may be empty.
+  # The setter functions only update the data values, and only mark a field
+  # for the next commit if its value actually changes.
 
-  # TODO: if the field name doesn't exist, the update function should create it.
   def update_value(
       self,
       col_type: ColumnType,
@@ -230,253 +615,355 @@ class NotionRow():
       title: str = "",
       update_config: NotionRowUpdateConfig = NotionRowUpdateConfig.REPLACE,
       relation_db: str = ""):
-    """Update value of field given type, name, value, and optional fields that specify configurations. Field must exist."""
+    """Update value of field given type, name, value, and optional fields that specify configurations. Fields that don't exist yet (e.g. on a row that is not created yet) are created."""
+    if not name in self.__values:
+      # create_field takes text as a list of strings, update_value as a string
+      self.create_field(col_type, name,
+                        [value] if col_type == ColumnType.RICH_TEXT else value,
+                        title=title,
+                        relation_db=relation_db)
+      _count_write_stat("fields_changed")
+      return
+    current_value = self.__values[name][1]
     if col_type == ColumnType.RICH_TEXT:
-      self.__update_text_value_internal(name, value, update_config)
-    elif col_type == ColumnType.DATE:
-      self.__update_date_value_internal(name, value)
-    elif col_type == ColumnType.NUMBER:
-      self.__update_number_value_internal(name, value)
-    elif col_type == ColumnType.SELECT:
-      self.__update_select_value_internal(name, value)
+      # TODO: Implement ability to append text instead of replacing it.
+      if "".join(current_value) == (value or ""):
+        self.__mark_unchanged(name)
+        return
+      value = (value,)
     elif col_type == ColumnType.MULTI_SELECT:
-      self.__update_multi_select_value_internal(name, value, update_config)
+      # TODO: Implement ability to perform a union of the current and new lists
+      # and also figure out how to pass it in every function call
+      value = tuple(value)
     elif col_type == ColumnType.FILES:
-      self.__update_file_value_internal(name, value, title, update_config)
+      # TODO: Implement ability to append file instead of replacing it.
+      value = ((self.__file_name(title), value),)
     elif col_type == ColumnType.RELATION:
-      self.__update_relation_value_internal(name, value, update_config,
-                                            relation_db)
-    else:
+      if not relation_db:
+        raise ValueError("No relation_db passed for updating RELATION field: ",
+                         name)
+      if update_config == NotionRowUpdateConfig.COMBINE:
+        # Only add the IDs that are not related yet.
+        value = current_value + tuple(
+            item for item in value if not item in current_value)
+      value = tuple(value)
+    elif not col_type in [ColumnType.DATE, ColumnType.NUMBER, ColumnType.SELECT]:
       raise NotImplementedError("No update_value implementation yet for type: " +
-                                type.name)
-
-  def __update_text_value_internal(self, name: str, value: str,
-                                   update_config: NotionRowUpdateConfig):
-    # TODO: Implement ability to append text instead of replacing it.
-    # TODO: Don't update when there are no changes!
-    self.__properties[name]["rich_text"] = [{
-        "plain_text": value,
-        "text": {
-            "content": value
-        }
-    }]
-    self.__pending_update[name] = self.__properties[name]
-
-  def __update_date_value_internal(self, name: str, value: str):
-    if not "date" in self.__properties[name]:
-      self.__properties[name]["date"] = {"start": value}
-      self.__pending_update[name] = self.__properties[name]
-    if self.__properties[name]["date"] == None:
-      self.__properties[name]["date"] = {"start": value}
-      self.__pending_update[name] = self.__properties[name]
-    elif self.__properties[name]["date"]["start"] != value:
-      self.__properties[name]["date"]["start"] = value
-      self.__pending_update[name] = self.__properties[name]
-    else:
-      pprint("Update not required for field: " + name)
-
-  def __update_number_value_internal(self, name: str, value: int):
-    if self.__properties[name]["number"] == None:
-      self.__properties[name]["number"] = value
-      self.__pending_update[name] = self.__properties[name]
-    elif self.__properties[name]["number"] != value:
-      self.__properties[name]["number"] = value
-      self.__pending_update[name] = self.__properties[name]
-    else:
-      pprint("Update not required for field: " + name)
-
-  def __update_select_value_internal(self, name: str, value: str):
-    if self.__properties[name]["select"] == None:
-      self.__properties[name]["select"] = {"name": value}
-      self.__pending_update[name] = self.__properties[name]
-    elif self.__properties[name]["select"]["name"] != value:
-      # Only keep "name" in case the field was not empty.
-      self.__properties[name]["select"] = {"name": value}
-      self.__pending_update[name] = self.__properties[name]
-    else:
-      pprint("Update not required for field: " + name)
-
-  def __update_multi_select_value_internal(
-      self, name: str, value: list, update_config: NotionRowUpdateConfig):
-    list_tagged = []
-    for item in value:
-      list_tagged.append({"name": item})
-
-    # TODO: Implement ability to perform a union of the current and new lists
-    # and also figure out how to pass it in every function call
-    # TODO: Don't update when there are no changes!
-    self.__properties[name]["multi_select"] = list_tagged
-    self.__pending_update[name] = self.__properties[name]
-
-  def __update_file_value_internal(self, name: str, value: str, title: str,
-                                   update_config: NotionRowUpdateConfig):
-    # TODO: Implement ability to append file instead of replacing it.
-    # TODO: Don't update when there are no changes!
-    if not title:
-      title = "Unnamed file"
-    self.__properties[name]["files"] = [{
-        "external": {
-            "url": value
-        },
-        "type": "external",
-        "name": "Poster for " + title
-    }]
-    self.__pending_update[name] = self.__properties[name]
-
-  def __update_relation_value_internal(self, name: str, value: list,
-                                       update_config: NotionRowUpdateConfig,
-                                       relation_db: str):
-    if not relation_db:
-      raise ValueError("No relation_db passed for updating RELATION field: ",
-                       name)
-    # TODO: What happens if a duplicate is added here?
-    list_tagged = []
-    for item in value:
-      list_tagged.append({"id": item})
-
-    if update_config == NotionRowUpdateConfig.REPLACE:
-      self.__properties[name]["relation"] = list_tagged
-    elif update_config == NotionRowUpdateConfig.COMBINE:
-      self.__properties[name]["relation"].extend(list_tagged)
-
-    self.__pending_update[name] = self.__properties[name]
+                                col_type.name)
+
+    if current_value == value:
+      self.__mark_unchanged(name)
+      return
+    self.__values[name] = (col_type, value)
+    self.__mark_changed(name)
+
+  def __mark_changed(self, name: str):
+    self.__pending_update.add(name)
+    _count_write_stat("fields_changed")
+
+  def __mark_unchanged(self, name: str):
+    logger.debug("Update not required for field: %s", name)
+    _count_write_stat("fields_unchanged")
 
   ############################# Clearing Functions #############################
 
   def clear_row(self):
     """Clear every field value."""
-    for name in self.__properties:
-      col_type = ColumnType[self.__properties[name]["type"].upper()]
+    for name, (col_type, _) in list(self.__values.items()):
       self.clear_value(col_type, name)
 
   def clear_value(self, col_type: ColumnType, name: str):
     """Clear field value by type and name. Field must exist."""
-    if col_type == ColumnType.RICH_TEXT:
-      self.__clear_text_value_internal(name)
-    elif col_type == ColumnType.DATE:
-      self.__clear_date_value_internal(name)
-    elif col_type == ColumnType.NUMBER:
-      self.__clear_number_value_internal(name)
-    elif col_type == ColumnType.SELECT:
-      self.__clear_select_value_internal(name)
-    elif col_type == ColumnType.MULTI_SELECT:
-      self.__clear_multi_select_value_internal(name)
-    elif col_type == ColumnType.FILES:
-      self.__clear_file_value_internal(name)
-    elif col_type == ColumnType.FORMULA:
-      self.__clear_formula_value_internal(name)
-    elif col_type == ColumnType.RELATION:
-      self.__clear_relation_value_internal(name)
-    elif col_type == ColumnType.TITLE:
-      self.__clear_title_value_internal(name)
+    current_value = self.__values[name][1]
+    if col_type in [
+        ColumnType.RICH_TEXT, ColumnType.MULTI_SELECT, ColumnType.FILES,
+        ColumnType.RELATION, ColumnType.TITLE
+    ]:
+      value = ()
+    elif col_type in [
+        ColumnType.DATE, ColumnType.NUMBER, ColumnType.SELECT,
+        ColumnType.FORMULA
+    ]:
+      value = None
     else:
       raise NotImplementedError("No clear_value implementation yet for type: " +
-                                type.name)
-
-  def __clear_text_value_internal(self, name: str):
-    self.__properties[name]["rich_text"] = []
-    self.__pending_update[name] = self.__properties[name]
-
-  def __clear_date_value_internal(self, name: str):
-    self.__properties[name]["date"] = None
-    self.__pending_update[name] = self.__properties[name]
-
-  def __clear_number_value_internal(self, name: str):
-    self.__properties[name]["number"] = None
-    self.__pending_update[name] = self.__properties[name]
-
-  def __clear_select_value_internal(self, name: str):
-    self.__properties[name]["select"] = None
-    self.__pending_update[name] = self.__properties[name]
-
-  def __clear_multi_select_value_internal(self, name: str):
-    self.__properties[name]["multi_select"] = []
-    self.__pending_update[name] = self.__properties[name]
+                                col_type.name)
 
-  def __clear_file_value_internal(self, name: str):
-    self.__properties[name]["files"] = []
-    self.__pending_update[name] = self.__properties[name]
-
-  def __clear_formula_value_internal(self, name: str):
-    self.__properties[name].pop("formula", None)
-    self.__pending_update[name] = self.__properties[name]
-
-  def __clear_relation_value_internal(self, name: str):
-    self.__properties[name]["relation"] = []
-    self.__pending_update[name] = self.__properties[name]
-
-  def __clear_title_value_internal(self, name: str):
-    self.__properties[name]["title"] = []
-    self.__pending_update[name] = self.__properties[name]
+    if current_value == value:
+      self.__mark_unchanged(name)
+      return
+    self.__values[name] = (col_type, value)
+    self.__mark_changed(name)
 
   ############################## DB Call Functions #############################
 
-  def create_new_db_row(self, database_id: str, icon: dict = {}) -> bool:
-    """Create a new page with the current properties in the provided database_id."""
+  def __create_request(self, database_id: str, icon: dict) -> dict:
     if not database_id:
       raise ValueError("Cannot create row without a database_id")
 
     if self.__row_id:
       raise ValueError("Row already exists for ID: " + self.__row_id)
 
-    if self.__pending_update == {}:
+    if not self.__pending_update:
       raise ValueError("Cannot write empty properties to database ID: " +
                        database_id)
 
+    return {
+        "parent": {
+            "database_id": database_id
+        },
+        "properties": self.__payload(),
+        "icon": icon
+    }
+
+  def __notify_written(self, page: dict):
+    if self.__on_written != None:
+      self.__on_written(page)
+
+  def __on_created(self, resp: dict):
+    self.__row_id = resp["id"]
+    self.__values = self.__normalize_properties(resp["properties"])
+    self.__pending_update = set()
+    self.__write_error = None
+    _count_write_stat("rows_created")
+    logger.debug("Created Notion row: %s", self.__row_id)
+    self.__notify_written(resp)
+
+  def __on_create_error(self, database_id: str, e: Exception):
+    logger.error("Got exception while adding row for database_id %s: %s",
+                 database_id, e)
+    self.__update_errors = "Exception while creating row: " + str(e)
+    self.__write_error = e
+
+  def __update_request(self) -> dict:
+    """Return the pages.update arguments, or an empty dict if there is
+    nothing to update."""
+    if not self.__row_id:
+      raise ValueError("Row ID not found for row")
+
+    if not self.__pending_update:
+      logger.debug("No pending updates for row ID: %s", self.__row_id)
+      _count_write_stat("rows_skipped")
+      return {}
+
+    return {"page_id": self.__row_id, "properties": self.__payload()}
+
+  def __on_updated(self, resp: dict):
+    self.__pending_update = set()
+    self.__update_errors = ""
+    self.__write_error = None
+    _count_write_stat("rows_written")
+    logger.debug("Updated Notion row: %s", self.__row_id)
+    self.__notify_written(resp)
+
+  def __on_update_error(self, e: Exception):
+    logger.error("Got exception while updating row for row ID %s: %s",
+                 self.__row_id, e)
+    self.__update_errors = "Exception while updating row: " + str(e)
+    self.__write_error = e
+
+  def create_new_db_row(self, database_id: str, icon: dict = {}) -> bool:
+    """Create a new page with the current properties in the provided database_id. Returns whether the page was created."""
+    request = self.__create_request(database_id, icon)
     try:
-      resp = self.__sync_client.pages.create(
-          **{
-              "parent": {
-                  "database_id": database_id
-              },
-              "properties": self.__pending_update,
-              "icon": icon
-          })
-      self.__row_id = resp["id"]
-      self.__properties = resp["properties"]
-      self.__pending_update = {}
-      pprint(">>>> >>>> >>>> Created Notion row successfully")
+      self.__on_created(
+          self.__scheduler.call(self.__sync_client.pages.create,
+                                idempotent=False,
+                                **request))
     except Exception as e:
-      pprint("Got exception while adding row for database_id: " + database_id)
-      pprint("Exception: " + str(e))
+      self.__on_create_error(database_id, e)
+      return False
+    return True
+
+  async def create_new_db_row_async(self,
+                                    database_id: str,
+                                    icon: dict = {}) -> bool:
+    """Same as create_new_db_row, using the client set by set_async_client."""
+    request = self.__create_request(database_id, icon)
+    try:
+      self.__on_created(await self.__scheduler.call_async(
+          self.__async_client.pages.create, idempotent=False, **request))
+    except Exception as e:
+      self.__on_create_error(database_id, e)
+      return False
+    return True
 
   def update_db_row(self) -> str:
     """Update the page with the current properties."""
-    if not self.__row_id:
-      raise ValueError("Row ID not found for row")
-
-    if self.__pending_update == {}:
-      pprint("No pending updates for row ID: " + self.__row_id)
+    request = self.__update_request()
+    if not request:
       return
+    try:
+      self.__on_updated(
+          self.__scheduler.call(self.__sync_client.pages.update, **request))
+    except Exception as e:
+      self.__on_update_error(e)
+    return self.__update_errors
 
+  async def update_db_row_async(self) -> str:
+    """Same as update_db_row, using the client set by set_async_client."""
+    request = self.__update_request()
+    if not request:
+      return
     try:
-      resp = self.__sync_client.pages.update(**{
-          "page_id": self.__row_id,
-          "properties": self.__pending_update
-      })
-      self.__pending_update = {}
-      self.__update_errors = ""
-      pprint(">>>> >>>> >>>> Updated Notion row successfully")
+      self.__on_updated(await self.__scheduler.call_async(
+          self.__async_client.pages.update, **request))
     except Exception as e:
-      pprint("Got exception while update row for row ID: " + self.__row_id)
-      pprint("Exception: " + str(e))
-      self.__update_errors = "Exception while updating row: " + str(e)
+      self.__on_update_error(e)
     return self.__update_errors
 
-  def delete_db_row(self):
-    """Delete the page associated with the current row_id."""
+  def delete_db_row(self) -> str:
+    """Delete the page associated with the current row_id. Returns the errors,
+    like update_db_row."""
     if not self.__row_id:
       raise ValueError("Row ID not found for row")
 
     try:
-      resp = self.__sync_client.pages.update(**{
-          "page_id": self.__row_id,
-          "archived": True
-      })
+      resp = self.__scheduler.call(
+          self.__sync_client.pages.update, **{
+              "page_id": self.__row_id,
+              "archived": True
+          })
+      logger.debug("Deleted Notion row: %s", self.__row_id)
       self.__row_id = ""
-      self.__pending_update = {}
-      self.__properties = {}
-      pprint(">>>> >>>> >>>> Deleted Notion row successfully")
+      self.__pending_update = set()
+      self.__values = {}
+      self.__update_errors = ""
+      self.__write_error = None
+      self.__notify_written(resp)
     except Exception as e:
-      pprint("Got exception while delete row for row ID: " + self.__row_id)
-      pprint("Exception: " + str(e))
\ No newline at end of file
+      logger.error("Got exception while deleting row for row ID %s: %s",
+                   self.__row_id, e)
+      self.__update_errors = "Exception while deleting row: " + str(e)
+      self.__write_error = e
+    return self.__update_errors
+
+
+class NotionChangeSet():
+  """Writes that were planned instead of sent: rows to create, the changed
+  fields of existing rows, and rows to archive. It can be saved as JSON and
+  applied later, which sends only the planned writes.
+
+  Applying overwrites the planned fields even if they were edited in Notion
+  after the plan was made, so plans should be applied soon after planning."""
+  __creates: list
+  __updates: list
+  __archives: list
+  __skipped: list
+  __lock: threading.Lock
+
+  def __init__(self, data: dict = None):
+    """data is the dict returned by to_dict, or None for an empty set."""
+    data = data or {}
+    self.__creates = list(data.get("create", []))
+    self.__updates = list(data.get("update", []))
+    self.__archives = list(data.get("archive", []))
+    self.__skipped = list(data.get("skipped", []))
+    self.__lock = threading.Lock()
+
+  ############################## Helper Functions ##############################
+
+  def __create(self, notion: Client, create: dict, on_written) -> str:
+    row = NotionRow.from_pending_changes("", create["properties"])
+    row.set_client(notion)
+    row.set_on_written(on_written)
+    row.create_new_db_row(create["database_id"], icon=create["icon"])
+    return row.get_update_errors()
+
+  def __update(self, notion: Client, update: dict, on_written) -> str:
+    row = NotionRow.from_pending_changes(update["row_id"],
+                                         update["properties"])
+    row.set_client(notion)
+    row.set_on_written(on_written)
+    return row.update_db_row() or ""
+
+  def __archive(self, notion: Client, archive: dict, on_written) -> str:
+    row = NotionRow(archive["row_id"], {})
+    row.set_client(notion)
+    row.set_on_written(on_written)
+    return row.delete_db_row()
+
+  ############################## Planning Functions ############################
+
+  def add_create(self, row: NotionRow, database_id: str, icon: dict = {}):
+    with self.__lock:
+      self.__creates.append({
+          "database_id": database_id,
+          "icon": icon,
+          "properties": row.get_pending_changes()
+      })
+
+  def add_update(self, row: NotionRow):
+    """Plan the pending fields of row, if it has any."""
+    changes = row.get_pending_changes()
+    if not changes:
+      _count_write_stat("rows_skipped")
+      return
+    with self.__lock:
+      self.__updates.append({"row_id": row.get_id(), "properties": changes})
+
+  def add_archive(self, row: NotionRow):
+    with self.__lock:
+      self.__archives.append({"row_id": row.get_id()})
+
+  def add_skipped(self, key: str, reason: str):
+    """Record something that could not be planned, e.g. a show that is not
+    cached."""
+    with self.__lock:
+      self.__skipped.append({"key": key, "reason": reason})
+
+  ################################ API Functions ###############################
+
+  def is_empty(self) -> bool:
+    with self.__lock:
+      return not (self.__creates or self.__updates or self.__archives)
+
+  def get_summary(self) -> dict:
+    with self.__lock:
+      return {
+          "rows_to_create": len(self.__creates),
+          "rows_to_update": len(self.__updates),
+          "fields_to_change": sum(len(u["properties"]) for u in self.__updates),
+          "rows_to_archive": len(self.__archives),
+          "skipped": len(self.__skipped)
+      }
+
+  def to_dict(self) -> dict:
+    with self.__lock:
+      return {
+          "create": list(self.__creates),
+          "update": list(self.__updates),
+          "archive": list(self.__archives),
+          "skipped": list(self.__skipped)
+      }
+
+  def save(self, path: str):
+    with open(path, "w") as f:
+      json.dump(self.to_dict(), f, indent=1)
+
+  @classmethod
+  def load(cls, path: str) -> "NotionChangeSet":
+    with open(path) as f:
+      return cls(json.load(f))
+
+  def apply(self,
+            notion: Client,
+            max_workers: int = 1,
+            on_written=None) -> list:
+    """Send the planned writes, paced by the shared scheduler, and return the
+    errors. Rows are created, then updated, then archived. on_written is set
+    on every written row (see NotionRow.set_on_written)."""
+    data = self.to_dict()
+    errors = []
+    for write, items in [(self.__create, data["create"]),
+                         (self.__update, data["update"]),
+                         (self.__archive, data["archive"])]:
+      if max_workers <= 1:
+        errors.extend(write(notion, item, on_written) for item in items)
+      else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+          errors.extend(
+              executor.map(lambda item: write(notion, item, on_written),
+                           items))
+    return [error for error in errors if error]
+
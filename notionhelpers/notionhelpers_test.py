@@ -1,14 +1,623 @@
+import asyncio
+import httpx
+import json
+import os
+import sys
+import threading
+import time
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_directory)
+sys.path.append(os.path.join(os.path.dirname(current_directory), "metrics"))
+
+from notion_client.errors import HTTPResponseError
+from notion_client.errors import RequestTimeoutError
+from notionhelpers import ColumnType
+from notionhelpers import NotionChangeSet
+from notionhelpers import NotionRequestScheduler
+from notionhelpers import NotionRow
+from notionhelpers import NotionRowUpdateConfig
 from unittest import TestCase
+from unittest import mock
+import notionhelpers
+import tempfile
+
+kTestFilesDir = os.path.join(current_directory, "testfiles")
+
+
+class _FakePages():
+  """Records the pages.create/update calls instead of sending them."""
+
+  def __init__(self):
+    self.requests = []
+
+  def create(self, **kwargs):
+    self.requests.append(kwargs)
+    return {"id": "created-row-id", "properties": {}}
+
+  def update(self, **kwargs):
+    self.requests.append(kwargs)
+    return {"id": kwargs["page_id"], "properties": {}}
+
+
+class _FakeClient():
+
+  def __init__(self):
+    self.pages = _FakePages()
+
+
+def _load_property(file_name: str) -> dict:
+  """Load a property in the shape returned by the Notion API."""
+  with open(os.path.join(kTestFilesDir, file_name)) as f:
+    return json.load(f)
+
+
+def _unthrottled_scheduler() -> NotionRequestScheduler:
+  return NotionRequestScheduler(requests_per_second=1000, burst_size=1000)
+
+
+def _new_row(row_id: str, properties: dict, client: _FakeClient) -> NotionRow:
+  row = NotionRow(row_id, properties)
+  row.set_client(client)
+  row.set_scheduler(_unthrottled_scheduler())
+  return row
+
+
+def _replayed_properties(row: NotionRow) -> dict:
+  """Properties sent by a row rebuilt from the JSON of the pending changes."""
+  changes = json.loads(json.dumps(row.get_pending_changes()))
+  replayed = NotionRow.from_pending_changes(row.get_id(), changes)
+  client = _FakeClient()
+  replayed.set_client(client)
+  replayed.set_scheduler(_unthrottled_scheduler())
+  replayed.update_db_row()
+  return client.pages.requests[-1]["properties"]
+
+
+class _RoundTripTestCase(TestCase):
+  """Checks raw Notion property -> normalized value -> get_value -> request
+  payload, both when the row is written directly and when its pending changes
+  are saved as JSON and replayed."""
+  kFileName = ""
+  kColumnType = None
+  kName = "Field"
+
+  def setUp(self):
+    self.client = _FakeClient()
+    self.row = _new_row("row-id", {self.kName: _load_property(self.kFileName)},
+                        self.client)
+
+  def get_value(self):
+    return self.row.get_value(self.kColumnType, self.kName)
+
+  def assertWrites(self, expected_payload):
+    expected = {self.kName: expected_payload}
+    self.assertEqual(_replayed_properties(self.row), expected)
+    self.row.update_db_row()
+    self.assertEqual(
+        self.client.pages.requests[-1], {
+            "page_id": "row-id",
+            "properties": expected
+        })
+    self.assertEqual(self.row.get_pending_changes(), {})
+
+  def assertNoWrite(self):
+    self.assertEqual(self.row.get_pending_changes(), {})
+    self.row.update_db_row()
+    self.assertEqual(self.client.pages.requests, [])
+
+
+class ColumnTypeText(_RoundTripTestCase):
+  kFileName = "columntype_text.json"
+  kColumnType = ColumnType.RICH_TEXT
+
+  def test_get_value(self):
+    self.assertEqual(self.get_value(),
+                     ["A chemistry teacher ", "turns to crime."])
+
+  def test_update_payload(self):
+    self.row.update_value(ColumnType.RICH_TEXT, self.kName, "New plot")
+    self.assertEqual(self.get_value(), ["New plot"])
+    self.assertWrites({"rich_text": [{"text": {"content": "New plot"}}]})
+
+  def test_clear_payload(self):
+    self.row.clear_value(ColumnType.RICH_TEXT, self.kName)
+    self.assertEqual(self.get_value(), [])
+    self.assertWrites({"rich_text": []})
+
+  def test_update_unchanged(self):
+    # Text split into several runs by Notion compares by its full text.
+    self.row.update_value(ColumnType.RICH_TEXT, self.kName,
+                          "A chemistry teacher turns to crime.")
+    self.assertNoWrite()
+
+  def test_clear_unchanged(self):
+    empty = {"type": "rich_text", "rich_text": []}
+    row = _new_row("row-id", {self.kName: empty}, self.client)
+    row.clear_value(ColumnType.RICH_TEXT, self.kName)
+    row.update_value(ColumnType.RICH_TEXT, self.kName, "")
+    row.update_db_row()
+    self.assertEqual(self.client.pages.requests, [])
+
+  def test_update_missing_field(self):
+    self.row.update_value(ColumnType.RICH_TEXT, "Tagline", "Say my name.")
+    self.assertEqual(self.row.get_value(ColumnType.RICH_TEXT, "Tagline"),
+                     ["Say my name."])
+    self.row.update_db_row()
+    self.assertEqual(self.client.pages.requests[-1]["properties"], {
+        "Tagline": {
+            "rich_text": [{
+                "text": {
+                    "content": "Say my name."
+                }
+            }]
+        }
+    })
+
+
+class ColumnTypeTitle(_RoundTripTestCase):
+  kFileName = "columntype_title.json"
+  kColumnType = ColumnType.TITLE
+
+  def test_get_value(self):
+    self.assertEqual(self.get_value(), ["Season 1"])
+
+  def test_create_payload(self):
+    client = _FakeClient()
+    row = _new_row("", {}, client)
+    row.create_field(ColumnType.TITLE, "Season Index", "Season 2")
+    self.assertEqual(row.get_value(ColumnType.TITLE, "Season Index"),
+                     ["Season 2"])
+    self.assertTrue(row.create_new_db_row("seasons-db"))
+    self.assertEqual(
+        client.pages.requests[-1]["properties"],
+        {"Season Index": {
+            "title": [{
+                "text": {
+                    "content": "Season 2"
+                }
+            }]
+        }})
+    self.assertEqual(row.get_id(), "created-row-id")
+
+
+class ColumnTypeDate(_RoundTripTestCase):
+  kFileName = "columntype_date.json"
+  kColumnType = ColumnType.DATE
+
+  def test_get_value(self):
+    self.assertEqual(self.get_value(), "2008-01-20")
+
+  def test_update_payload(self):
+    self.row.update_value(ColumnType.DATE, self.kName, "2013-09-29")
+    self.assertEqual(self.get_value(), "2013-09-29")
+    self.assertWrites({"date": {"start": "2013-09-29"}})
+
+  def test_clear_payload(self):
+    self.row.clear_value(ColumnType.DATE, self.kName)
+    self.assertEqual(self.get_value(), None)
+    self.assertWrites({"date": None})
+
+  def test_update_unchanged(self):
+    self.row.update_value(ColumnType.DATE, self.kName, "2008-01-20")
+    self.assertNoWrite()
+
+  def test_update_creates_field_on_new_row(self):
+    row = _new_row("", {}, self.client)
+    row.update_value(ColumnType.DATE, "Air Date", "2008-01-20")
+    self.assertTrue(row.create_new_db_row("seasons-db"))
+    self.assertEqual(self.client.pages.requests[-1]["properties"],
+                     {"Air Date": {
+                         "date": {
+                             "start": "2008-01-20"
+                         }
+                     }})
+
+  def test_clear_unchanged(self):
+    self.row.clear_value(ColumnType.DATE, self.kName)
+    self.row.update_db_row()
+    self.row.clear_value(ColumnType.DATE, self.kName)
+    self.assertEqual(self.row.get_pending_changes(), {})
+    self.row.update_db_row()
+    self.assertEqual(len(self.client.pages.requests), 1)
+
+
+class ColumnTypeNumber(_RoundTripTestCase):
+  kFileName = "columntype_number.json"
+  kColumnType = ColumnType.NUMBER
+
+  def test_get_value(self):
+    self.assertEqual(self.get_value(), 62)
+
+  def test_update_payload(self):
+    self.row.update_value(ColumnType.NUMBER, self.kName, 8.9)
+    self.assertEqual(self.get_value(), 8.9)
+    self.assertWrites({"number": 8.9})
+
+  def test_clear_payload(self):
+    self.row.clear_value(ColumnType.NUMBER, self.kName)
+    self.assertEqual(self.get_value(), None)
+    self.assertWrites({"number": None})
+
+  def test_update_unchanged(self):
+    self.row.update_value(ColumnType.NUMBER, self.kName, 62)
+    self.row.update_value(ColumnType.NUMBER, self.kName, 62.0)
+    self.assertNoWrite()
+
+
+class ColumnTypeSelect(_RoundTripTestCase):
+  kFileName = "columntype_select.json"
+  kColumnType = ColumnType.SELECT
+
+  def test_get_value(self):
+    self.assertEqual(self.get_value(), "Automate")
+
+  def test_update_payload(self):
+    self.row.update_value(ColumnType.SELECT, self.kName, "Check Status")
+    self.assertEqual(self.get_value(), "Check Status")
+    self.assertWrites({"select": {"name": "Check Status"}})
+
+  def test_clear_payload(self):
+    self.row.clear_value(ColumnType.SELECT, self.kName)
+    self.assertEqual(self.get_value(), None)
+    self.assertWrites({"select": None})
+
+  def test_update_unchanged(self):
+    self.row.update_value(ColumnType.SELECT, self.kName, "Automate")
+    self.assertNoWrite()
+
+  def test_update_then_revert(self):
+    # A field changed and changed back is still sent, with its final value.
+    self.row.update_value(ColumnType.SELECT, self.kName, "Update")
+    self.row.update_value(ColumnType.SELECT, self.kName, "Automate")
+    self.assertWrites({"select": {"name": "Automate"}})
+
+
+class ColumnTypeMultiSelect(_RoundTripTestCase):
+  kFileName = "columntype_multiselect.json"
+  kColumnType = ColumnType.MULTI_SELECT
+
+  def test_get_value(self):
+    self.assertEqual(self.get_value(), ["Drama", "Crime"])
+
+  def test_update_payload(self):
+    self.row.update_value(ColumnType.MULTI_SELECT, self.kName,
+                          ["Drama", "Thriller"])
+    self.assertEqual(self.get_value(), ["Drama", "Thriller"])
+    self.assertWrites(
+        {"multi_select": [{
+            "name": "Drama"
+        }, {
+            "name": "Thriller"
+        }]})
+
+  def test_clear_payload(self):
+    self.row.clear_value(ColumnType.MULTI_SELECT, self.kName)
+    self.assertEqual(self.get_value(), [])
+    self.assertWrites({"multi_select": []})
+
+  def test_update_unchanged(self):
+    self.row.update_value(ColumnType.MULTI_SELECT, self.kName,
+                          ["Drama", "Crime"])
+    self.assertNoWrite()
+
+  def test_update_reordered(self):
+    # Notion shows the options in the order they are sent.
+    self.row.update_value(ColumnType.MULTI_SELECT, self.kName,
+                          ["Crime", "Drama"])
+    self.assertWrites({"multi_select": [{"name": "Crime"}, {"name": "Drama"}]})
+
+
+class ColumnTypeFile(_RoundTripTestCase):
+  kFileName = "columntype_file.json"
+  kColumnType = ColumnType.FILES
+
+  def test_get_value(self):
+    self.assertEqual(self.get_value(), [
+        "https://image.tmdb.org/t/p/original/bb.jpg",
+        "https://files.notion.so/upload.png"
+    ])
+
+  def test_update_payload(self):
+    url = "https://image.tmdb.org/t/p/original/new.jpg"
+    self.row.update_value(ColumnType.FILES,
+                          self.kName,
+                          url,
+                          title="Breaking Bad")
+    self.assertEqual(self.get_value(), [url])
+    self.assertWrites({
+        "files": [{
+            "type": "external",
+            "name": "Poster for Breaking Bad",
+            "external": {
+                "url": url
+            }
+        }]
+    })
+
+  def test_clear_payload(self):
+    self.row.clear_value(ColumnType.FILES, self.kName)
+    self.assertEqual(self.get_value(), [])
+    self.assertWrites({"files": []})
+
+  def test_update_unchanged(self):
+    row = _new_row(
+        "row-id", {
+            self.kName: {
+                "type": "files",
+                "files": [_load_property(self.kFileName)["files"][0]]
+            }
+        }, self.client)
+    row.update_value(ColumnType.FILES,
+                     self.kName,
+                     "https://image.tmdb.org/t/p/original/bb.jpg",
+                     title="Breaking Bad")
+    self.assertEqual(row.get_pending_changes(), {})
+    row.update_db_row()
+    self.assertEqual(self.client.pages.requests, [])
+
+
+class ColumnTypeRelation(_RoundTripTestCase):
+  kFileName = "columntype_relation.json"
+  kColumnType = ColumnType.RELATION
+
+  def test_get_value(self):
+    self.assertEqual(self.get_value(), ["show-row-1", "show-row-2"])
+
+  def test_update_payload(self):
+    self.row.update_value(ColumnType.RELATION,
+                          self.kName, ["show-row-3"],
+                          relation_db="shows-db")
+    self.assertEqual(self.get_value(), ["show-row-3"])
+    self.assertWrites({"relation": [{"id": "show-row-3"}]})
+
+  def test_clear_payload(self):
+    self.row.clear_value(ColumnType.RELATION, self.kName)
+    self.assertEqual(self.get_value(), [])
+    self.assertWrites({"relation": []})
+
+  def test_update_unchanged(self):
+    self.row.update_value(ColumnType.RELATION,
+                          self.kName, ["show-row-1", "show-row-2"],
+                          relation_db="shows-db")
+    self.assertNoWrite()
+
+  def test_combine_unchanged(self):
+    self.row.update_value(ColumnType.RELATION,
+                          self.kName, ["show-row-2", "show-row-1"],
+                          update_config=NotionRowUpdateConfig.COMBINE,
+                          relation_db="shows-db")
+    self.assertNoWrite()
+
+  def test_combine_adds_only_new_ids(self):
+    self.row.update_value(ColumnType.RELATION,
+                          self.kName, ["show-row-2", "show-row-3"],
+                          update_config=NotionRowUpdateConfig.COMBINE,
+                          relation_db="shows-db")
+    self.assertEqual(self.get_value(),
+                     ["show-row-1", "show-row-2", "show-row-3"])
+    self.assertWrites({
+        "relation": [{
+            "id": "show-row-1"
+        }, {
+            "id": "show-row-2"
+        }, {
+            "id": "show-row-3"
+        }]
+    })
+
+  def test_update_requires_relation_db(self):
+    with self.assertRaises(ValueError):
+      self.row.update_value(ColumnType.RELATION, self.kName, ["show-row-3"])
+
+
+class _FlakyCall():
+  """Raises the given errors on the first calls, then returns "ok"."""
+
+  def __init__(self, errors: list):
+    self.errors = list(errors)
+    self.calls = 0
+
+  def __call__(self, *args, **kwargs):
+    self.calls += 1
+    if self.errors:
+      raise self.errors.pop(0)
+    return "ok"
+
+
+def _http_error(status: int, retry_after: str = "") -> HTTPResponseError:
+  headers = {"Retry-After": retry_after} if retry_after else {}
+  return HTTPResponseError(httpx.Response(status, headers=headers))
+
+
+@mock.patch.object(notionhelpers, "kNotionRetryBaseDelaySecs", 0.001)
+class NotionRequestSchedulerRetries(TestCase):
+
+  def setUp(self):
+    self.scheduler = NotionRequestScheduler(requests_per_second=1000,
+                                            burst_size=1000,
+                                            max_retries=3)
+
+  def test_retries_transient_errors(self):
+    for error in [
+        _http_error(429),
+        _http_error(409),
+        _http_error(500),
+        _http_error(502),
+        _http_error(503),
+        _http_error(504),
+        RequestTimeoutError()
+    ]:
+      fn = _FlakyCall([error])
+      self.assertEqual(self.scheduler.call(fn), "ok")
+      self.assertEqual(fn.calls, 2)
+
+  def test_does_not_retry_client_errors(self):
+    fn = _FlakyCall([_http_error(400)])
+    with self.assertRaises(HTTPResponseError):
+      self.scheduler.call(fn)
+    self.assertEqual(fn.calls, 1)
+
+  def test_gives_up_after_max_retries(self):
+    fn = _FlakyCall([_http_error(502)] * 5)
+    with self.assertRaises(HTTPResponseError):
+      self.scheduler.call(fn)
+    self.assertEqual(fn.calls, 4)
+
+  def test_non_idempotent_only_retries_unapplied_requests(self):
+    for error in [_http_error(429), _http_error(409), _http_error(503)]:
+      fn = _FlakyCall([error])
+      self.assertEqual(self.scheduler.call(fn, idempotent=False), "ok")
+      self.assertEqual(fn.calls, 2)
+    for error in [
+        _http_error(500),
+        _http_error(502),
+        _http_error(504),
+        RequestTimeoutError()
+    ]:
+      fn = _FlakyCall([error])
+      with self.assertRaises(type(error)):
+        self.scheduler.call(fn, idempotent=False)
+      self.assertEqual(fn.calls, 1)
+
+  def test_non_idempotent_async(self):
+    fn = _FlakyCall([RequestTimeoutError()])
+
+    async def call():
+      return fn()
+
+    with self.assertRaises(RequestTimeoutError):
+      asyncio.run(self.scheduler.call_async(call, idempotent=False))
+    self.assertEqual(fn.calls, 1)
+    fn = _FlakyCall([_http_error(429)])
+    self.assertEqual(
+        asyncio.run(self.scheduler.call_async(call, idempotent=False)), "ok")
+    self.assertEqual(fn.calls, 2)
+
+  def test_create_is_not_retried_after_timeout(self):
+    client = _FakeClient()
+    client.pages.create = _FlakyCall([RequestTimeoutError()])
+    row = _new_row("", {}, client)
+    row.set_scheduler(self.scheduler)
+    row.create_field(ColumnType.TITLE, "Season Index", "Season 1")
+    self.assertFalse(row.create_new_db_row("seasons-db"))
+    self.assertEqual(client.pages.create.calls, 1)
+    self.assertEqual(client.pages.requests, [])
+    self.assertIn("timed out", row.get_update_errors())
+
+  def test_retry_after_waits_and_pauses_other_callers(self):
+    failed = threading.Event()
+
+    def rate_limited_once():
+      if not failed.is_set():
+        failed.set()
+        raise _http_error(429, retry_after="0.3")
+      return "ok"
+
+    start = time.monotonic()
+    thread = threading.Thread(
+        target=lambda: self.scheduler.call(rate_limited_once))
+    thread.start()
+    failed.wait()
+    # Give the failed call time to pause the scheduler.
+    time.sleep(0.05)
+    self.assertEqual(self.scheduler.call(lambda: "other"), "other")
+    other_secs = time.monotonic() - start
+    thread.join()
+    retried_secs = time.monotonic() - start
+    self.assertGreaterEqual(other_secs, 0.25)
+    self.assertGreaterEqual(retried_secs, 0.3)
+
+  def test_ignores_malformed_retry_after(self):
+    fn = _FlakyCall([_http_error(429, retry_after="soon")])
+    self.assertEqual(self.scheduler.call(fn), "ok")
+    self.assertEqual(fn.calls, 2)
+
+
+class _ArchiveFailingPages(_FakePages):
+  """Fails to archive the rows in failing_row_ids."""
+
+  def __init__(self, failing_row_ids: set):
+    super().__init__()
+    self.failing_row_ids = failing_row_ids
+
+  def update(self, **kwargs):
+    if kwargs.get("archived") and kwargs["page_id"] in self.failing_row_ids:
+      raise _http_error(404)
+    return super().update(**kwargs)
+
 
-class ColumnTypeText(TestCase):
+class NotionChangeSetPlans(TestCase):
 
-class ColumnTypeDate(TestCase):
+  def setUp(self):
+    notionhelpers.configure_notion_scheduler(requests_per_second=1000,
+                                             burst_size=1000,
+                                             max_retries=0)
+    self.addCleanup(notionhelpers.configure_notion_scheduler)
+    self.client = _FakeClient()
+    self.change_set = NotionChangeSet()
 
-class ColumnTypeNumber(TestCase):
+    new_season = NotionRow("", {})
+    new_season.create_field(ColumnType.TITLE, "Season Index", "Season 2")
+    self.change_set.add_create(new_season, "seasons-db")
+    show = _new_row("show-row-id", {}, self.client)
+    show.update_value(ColumnType.NUMBER, "Number of Seasons", 2)
+    self.change_set.add_update(show)
+    # A row without changes is not planned.
+    self.change_set.add_update(_new_row("unchanged-row-id", {}, self.client))
+    self.change_set.add_archive(_new_row("watchlist-row-id", {}, self.client))
+    self.change_set.add_skipped("tt1", "Not cached")
 
-class ColumnTypeSelect(TestCase):
+  def test_planning_sends_nothing(self):
+    self.assertEqual(self.client.pages.requests, [])
+    self.assertEqual(
+        self.change_set.get_summary(), {
+            "rows_to_create": 1,
+            "rows_to_update": 1,
+            "fields_to_change": 1,
+            "rows_to_archive": 1,
+            "skipped": 1
+        })
 
-class ColumnTypeMultiSelect(TestCase):
+  def test_saved_plan_loads_unchanged(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, "plan.json")
+      self.change_set.save(path)
+      loaded = NotionChangeSet.load(path)
+    self.assertEqual(loaded.to_dict(),
+                     json.loads(json.dumps(self.change_set.to_dict())))
+    self.assertEqual(loaded.get_summary(), self.change_set.get_summary())
+    # The loaded plan sends the same writes as the one that was saved.
+    loaded_client = _FakeClient()
+    self.assertEqual(loaded.apply(loaded_client), [])
+    self.assertEqual(self.change_set.apply(self.client), [])
+    self.assertEqual(loaded_client.pages.requests, self.client.pages.requests)
 
-class ColumnTypeFile(TestCase):
+  def test_apply_sends_planned_writes_in_order(self):
+    written = []
+    errors = self.change_set.apply(self.client,
+                                   on_written=lambda page: written.append(
+                                       page["id"]))
+    self.assertEqual(errors, [])
+    requests = self.client.pages.requests
+    self.assertEqual(len(requests), 3)
+    self.assertEqual(requests[0]["parent"], {"database_id": "seasons-db"})
+    self.assertEqual(requests[1]["page_id"], "show-row-id")
+    self.assertEqual(requests[1]["properties"],
+                     {"Number of Seasons": {
+                         "number": 2
+                     }})
+    self.assertEqual(requests[2], {
+        "page_id": "watchlist-row-id",
+        "archived": True
+    })
+    self.assertEqual(written,
+                     ["created-row-id", "show-row-id", "watchlist-row-id"])
 
+  def test_apply_reports_failed_archive(self):
+    self.client.pages = _ArchiveFailingPages({"watchlist-row-id"})
+    errors = self.change_set.apply(self.client, max_workers=2)
+    self.assertEqual(len(errors), 1)
+    self.assertIn("Exception while deleting row", errors[0])
+    # The other writes still went through.
+    self.assertEqual(len(self.client.pages.requests), 2)
@@ -0,0 +1,172 @@
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta, timezone
+from notion_client import Client
+from notionhelpers import notion_database_query_all
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+kDefaultMirrorPath = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "notionmirror.sqlite")
+# Notion rounds last_edited_time to the minute, so incremental syncs look back
+# a little further than the last sync time to not miss any edits.
+kMirrorSyncOverlapMins = 2
+# Incremental syncs can't see rows that were archived or deleted in Notion
+# (other than by writes passed to record_write), so every once in a while the
+# whole database is downloaded again.
+kMirrorFullSyncDays = 7
+
+_sync_lock = threading.Lock()
+
+
+class NotionDatabaseMirror():
+  """Local on-disk copy of a Notion database, kept in sync incrementally by
+  last_edited_time."""
+  __notion: Client
+  __database_id: str
+  __db_path: str
+
+  def __init__(self, notion: Client, database_id: str, db_path: str = ""):
+    if not database_id:
+      raise ValueError("Cannot mirror a database without a database_id")
+    self.__notion = notion
+    self.__database_id = database_id
+    self.__db_path = db_path or os.environ.get("NOTION_MIRROR_PATH",
+                                               kDefaultMirrorPath)
+    with self.__connect() as conn:
+      conn.execute("CREATE TABLE IF NOT EXISTS rows ("
+                   "database_id TEXT NOT NULL, row_id TEXT NOT NULL, "
+                   "data TEXT NOT NULL, PRIMARY KEY (database_id, row_id))")
+      conn.execute("CREATE TABLE IF NOT EXISTS sync_state ("
+                   "database_id TEXT PRIMARY KEY, last_synced TEXT NOT NULL, "
+                   "last_full_sync TEXT NOT NULL)")
+
+  ############################## Helper Functions ##############################
+
+  @contextmanager
+  def __connect(self):
+    """Open a connection for one transaction, committed and closed on exit."""
+    with closing(sqlite3.connect(self.__db_path, timeout=60)) as conn:
+      with conn:
+        yield conn
+
+  def __now(self) -> datetime:
+    return datetime.now(timezone.utc)
+
+  def __format_time(self, t: datetime) -> str:
+    return t.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+  def __parse_time(self, t: str) -> datetime:
+    return datetime.strptime(t, '%Y-%m-%dT%H:%M:%S.000Z').replace(
+        tzinfo=timezone.utc)
+
+  def __is_removed(self, row: dict) -> bool:
+    return bool(row.get("archived") or row.get("in_trash"))
+
+  def __store_row(self, conn: sqlite3.Connection, row: dict):
+    if self.__is_removed(row):
+      conn.execute("DELETE FROM rows WHERE database_id = ? AND row_id = ?",
+                   (self.__database_id, row["id"]))
+    else:
+      conn.execute("INSERT OR REPLACE INTO rows VALUES (?, ?, ?)",
+                   (self.__database_id, row["id"], json.dumps(row)))
+
+  def __get_sync_state(self, conn: sqlite3.Connection):
+    return conn.execute(
+        "SELECT last_synced, last_full_sync FROM sync_state "
+        "WHERE database_id = ?", (self.__database_id,)).fetchone()
+
+  ################################ API Functions ###############################
+
+  def sync(self, full: bool = False) -> int:
+    """Fetch the rows edited since the last sync (or all rows, if full is set
+    or a full sync is due). Returns the number of rows fetched."""
+    with _sync_lock:
+      sync_start = self.__now()
+      with self.__connect() as conn:
+        state = self.__get_sync_state(conn)
+      if state and not full:
+        full = sync_start - self.__parse_time(state[1]) >= timedelta(
+            days=kMirrorFullSyncDays)
+      full = full or not state
+
+      if full:
+        logger.info("Mirror: fetching all rows for database: %s",
+                    self.__database_id)
+        data = notion_database_query_all(self.__notion, self.__database_id)
+        last_full_sync = self.__format_time(sync_start)
+      else:
+        edited_since = self.__parse_time(state[0]) - timedelta(
+            minutes=kMirrorSyncOverlapMins)
+        logger.info("Mirror: fetching rows edited since %s for database: %s",
+                    self.__format_time(edited_since), self.__database_id)
+        data = notion_database_query_all(
+            self.__notion,
+            self.__database_id,
+            edited_since=self.__format_time(edited_since))
+        last_full_sync = state[1]
+
+      with self.__connect() as conn:
+        if full:
+          conn.execute("DELETE FROM rows WHERE database_id = ?",
+                       (self.__database_id,))
+        for row in data["results"]:
+          self.__store_row(conn, row)
+        conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                     (self.__database_id, self.__format_time(sync_start),
+                      last_full_sync))
+      return len(data["results"])
+
+  def record_write(self, page: dict) -> bool:
+    """Store a page returned by a Notion write (removing it if it was
+    archived), so the mirror is up to date without waiting for a sync. Pages
+    of other databases are ignored. Returns whether the page was stored."""
+    database_id = page.get("parent", {}).get("database_id", "")
+    if database_id.replace("-", "") != self.__database_id.replace("-", ""):
+      return False
+    with self.__connect() as conn:
+      self.__store_row(conn, page)
+    return True
+
+  def get_rows(self) -> list:
+    """Return every mirrored row that is not archived, as returned by the
+    Notion API."""
+    with self.__connect() as conn:
+      rows = [
+          json.loads(data) for (data, ) in conn.execute(
+              "SELECT data FROM rows WHERE database_id = ?",
+              (self.__database_id,))
+      ]
+    return [row for row in rows if not self.__is_removed(row)]
+
+  def query_all(self) -> dict:
+    """Sync, then return all rows in the same shape as notion_database_query_all."""
+    self.sync()
+    return {
+        "object": "list",
+        "results": self.get_rows(),
+        "next_cursor": None,
+        "has_more": False
+    }
+
+
+def mirror_write_listener(mirrors: list):
+  """Return an on_written callback (see NotionRow.set_on_written) that stores
+  each written page in whichever of mirrors holds its database."""
+
+  def on_written(page: dict):
+    try:
+      for mirror in mirrors:
+        if mirror.record_write(page):
+          return
+    except Exception as e:
+      # A later sync catches up, so the write itself still succeeded.
+      logger.warning("Could not store written page %s in the mirror: %s",
+                     page.get("id"), e)
+
+  return on_written
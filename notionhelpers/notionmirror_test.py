@@ -0,0 +1,144 @@
+import os
+import sys
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_directory)
+sys.path.append(os.path.join(os.path.dirname(current_directory), "metrics"))
+
+from notionhelpers import NotionRequestScheduler
+from notionhelpers import NotionRow
+from notionmirror import NotionDatabaseMirror
+from notionmirror import mirror_write_listener
+from unittest import TestCase
+from unittest import mock
+import sqlite3
+import tempfile
+
+kShowsDbId = "0c5a6a7e-4a0b-4d3f-9f55-2a0f6f1c0a01"
+kSeasonsDbId = "0c5a6a7e-4a0b-4d3f-9f55-2a0f6f1c0a02"
+
+
+def _page(page_id: str, database_id: str, title: str, **fields) -> dict:
+  return {
+      "object": "page",
+      "id": page_id,
+      "archived": False,
+      "in_trash": False,
+      "parent": {
+          "type": "database_id",
+          "database_id": database_id
+      },
+      "properties": {
+          "Title": {
+              "type": "title",
+              "title": [{
+                  "plain_text": title
+              }]
+          }
+      },
+      **fields
+  }
+
+
+class _FakeDatabases():
+
+  def __init__(self, pages: dict):
+    self.pages = pages
+
+  def query(self, database_id: str, **kwargs):
+    return {
+        "object": "list",
+        "results": list(self.pages.values()),
+        "next_cursor": None,
+        "has_more": False
+    }
+
+
+class _FakePages():
+  """Serves pages.update like Notion: the updated page is returned."""
+
+  def __init__(self, pages: dict):
+    self.pages = pages
+
+  def update(self, page_id: str, archived: bool = False, **kwargs):
+    page = dict(self.pages[page_id], archived=archived)
+    if archived:
+      del self.pages[page_id]
+    else:
+      self.pages[page_id] = page
+    return page
+
+
+class _FakeClient():
+
+  def __init__(self, pages: list):
+    pages = {page["id"]: page for page in pages}
+    self.databases = _FakeDatabases(pages)
+    self.pages = _FakePages(pages)
+
+
+class NotionDatabaseMirrorWrites(TestCase):
+
+  def setUp(self):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+    self.notion = _FakeClient([
+        _page("show-1", kShowsDbId, "Show 1"),
+        _page("show-2", kShowsDbId, "Show 2")
+    ])
+    self.mirror = NotionDatabaseMirror(self.notion,
+                                       kShowsDbId.replace("-", ""),
+                                       db_path=os.path.join(
+                                           tmp_dir.name, "mirror.sqlite"))
+    self.mirror.sync()
+
+  def row_ids(self) -> list:
+    return sorted(row["id"] for row in self.mirror.get_rows())
+
+  def test_written_page_replaces_row(self):
+    page = _page("show-1", kShowsDbId, "Renamed")
+    self.assertTrue(self.mirror.record_write(page))
+    rows = {row["id"]: row for row in self.mirror.get_rows()}
+    self.assertEqual(rows["show-1"]["properties"], page["properties"])
+
+  def test_created_page_is_added(self):
+    self.mirror.record_write(_page("show-3", kShowsDbId, "Show 3"))
+    self.assertEqual(self.row_ids(), ["show-1", "show-2", "show-3"])
+
+  def test_archived_and_trashed_pages_are_removed(self):
+    self.mirror.record_write(_page("show-1", kShowsDbId, "", archived=True))
+    self.mirror.record_write(_page("show-2", kShowsDbId, "", in_trash=True))
+    self.assertEqual(self.row_ids(), [])
+
+  def test_pages_of_other_databases_are_ignored(self):
+    self.assertFalse(
+        self.mirror.record_write(_page("season-1", kSeasonsDbId, "Season 1")))
+    self.assertEqual(self.row_ids(), ["show-1", "show-2"])
+
+  def test_row_archived_through_listener_is_removed(self):
+    row = NotionRow("show-1", {})
+    row.set_client(self.notion)
+    row.set_scheduler(
+        NotionRequestScheduler(requests_per_second=1000, burst_size=1000))
+    row.set_on_written(mirror_write_listener([self.mirror]))
+    row.delete_db_row()
+    # Incremental syncs can't see archived rows, so only the write removes it.
+    self.mirror.sync()
+    self.assertEqual(self.row_ids(), ["show-2"])
+
+  def test_connections_are_closed(self):
+    connections = []
+    real_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+      connections.append(real_connect(*args, **kwargs))
+      return connections[-1]
+
+    with mock.patch("notionmirror.sqlite3.connect", side_effect=connect):
+      self.mirror.record_write(_page("show-3", kShowsDbId, "Show 3"))
+      self.mirror.get_rows()
+    self.assertEqual(len(connections), 2)
+    for conn in connections:
+      with self.assertRaises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    self.assertIn("show-3", self.row_ids())
@@ -0,0 +1,60 @@
+"""Plan an update of the Shows, Seasons and watchlist DBs without writing to
+Notion, or apply a saved plan.
+
+  python plan_from_tmdb.py plan <plan.json> [IMDB IDs...]
+  python plan_from_tmdb.py apply <plan.json>
+
+Planning reads the databases through the local mirror and TMDB data only from
+the cache, so it makes no TMDB calls and no Notion writes. Applying sends just
+the planned writes.
+"""
+import logging
+import os
+import sys
+from tvshowsupdater import UpdateFromTmdb
+from tvshowsupdater import configure_connection_pools
+from tvshowsupdater import configure_logging
+# Imported after tvshowsupdater, which adds the helper directories to the path.
+from notionhelpers import NotionChangeSet
+from notionhelpers import get_notion_client
+from notionmirror import NotionDatabaseMirror
+from notionmirror import mirror_write_listener
+
+if len(sys.argv) < 3 or not sys.argv[1] in ["plan", "apply"]:
+  print(__doc__)
+  sys.exit(1)
+command, plan_path, input_imdb_ids = sys.argv[1], sys.argv[2], sys.argv[3:]
+
+configure_logging()
+max_workers = int(os.environ.get("UPDATE_MAX_WORKERS", "8"))
+configure_connection_pools(max_workers)
+
+if command == "plan":
+  change_set = NotionChangeSet()
+  UpdateFromTmdb(imdb_ids=input_imdb_ids,
+                 max_workers=max_workers,
+                 change_set=change_set).update_shows_and_seasons()
+  UpdateFromTmdb(imdb_ids=input_imdb_ids,
+                 is_watchlist=True,
+                 max_workers=max_workers,
+                 change_set=change_set).update_watchlist()
+  change_set.save(plan_path)
+  logging.info("Saved plan to %s: %s", plan_path, change_set.get_summary())
+else:
+  change_set = NotionChangeSet.load(plan_path)
+  logging.info("Applying plan from %s: %s", plan_path,
+               change_set.get_summary())
+  notion = get_notion_client()
+  # Store the applied writes in the mirror, so the next plan doesn't see the
+  # archived rows again.
+  mirrors = [
+      NotionDatabaseMirror(notion, os.environ[name])
+      for name in ["SHOWS_DB", "SEASONS_DB", "FUTURE_SHOWS_DB"]
+      if os.environ.get(name)
+  ]
+  errors = change_set.apply(notion,
+                            max_workers=max_workers,
+                            on_written=mirror_write_listener(mirrors))
+  for error in errors:
+    logging.error("%s", error)
+  sys.exit(1 if errors else 0)
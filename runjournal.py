@@ -0,0 +1,205 @@
+from datetime import datetime
+import fcntl
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+kDefaultJournalDir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "runjournals")
+
+
+class RunInProgressError(RuntimeError):
+  """Another process or job is already running over the same journal."""
+
+
+class RunJournal():
+  """Append-only JSONL record of the progress of an update run: which shows
+  were started, which show and season rows were written, and how each show
+  finished. Every record is flushed to disk before the next write is sent, so
+  an interrupted run can be resumed from its journal.
+
+  A resumed run skips the shows that finished without errors. Shows that were
+  interrupted or failed after being started are retried even if Notion no
+  longer marks them as due, without rewriting the rows that were written.
+
+  Only one run at a time may use a journal: a lock file next to it is held
+  until the journal is closed (or the process exits), and a second run over
+  the same journal raises RunInProgressError instead of truncating it."""
+  __path: str
+  __file = None
+  __lock_file = None
+  __started: dict
+  __shows_written: set
+  __seasons_written: set
+  __finished_ok: set
+  __failed: set
+  __lock: threading.Lock
+
+  def __init__(self,
+               run_name: str,
+               resume: bool = False,
+               journal_dir: str = ""):
+    journal_dir = journal_dir or os.environ.get("RUN_JOURNAL_DIR",
+                                                kDefaultJournalDir)
+    os.makedirs(journal_dir, exist_ok=True)
+    self.__path = os.path.join(journal_dir, run_name + ".jsonl")
+    self.__lock = threading.Lock()
+    self.__acquire_run_lock(os.path.join(journal_dir, run_name + ".lock"))
+
+    self.__reset()
+    resumed = resume and self.__load()
+    if resume and not resumed:
+      # Nothing is carried over from a run that finished.
+      self.__reset()
+      logger.info("No interrupted run to resume in %s, starting a new run",
+                  self.__path)
+    self.__file = open(self.__path, "a" if resumed else "w")
+    self.__append({"event": "run", "resumed": resumed})
+    if resumed:
+      logger.info("Resuming run from %s: %s", self.__path, self.get_summary())
+
+  ############################## Helper Functions ##############################
+
+  def __acquire_run_lock(self, lock_path: str):
+    self.__lock_file = open(lock_path, "a")
+    try:
+      fcntl.flock(self.__lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+      self.__lock_file.close()
+      self.__lock_file = None
+      raise RunInProgressError("Another run is already writing " +
+                               self.__path)
+
+  def __reset(self):
+    self.__started = {}
+    self.__shows_written = set()
+    self.__seasons_written = set()
+    self.__finished_ok = set()
+    self.__failed = set()
+
+  def __load(self) -> bool:
+    """Replay the journal at path. Returns whether it holds an unfinished
+    run."""
+    if not os.path.exists(self.__path):
+      return False
+    finished = False
+    with open(self.__path) as f:
+      for line in f:
+        try:
+          record = json.loads(line)
+        except ValueError:
+          # The last line may be cut short if the process was killed.
+          continue
+        event = record["event"]
+        imdb_id = record.get("imdb_id")
+        if event == "run_finished":
+          finished = True
+        elif event == "run":
+          finished = False
+        elif event == "show_started":
+          self.__started[imdb_id] = record["automated"]
+        elif event == "show_written":
+          self.__shows_written.add(imdb_id)
+        elif event == "season_written":
+          self.__seasons_written.add((imdb_id, record["season"]))
+        elif event == "show_finished":
+          if record["ok"]:
+            self.__finished_ok.add(imdb_id)
+            self.__failed.discard(imdb_id)
+          else:
+            self.__finished_ok.discard(imdb_id)
+            self.__failed.add(imdb_id)
+    return not finished
+
+  def __append(self, record: dict):
+    record["at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with self.__lock:
+      self.__file.write(json.dumps(record) + "\n")
+      self.__file.flush()
+      os.fsync(self.__file.fileno())
+
+  ################################ API Functions ###############################
+
+  def get_path(self) -> str:
+    return self.__path
+
+  def is_finished(self, imdb_id: str) -> bool:
+    """Whether the show finished without errors in an earlier attempt."""
+    return imdb_id in self.__finished_ok
+
+  def get_started_automated(self, imdb_id: str):
+    """If the show was started but not finished cleanly in an earlier attempt,
+    return whether that was an automated update, otherwise None."""
+    if imdb_id in self.__finished_ok:
+      return None
+    return self.__started.get(imdb_id)
+
+  def is_show_written(self, imdb_id: str) -> bool:
+    return imdb_id in self.__shows_written
+
+  def is_season_written(self, imdb_id: str, season_number: int) -> bool:
+    return (imdb_id, season_number) in self.__seasons_written
+
+  def get_retry_imdb_ids(self) -> list:
+    """IMDB IDs of the shows that were interrupted or failed."""
+    return sorted((set(self.__started) | self.__failed) - self.__finished_ok)
+
+  def get_summary(self) -> dict:
+    return {
+        "shows_finished": len(self.__finished_ok),
+        "shows_to_retry": len(self.get_retry_imdb_ids()),
+        "seasons_written": len(self.__seasons_written)
+    }
+
+  def record_show_started(self, imdb_id: str, automated: bool):
+    self.__started[imdb_id] = automated
+    self.__append({
+        "event": "show_started",
+        "imdb_id": imdb_id,
+        "automated": automated
+    })
+
+  def record_show_written(self, imdb_id: str):
+    self.__shows_written.add(imdb_id)
+    self.__append({"event": "show_written", "imdb_id": imdb_id})
+
+  def record_season_written(self, imdb_id: str, season_number: int):
+    self.__seasons_written.add((imdb_id, season_number))
+    self.__append({
+        "event": "season_written",
+        "imdb_id": imdb_id,
+        "season": season_number
+    })
+
+  def record_show_finished(self, imdb_id: str, errors: list):
+    if errors:
+      self.__failed.add(imdb_id)
+    else:
+      self.__finished_ok.add(imdb_id)
+      self.__failed.discard(imdb_id)
+    self.__append({
+        "event": "show_finished",
+        "imdb_id": imdb_id,
+        "ok": not errors,
+        "errors": errors
+    })
+
+  def record_run_finished(self):
+    """Mark the run as complete, so that it is not resumed, and close the
+    journal."""
+    self.__append({"event": "run_finished", **self.get_summary()})
+    self.close()
+
+  def close(self):
+    """Close the journal and let other runs use it. A run that is closed
+    without record_run_finished can be resumed."""
+    with self.__lock:
+      if not self.__file.closed:
+        self.__file.close()
+      if self.__lock_file != None:
+        # Closing the file releases the lock.
+        self.__lock_file.close()
+        self.__lock_file = None
@@ -0,0 +1,88 @@
+import os
+import sys
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_directory)
+
+from runjournal import RunInProgressError
+from runjournal import RunJournal
+from unittest import TestCase
+import json
+import tempfile
+
+
+class RunJournalReplay(TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+
+  def new_journal(self, resume: bool = False) -> RunJournal:
+    journal = RunJournal("shows", resume=resume, journal_dir=self.tmp_dir.name)
+    self.addCleanup(journal.close)
+    return journal
+
+  def interrupted_journal(self):
+    journal = self.new_journal()
+    journal.record_show_started("tt1", automated=True)
+    journal.record_show_written("tt1")
+    journal.record_season_written("tt1", 1)
+    journal.record_show_finished("tt1", [])
+    journal.record_show_started("tt2", automated=False)
+    journal.record_show_written("tt2")
+    journal.record_season_written("tt2", 2)
+    journal.record_show_started("tt3", automated=True)
+    journal.record_show_finished("tt3", ["TMDB error"])
+    journal.close()
+
+  def test_resume_replays_interrupted_run(self):
+    self.interrupted_journal()
+    journal = self.new_journal(resume=True)
+    self.assertTrue(journal.is_finished("tt1"))
+    self.assertFalse(journal.is_finished("tt2"))
+    self.assertIsNone(journal.get_started_automated("tt1"))
+    self.assertFalse(journal.get_started_automated("tt2"))
+    self.assertTrue(journal.get_started_automated("tt3"))
+    self.assertTrue(journal.is_show_written("tt2"))
+    self.assertTrue(journal.is_season_written("tt2", 2))
+    self.assertFalse(journal.is_season_written("tt2", 1))
+    self.assertEqual(journal.get_retry_imdb_ids(), ["tt2", "tt3"])
+    self.assertEqual(journal.get_summary(), {
+        "shows_finished": 1,
+        "shows_to_retry": 2,
+        "seasons_written": 2
+    })
+
+  def test_retried_show_that_finishes_is_not_retried_again(self):
+    self.interrupted_journal()
+    journal = self.new_journal(resume=True)
+    journal.record_show_finished("tt3", [])
+    journal.close()
+    journal = self.new_journal(resume=True)
+    self.assertTrue(journal.is_finished("tt3"))
+    self.assertEqual(journal.get_retry_imdb_ids(), ["tt2"])
+
+  def test_finished_run_is_not_resumed(self):
+    journal = self.new_journal()
+    journal.record_show_started("tt1", automated=True)
+    journal.record_run_finished()
+    journal = self.new_journal(resume=True)
+    self.assertEqual(journal.get_retry_imdb_ids(), [])
+    with open(journal.get_path()) as f:
+      self.assertEqual([json.loads(line)["event"] for line in f], ["run"])
+
+  def test_cut_short_last_line_is_ignored(self):
+    self.interrupted_journal()
+    with open(os.path.join(self.tmp_dir.name, "shows.jsonl"), "a") as f:
+      f.write('{"event": "show_finished", "imdb_id": "tt2", "o')
+    journal = self.new_journal(resume=True)
+    self.assertEqual(journal.get_retry_imdb_ids(), ["tt2", "tt3"])
+
+  def test_concurrent_run_does_not_truncate_journal(self):
+    journal = self.new_journal()
+    journal.record_show_started("tt1", automated=True)
+    with self.assertRaises(RunInProgressError):
+      RunJournal("shows", journal_dir=self.tmp_dir.name)
+    journal.close()
+    journal = self.new_journal(resume=True)
+    self.assertEqual(journal.get_retry_imdb_ids(), ["tt1"])
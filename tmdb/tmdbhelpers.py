@@ -1,53 +1,565 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from diskcache import Cache
+import asyncio
+import httpx
+import logging
 import os
+import threading
+import time
 from pprint import pprint
 from datetime import datetime, timedelta
+from runmetrics import bind_run_metrics
+from runmetrics import get_run_metrics
+import re
 import requests
 import pytz
-import math
 import tmdbsimple as tmdb
 
-kMaxSupportedSeasonsPerRequest = 20
+logger = logging.getLogger(__name__)
+
+# TMDB accepts at most 20 items in append_to_response, shared between seasons
+# and the other sub-resources.
+kMaxAppendToResponseItems = 20
+# Sub-resources appended to the first info request, mapped to the key they are
+# stored under in the full entity.
+kEntitySubResources = {
+    "credits": "credits",
+    "content_ratings": "content_ratings",
+    "keywords": "keywords",
+    "watch/providers": "watch_providers",
+}
+# Upper bound on concurrent requests made while fetching a single entity.
+kMaxEntityFetchWorkers = 8
 kDefaultCountryCode = "US"
 kCacheTtlDays = 15
+# Every part of an entity is cached separately so that a refresh only fetches
+# the parts that can have changed. Shows and seasons that are over change
+# rarely, so they are kept much longer than the rest. Changes to info and
+# seasons are also picked up through TmdbChangeFeed, but watch providers are
+# not part of the TMDB change list so they are kept for a short time only.
+kCacheTtlDaysByResource = {
+    "info": 15,
+    "ended_info": 30,
+    "credits": 15,
+    "content_ratings": 30,
+    "keywords": 30,
+    "watch_providers": 7,
+    "season": 15,
+    "finished_season": 180,
+    # The number of seasons is kept as long as the finished seasons, so that
+    # they are found in the cache after the info part expired.
+    "number_of_seasons": 180,
+    "ids": 365,
+}
+kEndedShowStatuses = ["Ended", "Canceled"]
+# A season counts as finished once its last episode aired this long ago.
+kFinishedSeasonGraceDays = 30
+kDefaultCacheDir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tmdbcache")
+kCacheLruMaxEntries = 256
 kDefaultTimezone = pytz.timezone('America/New_York')
+kTmdbPublicApiUrl = "https://api.themoviedb.org/3"
+# TMDB_BASE_URL points all TMDB requests at another server, e.g. a stub.
+kTmdbApiBaseUrl = os.environ.get("TMDB_BASE_URL", kTmdbPublicApiUrl)
+kTmdbRequestTimeoutSecs = 30
+# Keep-alive connections in the shared session's pool. Each update worker
+# fetches up to kMaxEntityFetchWorkers parts of an entity at once.
+kTmdbPoolMaxConnections = 16
+# TMDB only serves the change list for up to 14 days at a time.
+kChangesMaxRangeDays = 14
+kChangeFeedCheckedKeyPrefix = "changes/tv/checked/"
+# Broad queries like "the" match hundreds of pages, searches stop after this
+# many pages.
+kSearchMaxPages = 10
+# Search results are only cached briefly so that new shows show up soon.
+kSearchCacheTtlMins = 10
+
+
+class TmdbCacheManager():
+  """Process-wide TMDB cache: a bounded in-memory LRU in front of diskcache.
+
+  Values in the memory tier are shared, not copied, so callers must treat
+  cached values as read-only.
+  """
+  __cache_dir: str
+  __disk_cache: Cache
+  __lru: OrderedDict
+  __max_memory_entries: int
+  __stats: dict
+  __lock: threading.Lock
+
+  def __init__(self,
+               cache_dir: str = "",
+               max_memory_entries: int = kCacheLruMaxEntries):
+    self.__cache_dir = cache_dir or os.environ.get("TMDB_CACHE_DIR",
+                                                   kDefaultCacheDir)
+    self.__disk_cache = Cache(self.__cache_dir)
+    self.__lru = OrderedDict()
+    self.__max_memory_entries = max_memory_entries
+    self.__stats = {
+        "memory_hits": 0,
+        "disk_hits": 0,
+        "misses": 0,
+        "evictions": 0
+    }
+    self.__lock = threading.Lock()
+
+  ############################## Helper Functions ##############################
+
+  def __remember(self, key: str, value, expire_at: float):
+    # Must be called with the lock held.
+    if self.__max_memory_entries <= 0:
+      return
+    self.__lru[key] = (value, expire_at)
+    self.__lru.move_to_end(key)
+    while len(self.__lru) > self.__max_memory_entries:
+      self.__lru.popitem(last=False)
+      self.__stats["evictions"] += 1
+
+  ################################ API Functions ###############################
+
+  def get_cache_dir(self) -> str:
+    return self.__cache_dir
+
+  def get(self, key: str, default=None):
+    with self.__lock:
+      if key in self.__lru:
+        value, expire_at = self.__lru[key]
+        if expire_at == None or expire_at > time.time():
+          self.__lru.move_to_end(key)
+          self.__stats["memory_hits"] += 1
+          return value
+        del self.__lru[key]
+
+    value, expire_at = self.__disk_cache.get(key,
+                                             default=None,
+                                             expire_time=True)
+    with self.__lock:
+      if value == None:
+        self.__stats["misses"] += 1
+        return default
+      self.__stats["disk_hits"] += 1
+      self.__remember(key, value, expire_at)
+    return value
+
+  def set(self, key: str, value, expire: float = None):
+    """Store value under key, expire is in seconds (None never expires)."""
+    self.__disk_cache.set(key, value, expire=expire)
+    with self.__lock:
+      self.__remember(key, value,
+                      None if expire == None else time.time() + expire)
+
+  def delete(self, key: str):
+    self.__disk_cache.delete(key)
+    with self.__lock:
+      self.__lru.pop(key, None)
+
+  def get_stats(self) -> dict:
+    """Return hit/miss/eviction counters and the memory tier size."""
+    with self.__lock:
+      stats = dict(self.__stats)
+      stats["memory_entries"] = len(self.__lru)
+    return stats
+
+  def close(self):
+    self.__disk_cache.close()
+
+
+_tmdb_cache = None
+_tmdb_cache_lock = threading.Lock()
+
+
+def configure_tmdb_cache(
+    cache_dir: str = "",
+    max_memory_entries: int = kCacheLruMaxEntries) -> TmdbCacheManager:
+  """Replace the shared TMDB cache, e.g. to use a different directory."""
+  global _tmdb_cache
+  with _tmdb_cache_lock:
+    if _tmdb_cache != None:
+      _tmdb_cache.close()
+    _tmdb_cache = TmdbCacheManager(cache_dir, max_memory_entries)
+    return _tmdb_cache
+
+
+def get_tmdb_cache() -> TmdbCacheManager:
+  """Return the shared TMDB cache, opening it on first use."""
+  global _tmdb_cache
+  with _tmdb_cache_lock:
+    if _tmdb_cache == None:
+      _tmdb_cache = TmdbCacheManager()
+    return _tmdb_cache
+
+
+def _tmdb_metric_name(url: str) -> str:
+  """Metric name for a TMDB request, with IDs left out, e.g. tmdb.tv/{id}."""
+  path = url.split("?")[0]
+  for base_url in [kTmdbApiBaseUrl, kTmdbPublicApiUrl]:
+    if path.startswith(base_url):
+      path = path[len(base_url):]
+  path = re.sub(r"/(\d+|tt\d+)(?=/|$)", "/{id}", "/" + path.strip("/"))
+  return "tmdb." + path.lstrip("/")
+
+
+class _KeepAliveSession(requests.Session):
+  """tmdbsimple sends "Connection: close" with every request, which would
+  make the pool open a new TLS connection each time. Drop that header.
+
+  tmdbsimple also always uses the public API URL, which is replaced with
+  kTmdbApiBaseUrl."""
+
+  def request(self, method, url, headers=None, **kwargs):
+    if headers:
+      headers = {k: v for k, v in headers.items() if k.lower() != "connection"}
+    if kTmdbApiBaseUrl != kTmdbPublicApiUrl and url.startswith(
+        kTmdbPublicApiUrl):
+      url = kTmdbApiBaseUrl + url[len(kTmdbPublicApiUrl):]
+    with get_run_metrics().time_call(_tmdb_metric_name(url)):
+      return super().request(method, url, headers=headers, **kwargs)
+
+
+_tmdb_session = None
+_tmdb_session_max_connections = kTmdbPoolMaxConnections
+_tmdb_session_lock = threading.Lock()
+
+
+def configure_tmdb_session(max_connections: int = kTmdbPoolMaxConnections,
+                           session: requests.Session = None):
+  """Size the connection pool of the shared tmdbsimple session, e.g. for more
+  workers, or replace the session (e.g. with a stub). The session is set up
+  on the next get_tmdb_session call."""
+  global _tmdb_session, _tmdb_session_max_connections
+  with _tmdb_session_lock:
+    _tmdb_session = session
+    _tmdb_session_max_connections = max_connections
+
+
+def get_tmdb_session() -> requests.Session:
+  """Set up tmdbsimple with the API key and the shared session on first use,
+  and return the session."""
+  global _tmdb_session
+  with _tmdb_session_lock:
+    if _tmdb_session == None:
+      _tmdb_session = _KeepAliveSession()
+      _tmdb_session.mount(
+          "https://",
+          requests.adapters.HTTPAdapter(
+              pool_connections=1, pool_maxsize=_tmdb_session_max_connections))
+    if tmdb.REQUESTS_SESSION is not _tmdb_session:
+      tmdb.API_KEY = os.environ["TMDB_API_KEY"]
+      tmdb.REQUESTS_SESSION = _tmdb_session
+    return _tmdb_session
+
+
+def get_cached_tmdb_id(imdb_id: str) -> str:
+  """Return the TMDB ID for imdb_id if it is known from an earlier fetch."""
+  return get_tmdb_cache().get("tmdb_id/" + imdb_id, "")
+
+
+def normalize_search_query(query: str) -> str:
+  """Lowercase query and collapse whitespace, so equivalent searches share a
+  cache entry."""
+  return " ".join(query.lower().split())
+
+
+def search_cache_key(query: str, max_pages: int) -> str:
+  return "search/tv/" + str(max_pages) + "/" + normalize_search_query(query)
+
+
+def plan_append_to_response(sub_resources: list, season_numbers: list) -> list:
+  """Split sub_resources and season_numbers into the values of
+  append_to_response for as few info requests as possible. The sub-resources
+  go into the first request, which is filled up with seasons."""
+  items = list(sub_resources)
+  for season_number in season_numbers:
+    items.append("season/" + str(season_number))
+  plan = []
+  for i in range(0, len(items), kMaxAppendToResponseItems):
+    plan.append(",".join(items[i:i + kMaxAppendToResponseItems]))
+  return plan
+
+
+def plan_first_info_request(sub_resources: list, missing_seasons: list,
+                            known_number_of_seasons: int) -> str:
+  """Return append_to_response for the first info request of an entity.
+
+  The number of seasons is only known for sure after the first request, so
+  it is filled up with seasons that may have been added since the last fetch.
+  """
+  free_slots = kMaxAppendToResponseItems - len(sub_resources)
+  first_seasons = missing_seasons + list(
+      range(known_number_of_seasons + 1,
+            known_number_of_seasons + 1 + free_slots))
+  return plan_append_to_response(sub_resources, first_seasons[:free_slots])[0]
+
+
+def plan_remaining_info_requests(first_response: dict,
+                                 cached_seasons: list) -> list:
+  """Return append_to_response for the info requests that fetch the seasons
+  which are neither cached nor in the first response."""
+  remaining_seasons = []
+  for season_number in range(1, first_response["number_of_seasons"] + 1):
+    if not season_number in cached_seasons and not (
+        "season/" + str(season_number)) in first_response:
+      remaining_seasons.append(season_number)
+  return plan_append_to_response([], remaining_seasons)
 
 
 class TmdbSearcher():
   __query: str
-  __search_client = None
+  __max_pages: int
 
-  def __init__(self, query: str = ""):
+  def __init__(self, query: str = "", max_pages: int = kSearchMaxPages):
     self.__query = query
+    self.__max_pages = max_pages
+
+    get_tmdb_session()
 
-    tmdb.API_KEY = os.environ["TMDB_API_KEY"]
-    self.__search_client = tmdb.Search()
+  ############################## Helper Functions ##############################
+
+  def __fetch_page(self, page_number: int) -> dict:
+    # A separate Search object per request, since tmdbsimple stores the
+    # response on the object and pages are fetched concurrently.
+    return tmdb.Search().tv(query=normalize_search_query(self.__query),
+                            **{"page": page_number})
 
   ################################ API Functions ###############################
 
   def set_query(self, query: str):
     self.__query = query
 
+  def fetch_results_iter(self):
+    """Yield the results page by page as they arrive, starting with the first
+    page. Pages after the first come in completion order, not page order. A
+    recently searched query is yielded as a single cached list."""
+    if not normalize_search_query(self.__query):
+      return
+    cache = get_tmdb_cache()
+    cache_key = search_cache_key(self.__query, self.__max_pages)
+    results = cache.get(cache_key)
+    if results != None:
+      get_run_metrics().increment("tmdb.search_cache_hits")
+      yield list(results)
+      return
+    get_run_metrics().increment("tmdb.search_cache_misses")
+
+    # Get the first page to learn the number of pages. Then get the rest
+    # concurrently if more pages exist.
+    first_page = self.__fetch_page(1)
+    results = list(first_page["results"])
+    yield list(first_page["results"])
+    last_page = min(first_page["total_pages"], self.__max_pages)
+    if last_page > 1:
+      with ThreadPoolExecutor(
+          max_workers=min(last_page - 1, kMaxEntityFetchWorkers)) as executor:
+        futures = [
+            executor.submit(bind_run_metrics(self.__fetch_page), page_number)
+            for page_number in range(2, last_page + 1)
+        ]
+        for future in as_completed(futures):
+          page = future.result()
+          results.extend(page["results"])
+          yield list(page["results"])
+    cache.set(cache_key, results, expire=kSearchCacheTtlMins * 60)
+
   def fetch_results(self):
+    """Return the results of up to max_pages pages, from the cache if the same
+    query was searched recently."""
     results = []
-    if not self.__query:
-      return results
+    for page_results in self.fetch_results_iter():
+      results.extend(page_results)
+    return results
 
-    search_result = self.__search_client.tv(query=self.__query)
-    total_pages = search_result["total_pages"]
 
-    # Get the first page which is already available. Then get the rest if
-    # more pages exist.
-    results.extend(search_result["results"])
+class TmdbChangeFeed():
+  """TMDB IDs of the shows that changed on TMDB over the last few days.
+
+  A show that the change list reports as unchanged is remembered as checked
+  on the run date once its update succeeds (record_checked), so later runs
+  only need the changes since that check even if the show was built from the
+  cache and kept its old import date.
+  """
+  __start_date: str
+  __run_date: str
+  __changed_tmdb_ids: set
+  __unchanged_tmdb_ids: set
+  __available: bool
+
+  def __init__(self, run_date: str = ""):
+    """run_date (YYYY-MM-DD) defaults to today in UTC."""
+    self.__run_date = run_date or datetime.now(pytz.utc).strftime('%Y-%m-%d')
+    self.__start_date = ""
+    self.__changed_tmdb_ids = set()
+    self.__unchanged_tmdb_ids = set()
+    self.__available = False
+
+  def __fetch_page(self, page: int) -> dict:
+    return tmdb.Changes().tv(start_date=self.__start_date,
+                             end_date=self.__run_date,
+                             page=page)
+
+  def __checked_key(self, tmdb_id) -> str:
+    return kChangeFeedCheckedKeyPrefix + str(tmdb_id)
 
-    for page_number in range(2, total_pages + 1):
-      search_result = self.__search_client.tv(query=self.__query,
-                                              **{"page": page_number})
-      results.extend(search_result["results"])
+  ################################ API Functions ###############################
+
+  def get_checked_date(self, tmdb_id, last_fetch_date: str) -> str:
+    """Date through which the show is known to be up to date: the later of
+    last_fetch_date and the last run that found it unchanged."""
+    checked_date = get_tmdb_cache().get(self.__checked_key(tmdb_id), "")
+    return max(last_fetch_date or "", checked_date)
+
+  def fetch(self, oldest_checked_date: str) -> bool:
+    """Fetch the changes since oldest_checked_date, the oldest
+    get_checked_date of the shows that will be asked about, or at most the
+    last kChangesMaxRangeDays days. Returns False if nothing was fetched, in
+    which case every show counts as changed."""
+    if not oldest_checked_date:
+      logger.info("No shows to check, skipping TMDB change list")
+      return False
+    oldest_start_date = (datetime.strptime(self.__run_date, '%Y-%m-%d') -
+                         timedelta(days=kChangesMaxRangeDays)).strftime(
+                             '%Y-%m-%d')
+    self.__start_date = min(max(oldest_checked_date, oldest_start_date),
+                            self.__run_date)
+
+    get_tmdb_session()
+    first_page = self.__fetch_page(1)
+    pages = [first_page]
+    if first_page["total_pages"] > 1:
+      with ThreadPoolExecutor(max_workers=kMaxEntityFetchWorkers) as executor:
+        pages.extend(
+            executor.map(bind_run_metrics(self.__fetch_page),
+                         range(2, first_page["total_pages"] + 1)))
+    for page in pages:
+      for result in page["results"]:
+        self.__changed_tmdb_ids.add(int(result["id"]))
+    self.__available = True
+    logger.info("Fetched TMDB change list since %s: %d changed shows",
+                self.__start_date, len(self.__changed_tmdb_ids))
+    return True
+
+  def get_start_date(self) -> str:
+    return self.__start_date
+
+  def has_changed(self, tmdb_id, last_fetch_date: str) -> bool:
+    """Whether the show may have changed since it was fetched on
+    last_fetch_date (YYYY-MM-DD). True whenever the change list can't tell."""
+    if not self.__available or not tmdb_id or not last_fetch_date:
+      return True
+    if self.get_checked_date(tmdb_id, last_fetch_date) < self.__start_date:
+      return True
+    if int(tmdb_id) in self.__changed_tmdb_ids:
+      return True
+    self.__unchanged_tmdb_ids.add(int(tmdb_id))
+    return False
+
+  def record_checked(self, tmdb_id):
+    """Remember a show that has_changed found unchanged as checked on the run
+    date. Call it once the show's update succeeded, so a failed update is
+    checked again by the next run."""
+    if not tmdb_id or int(tmdb_id) not in self.__unchanged_tmdb_ids:
+      return
+    get_tmdb_cache().set(self.__checked_key(tmdb_id),
+                         self.__run_date,
+                         expire=kChangesMaxRangeDays * 86400)
+
+
+class AsyncTmdbClient():
+  """Non-blocking TMDB client for the async serving path, built on httpx.
+
+  Its pool keeps up to max_connections keep-alive connections, and at most
+  that many requests are sent at once. The rest wait here instead of in the
+  httpx pool, which gets slow with long queues (many concurrent searches)."""
+  __client: httpx.AsyncClient
+  __request_slots: asyncio.Semaphore
+
+  def __init__(self,
+               client: httpx.AsyncClient = None,
+               max_connections: int = kTmdbPoolMaxConnections):
+    limits = httpx.Limits(max_connections=max_connections,
+                          max_keepalive_connections=max_connections)
+    self.__client = client or httpx.AsyncClient(
+        base_url=kTmdbApiBaseUrl,
+        timeout=kTmdbRequestTimeoutSecs,
+        limits=limits)
+    self.__request_slots = asyncio.Semaphore(max_connections)
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *args):
+    await self.aclose()
+
+  async def aclose(self):
+    await self.__client.aclose()
+
+  ################################ API Functions ###############################
 
+  async def get(self, path: str, **params) -> dict:
+    params["api_key"] = os.environ["TMDB_API_KEY"]
+    async with self.__request_slots:
+      with get_run_metrics().time_call(_tmdb_metric_name(path)):
+        response = await self.__client.get(path, params=params)
+        response.raise_for_status()
+    return response.json()
+
+  async def search_tv_iter(self, query: str, max_pages: int = kSearchMaxPages):
+    """Async version of TmdbSearcher.fetch_results_iter, sharing its cache."""
+    query = normalize_search_query(query)
+    if not query:
+      return
+    # The cache is on disk, so it is read and written off the event loop.
+    cache_key = search_cache_key(query, max_pages)
+    results = await asyncio.to_thread(lambda: get_tmdb_cache().get(cache_key))
+    if results != None:
+      get_run_metrics().increment("tmdb.search_cache_hits")
+      yield list(results)
+      return
+    get_run_metrics().increment("tmdb.search_cache_misses")
+
+    first_page = await self.get("search/tv", query=query)
+    results = list(first_page["results"])
+    yield list(first_page["results"])
+    last_page = min(first_page["total_pages"], max_pages)
+    for next_page in asyncio.as_completed([
+        self.get("search/tv", query=query, page=page_number)
+        for page_number in range(2, last_page + 1)
+    ]):
+      page = await next_page
+      results.extend(page["results"])
+      yield list(page["results"])
+    await asyncio.to_thread(lambda: get_tmdb_cache().set(
+        cache_key, results, expire=kSearchCacheTtlMins * 60))
+
+  async def search_tv(self, query: str,
+                      max_pages: int = kSearchMaxPages) -> list:
+    """Async version of TmdbSearcher.fetch_results, sharing its cache."""
+    results = []
+    async for page_results in self.search_tv_iter(query, max_pages):
+      results.extend(page_results)
     return results
 
+  async def fetch_entity(self, tmdb_id) -> "TmdbEntity":
+    """Fetch every part of the entity without using the cache (like
+    force_update_cache=True), then cache it."""
+    path = "tv/" + str(tmdb_id)
+    sub_resources = list(kEntitySubResources) + ["external_ids"]
+    response = await self.get(path,
+                              append_to_response=plan_first_info_request(
+                                  sub_resources, [], 0))
+    chunks = await asyncio.gather(*[
+        self.get(path, append_to_response=append)
+        for append in plan_remaining_info_requests(response, [])
+    ])
+    for chunk in chunks:
+      response = response | chunk
+    # Building the entity writes it to the cache.
+    return await asyncio.to_thread(TmdbEntity,
+                                   tmdb_id=tmdb_id,
+                                   fetched_info=response)
+
 
 @dataclass
 class TmdbEntity():
@@ -56,25 +568,38 @@ class TmdbEntity():
   __full_entity: dict
   __force_update_cache: bool
 
-  def __init__(self, imdb_id="", tmdb_id="", force_update_cache=False):
+  def __init__(self,
+               imdb_id="",
+               tmdb_id="",
+               force_update_cache=False,
+               fetched_info: dict = None,
+               cache_only: bool = False):
+    """Assemble the entity from its cached parts, fetching the missing ones.
+
+    Cached parts expire on their own TTL. force_update_cache refetches every
+    part except seasons that are finished, since those no longer change.
+    fetched_info is a complete info response (all sub-resources and seasons
+    appended) that was fetched elsewhere, e.g. by AsyncTmdbClient; it is
+    cached and used as is. With cache_only, nothing is fetched and KeyError is
+    raised unless every part is cached (force_update_cache is ignored)."""
     self.__imdb_id = imdb_id
     self.__tmdb_id = tmdb_id
     self.__full_entity = {}
+    if cache_only:
+      force_update_cache = False
     self.__force_update_cache = force_update_cache
 
-    cache = Cache("./tmdbcache")
-    if (not self.__force_update_cache) and self.__imdb_id:
-      cached_full_entity = cache.get(self.__imdb_id)
+    cache = get_tmdb_cache()
+    if fetched_info:
+      self.__tmdb_id = fetched_info["id"]
+      parts = {}
+      seasons = {}
+      info = self.__store_response(cache, dict(fetched_info), parts, seasons)
+      self.__assemble_full_entity(info, parts, seasons)
+      get_run_metrics().increment("tmdb.entities_fetched")
+      return
 
-      # If a cached entity is found, use that to avoid multiple (6 or more) RPCs
-      if cached_full_entity:
-        pprint("Fetched CACHED TMDB entity for IMDB ID: " + self.__imdb_id +
-               " with TMDB ID: " + str(cached_full_entity["id"]))
-        self.__full_entity = cached_full_entity
-        self.__tmdb_id = cached_full_entity["id"]
-        return
-
-    tmdb.API_KEY = os.environ["TMDB_API_KEY"]
+    get_tmdb_session()
 
     # Fetch tmdb_id if it is empty
     if not self.__tmdb_id:
@@ -82,71 +607,191 @@ class TmdbEntity():
         raise KeyError(
             "At least one of IMDB and TMDB IDs is required for initialization.")
 
-      search_result = tmdb.Find(imdb_id).info(external_source="imdb_id")
-      if len(search_result["tv_results"]) == 0:
-        raise KeyError("No TV show found for imdb_id: " + self.__imdb_id)
-      else:
-        show_result = search_result["tv_results"][0]
-        self.__tmdb_id = show_result["id"]
-
-    # Create a fetcher that will be used to call multiple endpoints.
-    fetcher = tmdb.TV(self.__tmdb_id)
-
+      self.__tmdb_id = get_cached_tmdb_id(self.__imdb_id)
+      if not self.__tmdb_id and cache_only:
+        raise KeyError("TMDB ID is not cached for IMDB ID: " + self.__imdb_id)
+      if not self.__tmdb_id:
+        search_result = tmdb.Find(imdb_id).info(external_source="imdb_id")
+        if len(search_result["tv_results"]) == 0:
+          raise KeyError("No TV show found for imdb_id: " + self.__imdb_id)
+        else:
+          show_result = search_result["tv_results"][0]
+          self.__tmdb_id = show_result["id"]
+        self.__cache_ids(cache)
+
+    sub_resources = []
     # If only tmdb_id was provided, then we need to first set imdb_id.
     if not self.__imdb_id:
-      fetcher.external_ids()
-      self.__imdb_id = fetcher.imdb_id
+      self.__imdb_id = cache.get("imdb_id/" + str(self.__tmdb_id), "")
+      if not self.__imdb_id:
+        sub_resources.append("external_ids")
+
+    # Load whatever is still valid from the cache.
+    info = None if force_update_cache else cache.get(self.__cache_key("info"))
+    parts = {}
+    for sub_resource in kEntitySubResources:
+      part = None if force_update_cache else cache.get(
+          self.__cache_key(kEntitySubResources[sub_resource]))
+      if part == None:
+        sub_resources.append(sub_resource)
+      else:
+        parts[kEntitySubResources[sub_resource]] = part
+    seasons = {}
+    cached_info = info or cache.get(self.__cache_key("info"))
+    if cached_info:
+      known_number_of_seasons = cached_info["data"]["number_of_seasons"]
+    else:
+      known_number_of_seasons = cache.get(
+          self.__cache_key("number_of_seasons"), 0)
+    for season_number in range(1, known_number_of_seasons + 1):
+      season = cache.get(self.__cache_key(self.__season_key(season_number)))
+      if season and (not force_update_cache or season["finished"]):
+        seasons[season_number] = season["data"]
+
+    missing_seasons = [
+        s for s in range(1, known_number_of_seasons + 1) if not s in seasons
+    ]
+    if info and not sub_resources and not missing_seasons:
+      # If every part is cached, avoid any RPCs
+      get_run_metrics().increment("tmdb.entities_cached")
+      logger.debug(
+          "Fetched CACHED TMDB entity for IMDB ID: %s with TMDB ID: %s",
+          self.__imdb_id, self.__tmdb_id)
+    elif cache_only:
+      raise KeyError("TMDB entity is not fully cached for IMDB ID: " +
+                     self.__imdb_id)
+    else:
+      info = self.__fetch_parts(cache, sub_resources, missing_seasons,
+                                known_number_of_seasons, parts, seasons)
+      get_run_metrics().increment("tmdb.entities_fetched")
+      logger.debug(
+          "Fetched TMDB entity for IMDB ID: %s (refreshed %d sub-resources and "
+          "%d known seasons)", self.__imdb_id, len(sub_resources),
+          len(missing_seasons))
+
+    self.__assemble_full_entity(info, parts, seasons)
+
+  ############################# Fetching Functions #############################
+
+  def __assemble_full_entity(self, info: dict, parts: dict, seasons: dict):
+    self.__full_entity = dict(info["data"])
+    self.__full_entity.update(parts)
+    for season_number in seasons:
+      # Seasons cached before the show lost a season are left out.
+      if season_number > info["data"]["number_of_seasons"]:
+        continue
+      self.__full_entity[self.__season_key(season_number)] = seasons[
+          season_number]
+    self.__full_entity["import_date"] = info["import_date"]
+
+  def __cache_key(self, part: str) -> str:
+    return "tv/" + str(self.__tmdb_id) + "/" + part
+
+  def __cache_ids(self, cache: TmdbCacheManager):
+    ttl = kCacheTtlDaysByResource["ids"] * 86400
+    cache.set("tmdb_id/" + self.__imdb_id, self.__tmdb_id, expire=ttl)
+    cache.set("imdb_id/" + str(self.__tmdb_id), self.__imdb_id, expire=ttl)
+
+  def __fetch(self, method: str, **kwargs) -> dict:
+    # Every request gets its own fetcher because tmdbsimple stores response
+    # fields on the fetcher object.
+    return getattr(tmdb.TV(self.__tmdb_id), method)(**kwargs)
+
+  def __is_finished_season(self, season: dict, is_last_season: bool,
+                           status: str) -> bool:
+    if is_last_season and not status in kEndedShowStatuses:
+      return False
+    episodes = season.get("episodes")
+    if not episodes or not episodes[-1].get("air_date"):
+      return False
+    last_air_date = datetime.strptime(episodes[-1]["air_date"], '%Y-%m-%d')
+    return (datetime.today() - last_air_date).days >= kFinishedSeasonGraceDays
+
+  def __fetch_parts(self, cache: TmdbCacheManager, sub_resources: list,
+                    missing_seasons: list, known_number_of_seasons: int,
+                    parts: dict, seasons: dict) -> dict:
+    """Fetch the info along with the given sub-resources and seasons, and
+    cache each of them under its own key and TTL. Fills in parts and seasons,
+    and returns the cached info entry."""
+    # TODO: Some shows have specials listed as season/0. That needs special handling.
+    response = self.__fetch("info",
+                            append_to_response=plan_first_info_request(
+                                sub_resources, missing_seasons,
+                                known_number_of_seasons))
+
+    # The rest of the seasons are fetched in parallel.
+    plan = plan_remaining_info_requests(response, list(seasons))
+    if plan:
+      with ThreadPoolExecutor(
+          max_workers=min(len(plan), kMaxEntityFetchWorkers)) as executor:
+        chunks = [
+            executor.submit(bind_run_metrics(self.__fetch),
+                            "info",
+                            append_to_response=append)
+            for append in plan
+        ]
+        for chunk in chunks:
+          response = response | chunk.result()
+
+    return self.__store_response(cache, response, parts, seasons)
+
+  def __store_response(self, cache: TmdbCacheManager, response: dict,
+                       parts: dict, seasons: dict) -> dict:
+    """Split an info response (with appended sub-resources and seasons) into
+    its parts and cache each of them under its own key and TTL. Fills in parts
+    and seasons, and returns the cached info entry."""
+    number_of_seasons = response["number_of_seasons"]
+    if not self.__imdb_id:
+      self.__imdb_id = response.pop("external_ids", {}).get("imdb_id")
       if not self.__imdb_id:
         raise KeyError("IMDB ID is not available for TMDB Entity: " +
-                       self.__tmdb_id)
-
-    self.__initialize_full_entity(fetcher)
-
-    self.__full_entity["credits"] = fetcher.credits()
-    self.__full_entity["content_ratings"] = fetcher.content_ratings()
-    self.__full_entity["keywords"] = fetcher.keywords()
-    self.__full_entity["watch_providers"] = fetcher.watch_providers()
-    self.__full_entity["import_date"] = datetime.today().astimezone(
-        kDefaultTimezone).strftime('%Y-%m-%d')
+                       str(self.__tmdb_id))
+      self.__cache_ids(cache)
 
     # TODO: How to check if the responses are bad?
 
-    cache.set(self.__imdb_id, self.__full_entity, expire=kCacheTtlDays * 86400)
-    pprint("Fetched TMDB entity for IMDB ID: " + self.__imdb_id)
-
-  def __initialize_full_entity(self, tmdb_fetcher):
-    # TODO: Some shows have specials listed as season/0. That needs special handling.
-    append_seasons = ""
-    for season_number in range(1, kMaxSupportedSeasonsPerRequest):
-      append_seasons = append_seasons + self.__season_key(season_number) + ","
-    append_seasons = append_seasons + self.__season_key(
-        kMaxSupportedSeasonsPerRequest)
-
-    self.__full_entity = tmdb_fetcher.info(append_to_response=append_seasons)
-
-    if self.__full_entity["number_of_seasons"] > kMaxSupportedSeasonsPerRequest:
-      num_requests = math.ceil(
-          (self.__full_entity["number_of_seasons"] -
-           kMaxSupportedSeasonsPerRequest) / kMaxSupportedSeasonsPerRequest)
-
-      for request_number in range(1, 1 + num_requests):
-        append_seasons = ""
-        # Create request to fetch the next set of seasons
-        for season_number in range(
-            request_number * kMaxSupportedSeasonsPerRequest + 1,
-            request_number * kMaxSupportedSeasonsPerRequest +
-            kMaxSupportedSeasonsPerRequest):
-          append_seasons = append_seasons + self.__season_key(
-              season_number) + ","
-        append_seasons = append_seasons + self.__season_key(
-            request_number * kMaxSupportedSeasonsPerRequest +
-            kMaxSupportedSeasonsPerRequest)
-
-        # Fetch the next set of seasons
-        fetched_info = tmdb_fetcher.info(append_to_response=append_seasons)
-
-        # Merge with the stored full entity
-        self.__full_entity = self.__full_entity | fetched_info
+    response.pop("external_ids", None)
+    for sub_resource in kEntitySubResources:
+      if sub_resource in response:
+        name = kEntitySubResources[sub_resource]
+        parts[name] = response.pop(sub_resource, {})
+        cache.set(self.__cache_key(name),
+                  parts[name],
+                  expire=kCacheTtlDaysByResource[name] * 86400)
+
+    status = response.get("status")
+    for season_number in range(1, number_of_seasons + 1):
+      key = self.__season_key(season_number)
+      if not key in response:
+        continue
+      season = response.pop(key)
+      finished = self.__is_finished_season(
+          season, season_number == number_of_seasons, status)
+      ttl_days = kCacheTtlDaysByResource[
+          "finished_season" if finished else "season"]
+      cache.set(self.__cache_key(key), {
+          "data": season,
+          "finished": finished
+      },
+                expire=ttl_days * 86400)
+      seasons[season_number] = season
+    # Drop seasons that are beyond the current number of seasons.
+    for key in [k for k in response if k.startswith("season/")]:
+      response.pop(key)
+
+    info = {
+        "data":
+            response,
+        "import_date":
+            datetime.today().astimezone(kDefaultTimezone).strftime('%Y-%m-%d')
+    }
+    ttl_days = kCacheTtlDaysByResource[
+        "ended_info" if status in kEndedShowStatuses else "info"]
+    cache.set(self.__cache_key("info"), info, expire=ttl_days * 86400)
+    cache.set(self.__cache_key("number_of_seasons"),
+              number_of_seasons,
+              expire=kCacheTtlDaysByResource["number_of_seasons"] * 86400)
+    return info
 
   def print(self):
     pprint(self.__full_entity)
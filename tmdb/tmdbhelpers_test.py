@@ -0,0 +1,382 @@
+import os
+import sys
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_directory)
+sys.path.append(os.path.join(os.path.dirname(current_directory), "metrics"))
+
+from tmdbhelpers import AsyncTmdbClient
+from tmdbhelpers import TmdbCacheManager
+from tmdbhelpers import TmdbChangeFeed
+from tmdbhelpers import TmdbEntity
+from tmdbhelpers import configure_tmdb_cache
+from unittest import TestCase
+from unittest import mock
+import asyncio
+import httpx
+import tempfile
+import threading
+import time
+import tmdbhelpers
+
+
+class TmdbCacheManagerLru(TestCase):
+
+  def setUp(self):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+    self.cache = TmdbCacheManager(cache_dir=tmp_dir.name, max_memory_entries=2)
+    self.addCleanup(self.cache.close)
+
+  def test_least_recently_used_entry_is_evicted(self):
+    for key in ["a", "b", "c"]:
+      self.cache.set(key, key.upper())
+    stats = self.cache.get_stats()
+    self.assertEqual(stats["evictions"], 1)
+    self.assertEqual(stats["memory_entries"], 2)
+    # "a" was evicted from memory, but is still on disk.
+    self.assertEqual(self.cache.get("b"), "B")
+    self.assertEqual(self.cache.get("c"), "C")
+    self.assertEqual(self.cache.get("a"), "A")
+    self.assertEqual(self.cache.get_stats()["memory_hits"], 2)
+    self.assertEqual(self.cache.get_stats()["disk_hits"], 1)
+
+  def test_memory_tier_stays_within_bound(self):
+    for i in range(10):
+      self.cache.set(str(i), i)
+      self.cache.get(str(i // 2))
+      self.assertLessEqual(self.cache.get_stats()["memory_entries"], 2)
+
+  def test_hit_promotes_entry(self):
+    self.cache.set("a", "A")
+    self.cache.set("b", "B")
+    self.assertEqual(self.cache.get("a"), "A")
+    # "b" is now the least recently used entry, so "c" evicts it.
+    self.cache.set("c", "C")
+    self.assertEqual(self.cache.get("a"), "A")
+    self.assertEqual(self.cache.get_stats()["memory_hits"], 2)
+    self.assertEqual(self.cache.get("b"), "B")
+    self.assertEqual(self.cache.get_stats()["disk_hits"], 1)
+
+  def test_stats_count_hits_and_misses(self):
+    self.cache.set("a", "A")
+    self.assertEqual(self.cache.get("a"), "A")
+    self.assertEqual(self.cache.get("missing", "default"), "default")
+    self.assertIsNone(self.cache.get("missing"))
+    self.assertEqual(
+        self.cache.get_stats(), {
+            "memory_hits": 1,
+            "disk_hits": 0,
+            "misses": 2,
+            "evictions": 0,
+            "memory_entries": 1
+        })
+
+  def test_expired_entry_is_not_served_from_memory(self):
+    self.cache.set("a", "A", expire=0.05)
+    time.sleep(0.1)
+    self.assertIsNone(self.cache.get("a"))
+    self.assertEqual(self.cache.get_stats()["misses"], 1)
+    self.assertEqual(self.cache.get_stats()["memory_entries"], 0)
+
+
+class _ThreadRecordingCache(TmdbCacheManager):
+  """Records the threads that touch the cache."""
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.threads = []
+
+  def get(self, *args, **kwargs):
+    self.threads.append(threading.current_thread())
+    return super().get(*args, **kwargs)
+
+  def set(self, *args, **kwargs):
+    self.threads.append(threading.current_thread())
+    return super().set(*args, **kwargs)
+
+
+class AsyncTmdbClientSearchCache(TestCase):
+
+  def setUp(self):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+    self.cache = _ThreadRecordingCache(cache_dir=tmp_dir.name)
+    self.addCleanup(self.cache.close)
+    self.requests = []
+    patches = [
+        mock.patch.object(tmdbhelpers, "get_tmdb_cache", lambda: self.cache),
+        mock.patch.dict(os.environ, {"TMDB_API_KEY": "key"})
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+
+  def serve(self, request: httpx.Request) -> httpx.Response:
+    self.requests.append(request)
+    return httpx.Response(200,
+                          json={
+                              "results": [{
+                                  "id": 1
+                              }],
+                              "total_pages": 1
+                          })
+
+  def search(self, queries: list) -> list:
+
+    async def search_all():
+      client = httpx.AsyncClient(base_url="https://tmdb.test",
+                                 transport=httpx.MockTransport(self.serve))
+      async with AsyncTmdbClient(client=client) as tmdb_client:
+        return [await tmdb_client.search_tv(query) for query in queries]
+
+    return asyncio.run(search_all())
+
+  def test_repeated_search_is_served_from_cache(self):
+    self.assertEqual(self.search(["Show", " show "]),
+                     [[{
+                         "id": 1
+                     }], [{
+                         "id": 1
+                     }]])
+    self.assertEqual(len(self.requests), 1)
+
+  def test_cache_is_not_used_on_the_event_loop_thread(self):
+    self.search(["Show", "Show"])
+    self.assertEqual(len(self.cache.threads), 3)
+    self.assertNotIn(threading.main_thread(), self.cache.threads)
+
+
+class AsyncTmdbClientFetchEntity(TestCase):
+
+  def setUp(self):
+    self.entity_threads = []
+    patches = [
+        mock.patch.object(tmdbhelpers, "TmdbEntity", self.new_entity),
+        mock.patch.dict(os.environ, {"TMDB_API_KEY": "key"})
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+
+  def new_entity(self, tmdb_id, fetched_info: dict) -> dict:
+    self.entity_threads.append(threading.current_thread())
+    return fetched_info
+
+  def serve(self, request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200,
+                          json={
+                              "id": 1,
+                              "name": "Show",
+                              "number_of_seasons": 0
+                          })
+
+  def test_entity_is_not_built_on_the_event_loop_thread(self):
+    # Building the entity writes it to the disk cache.
+
+    async def fetch():
+      client = httpx.AsyncClient(base_url="https://tmdb.test",
+                                 transport=httpx.MockTransport(self.serve))
+      async with AsyncTmdbClient(client=client) as tmdb_client:
+        return await tmdb_client.fetch_entity(1)
+
+    self.assertEqual(asyncio.run(fetch())["name"], "Show")
+    self.assertEqual(len(self.entity_threads), 1)
+    self.assertNotEqual(self.entity_threads[0], threading.main_thread())
+
+
+class _FakeTv():
+  """Stands in for tmdbsimple.TV, serving an ended show with finished seasons
+  and recording the append_to_response of every info request."""
+  number_of_seasons = 3
+  requests = []
+
+  def __init__(self, tmdb_id):
+    self.tmdb_id = tmdb_id
+
+  def info(self, append_to_response: str = ""):
+    appended = [item for item in append_to_response.split(",") if item]
+    _FakeTv.requests.append(appended)
+    response = {
+        "id": self.tmdb_id,
+        "name": "Show",
+        "status": "Ended",
+        "number_of_seasons": _FakeTv.number_of_seasons
+    }
+    for item in appended:
+      if item.startswith("season/"):
+        season_number = int(item.split("/")[1])
+        if season_number > _FakeTv.number_of_seasons:
+          continue
+        response[item] = {
+            "air_date": "2001-01-01",
+            "episodes": [{
+                "air_date": "2001-03-01",
+                "runtime": 30
+            }]
+        }
+      else:
+        response[item] = {"results": []}
+    return response
+
+
+class TmdbEntitySeasonCache(TestCase):
+
+  def setUp(self):
+    self.cache = configure_tmdb_cache(cache_dir=tempfile.mkdtemp())
+    _FakeTv.number_of_seasons = 3
+    _FakeTv.requests = []
+    patches = [
+        mock.patch.object(tmdbhelpers.tmdb, "TV", _FakeTv),
+        mock.patch.dict(os.environ, {"TMDB_API_KEY": "test-key"})
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+
+  def requested_seasons(self) -> list:
+    return [
+        int(item.split("/")[1]) for request in _FakeTv.requests
+        for item in request if item.startswith("season/")
+    ]
+
+  def test_cached_entity_makes_no_requests(self):
+    TmdbEntity(imdb_id="tt1", tmdb_id=1)
+    _FakeTv.requests = []
+    entity = TmdbEntity(imdb_id="tt1", tmdb_id=1)
+    self.assertEqual(_FakeTv.requests, [])
+    self.assertEqual(entity.get_number_of_seasons(), 3)
+
+  def test_finished_seasons_outlive_info(self):
+    TmdbEntity(imdb_id="tt1", tmdb_id=1)
+    self.assertEqual(sorted(set(self.requested_seasons()) & {1, 2, 3}),
+                     [1, 2, 3])
+    # The info part expires long before the finished seasons.
+    self.cache.delete("tv/1/info")
+    _FakeTv.requests = []
+    entity = TmdbEntity(imdb_id="tt1", tmdb_id=1)
+    self.assertEqual(len(_FakeTv.requests), 1)
+    self.assertEqual(set(self.requested_seasons()) & {1, 2, 3}, set())
+    self.assertEqual(entity.get_season_air_date(3), "2001-01-01")
+
+  def test_new_season_after_info_expired(self):
+    TmdbEntity(imdb_id="tt1", tmdb_id=1)
+    self.cache.delete("tv/1/info")
+    _FakeTv.number_of_seasons = 4
+    _FakeTv.requests = []
+    entity = TmdbEntity(imdb_id="tt1", tmdb_id=1)
+    self.assertEqual(entity.get_number_of_seasons(), 4)
+    self.assertEqual(set(self.requested_seasons()) & {1, 2, 3, 4}, {4})
+    self.assertEqual(entity.get_season_runtime_mins(4), 30)
+
+  def test_cached_seasons_beyond_current_count_are_dropped(self):
+    TmdbEntity(imdb_id="tt1", tmdb_id=1)
+    self.cache.delete("tv/1/info")
+    _FakeTv.number_of_seasons = 2
+    entity = TmdbEntity(imdb_id="tt1", tmdb_id=1)
+    self.assertEqual(entity.get_number_of_seasons(), 2)
+    with self.assertRaises(ValueError):
+      entity.get_season_air_date(3)
+
+
+class _FakeChanges():
+  """Stands in for tmdbsimple.Changes, serving changed_ids for any range."""
+  changed_ids = []
+  requests = []
+
+  def tv(self, start_date: str, end_date: str, page: int):
+    _FakeChanges.requests.append((start_date, end_date, page))
+    return {
+        "results": [{
+            "id": tmdb_id
+        } for tmdb_id in _FakeChanges.changed_ids],
+        "page": page,
+        "total_pages": 1
+    }
+
+
+class TmdbChangeFeedChecks(TestCase):
+
+  def setUp(self):
+    configure_tmdb_cache(cache_dir=tempfile.mkdtemp())
+    _FakeChanges.changed_ids = []
+    _FakeChanges.requests = []
+    patches = [
+        mock.patch.object(tmdbhelpers.tmdb, "Changes", _FakeChanges),
+        mock.patch.dict(os.environ, {"TMDB_API_KEY": "test-key"})
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+
+  def run_feed(self,
+               run_date: str,
+               last_fetch_dates: dict,
+               failed_tmdb_ids: set = set()) -> dict:
+    """Run the change feed the way the updater does for shows that are due,
+    and return whether each of them changed. The updates of failed_tmdb_ids
+    fail, the others succeed."""
+    feed = TmdbChangeFeed(run_date=run_date)
+    feed.fetch(
+        min([
+            feed.get_checked_date(tmdb_id, last_fetch_date)
+            for tmdb_id, last_fetch_date in last_fetch_dates.items()
+        ],
+            default=""))
+    changed = {
+        tmdb_id: feed.has_changed(tmdb_id, last_fetch_date)
+        for tmdb_id, last_fetch_date in last_fetch_dates.items()
+    }
+    for tmdb_id in last_fetch_dates:
+      if tmdb_id not in failed_tmdb_ids:
+        feed.record_checked(tmdb_id)
+    return changed
+
+  def test_nightly_run_skips_unchanged_shows(self):
+    # Runs every night, the show was imported 3 days ago and is due again.
+    self.run_feed("2026-10-15", {})
+    self.run_feed("2026-10-16", {})
+    changed = self.run_feed("2026-10-17", {1: "2026-10-14", 2: "2026-10-14"})
+    self.assertEqual(changed, {1: False, 2: False})
+    self.assertEqual(_FakeChanges.requests,
+                     [("2026-10-14", "2026-10-17", 1)])
+
+  def test_changed_shows_are_refetched(self):
+    _FakeChanges.changed_ids = [2]
+    changed = self.run_feed("2026-10-17", {1: "2026-10-14", 2: "2026-10-14"})
+    self.assertEqual(changed, {1: False, 2: True})
+
+  def test_unchanged_show_keeps_being_skipped(self):
+    # A show built from the cache keeps its old import date, the check of
+    # the previous run is used instead.
+    checked_date = "2026-10-14"
+    for day in range(17, 27):
+      run_date = "2026-10-" + str(day)
+      self.assertEqual(self.run_feed(run_date, {1: "2026-10-14"}), {1: False})
+      self.assertEqual(_FakeChanges.requests[-1][:2], (checked_date, run_date))
+      checked_date = run_date
+
+  def test_failed_update_is_not_remembered_as_checked(self):
+    self.run_feed("2026-10-17", {1: "2026-10-14"}, failed_tmdb_ids={1})
+    feed = TmdbChangeFeed(run_date="2026-10-18")
+    self.assertEqual(feed.get_checked_date(1, "2026-10-14"), "2026-10-14")
+    self.run_feed("2026-10-18", {1: "2026-10-14"})
+    self.assertEqual(feed.get_checked_date(1, "2026-10-14"), "2026-10-18")
+
+  def test_changed_show_is_not_remembered_as_checked(self):
+    _FakeChanges.changed_ids = [1]
+    self.run_feed("2026-10-17", {1: "2026-10-14"})
+    feed = TmdbChangeFeed(run_date="2026-10-18")
+    self.assertEqual(feed.get_checked_date(1, "2026-10-14"), "2026-10-14")
+
+  def test_old_imports_are_refetched(self):
+    changed = self.run_feed("2026-10-17", {1: "2026-09-01", 2: "2026-10-14"})
+    self.assertEqual(changed, {1: True, 2: False})
+    # The change list only reaches back 14 days.
+    self.assertEqual(_FakeChanges.requests[-1][0], "2026-10-03")
+
+  def test_no_due_shows_fetches_nothing(self):
+    feed = TmdbChangeFeed(run_date="2026-10-17")
+    self.assertFalse(feed.fetch(""))
+    self.assertTrue(feed.has_changed(1, "2026-10-14"))
+    self.assertEqual(_FakeChanges.requests, [])
@@ -0,0 +1,51 @@
+from datetime import date
+
+# Weighted rating pulls shows with few votes towards kWeightedRatingMeanVote,
+# so that a 10.0 from 2 votes doesn't outrank an 8.5 from 2000 votes.
+kWeightedRatingMinVotes = 50
+kWeightedRatingMeanVote = 6.5
+
+############################### Scoring Functions ##############################
+
+
+def score_by_vote_average(result: dict) -> float:
+  return result.get("vote_average") or 0.0
+
+
+def score_by_weighted_rating(result: dict) -> float:
+  votes = result.get("vote_count") or 0
+  return (votes * score_by_vote_average(result) + kWeightedRatingMinVotes *
+          kWeightedRatingMeanVote) / (votes + kWeightedRatingMinVotes)
+
+
+def score_by_popularity(result: dict) -> float:
+  return result.get("popularity") or 0.0
+
+
+kRankingScorers = {
+    "vote_average": score_by_vote_average,
+    "weighted_rating": score_by_weighted_rating,
+    "popularity": score_by_popularity,
+}
+
+################################ API Functions #################################
+
+
+def rank_key(result: dict, scorer=score_by_vote_average) -> tuple:
+  """Sort key for a TMDB search result: highest score first, then latest
+  first_air_date first. Results without a (valid) first_air_date go last
+  among results with the same score."""
+  try:
+    air_date = -date.fromisoformat(result.get("first_air_date")
+                                   or "").toordinal()
+    missing_air_date = 0
+  except (TypeError, ValueError):
+    # Missing, malformed or not a string at all.
+    air_date = 0
+    missing_air_date = 1
+  return (-scorer(result), missing_air_date, air_date)
+
+
+def rank_results(results: list, scorer=score_by_vote_average) -> list:
+  """Return results ranked by rank_key, in a single sort."""
+  return sorted(results, key=lambda result: rank_key(result, scorer))
@@ -0,0 +1,91 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tmdbranking import rank_key
+from tmdbranking import rank_results
+from tmdbranking import score_by_popularity
+from tmdbranking import score_by_weighted_rating
+from unittest import TestCase
+
+
+def _result(name: str, vote_average=7.0, first_air_date="2010-01-01", **kw):
+  result = {
+      "name": name,
+      "vote_average": vote_average,
+      "first_air_date": first_air_date
+  }
+  result.update(kw)
+  return result
+
+
+def _names(results: list) -> list:
+  return [result["name"] for result in results]
+
+
+class RankKey(TestCase):
+
+  def test_higher_score_first(self):
+    self.assertLess(rank_key(_result("a", 8.0)), rank_key(_result("b", 7.0)))
+
+  def test_later_air_date_first_on_ties(self):
+    self.assertLess(rank_key(_result("a", first_air_date="2015-06-01")),
+                    rank_key(_result("b", first_air_date="2001-06-01")))
+
+  def test_missing_air_date_last_on_ties(self):
+    dated = rank_key(_result("a", first_air_date="1960-01-01"))
+    for missing in [None, ""]:
+      self.assertLess(dated, rank_key(_result("b", first_air_date=missing)))
+    self.assertLess(dated, rank_key({"name": "c", "vote_average": 7.0}))
+
+  def test_malformed_air_date_treated_as_missing(self):
+    missing = rank_key(_result("a", first_air_date=None))
+    for malformed in ["2010-13-45", "soon", "2010", 2010, ["2010-01-01"]]:
+      self.assertEqual(rank_key(_result("b", first_air_date=malformed)),
+                       missing)
+
+  def test_missing_score_ranks_as_zero(self):
+    self.assertEqual(rank_key(_result("a", vote_average=None)),
+                     rank_key(_result("a", vote_average=0.0)))
+
+  def test_custom_scorer(self):
+    popular = _result("a", 5.0, popularity=90.0)
+    rated = _result("b", 9.0, popularity=10.0)
+    self.assertLess(rank_key(popular, score_by_popularity),
+                    rank_key(rated, score_by_popularity))
+
+  def test_weighted_rating_discounts_few_votes(self):
+    few_votes = _result("a", 10.0, vote_count=2)
+    many_votes = _result("b", 8.5, vote_count=2000)
+    self.assertLess(rank_key(many_votes, score_by_weighted_rating),
+                    rank_key(few_votes, score_by_weighted_rating))
+
+
+class RankResults(TestCase):
+
+  def setUp(self):
+    self.results = [
+        _result("old", 8.0, "1999-01-01"),
+        _result("undated", 8.0, None),
+        _result("low", 6.0, "2020-01-01"),
+        _result("best", 9.0, "bad date"),
+        _result("new", 8.0, "2021-01-01"),
+    ]
+
+  def test_full_ranking(self):
+    self.assertEqual(_names(rank_results(self.results)),
+                     ["best", "new", "old", "undated", "low"])
+
+  def test_custom_scorer_ranking(self):
+    results = [
+        _result("rated", 9.0, popularity=10.0),
+        _result("popular", 5.0, popularity=90.0)
+    ]
+    self.assertEqual(_names(rank_results(results, score_by_popularity)),
+                     ["popular", "rated"])
+
+  def test_does_not_modify_input(self):
+    before = list(self.results)
+    rank_results(self.results)
+    self.assertEqual(self.results, before)
@@ -5,172 +5,334 @@ import sys
 current_directory = os.path.dirname(os.path.abspath(__file__))
 tmdb_module_directory = os.path.join(current_directory, "tmdb")
 notion_module_directory = os.path.join(current_directory, "notionhelpers")
+metrics_module_directory = os.path.join(current_directory, "metrics")
 
 # Add the directory to the system path
 sys.path.append(tmdb_module_directory)
 sys.path.append(notion_module_directory)
+sys.path.append(metrics_module_directory)
 
-from datetime import datetime
-from notion_client import Client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from notion_client import AsyncClient, Client
 from notionhelpers import ColumnType
+from notionhelpers import configure_notion_client
+from notionhelpers import get_notion_client
+from notionhelpers import kNotionMaxFilterConditions
 from notionhelpers import notion_database_query_all
+from notionhelpers import NotionChangeSet
 from notionhelpers import NotionRow
+from notionhelpers import get_notion_write_stats
+from notionhelpers import was_not_applied
+from notionmirror import NotionDatabaseMirror
+from notionmirror import mirror_write_listener
+from runmetrics import RunMetrics
+from runmetrics import bind_run_metrics
+from runmetrics import use_run_metrics
+from runjournal import RunJournal
+from tmdbhelpers import AsyncTmdbClient
+from tmdbhelpers import configure_tmdb_session
+from tmdbhelpers import kMaxEntityFetchWorkers
+from tmdbhelpers import TmdbChangeFeed
 from tmdbhelpers import TmdbEntity
+from tmdbhelpers import get_cached_tmdb_id
 from tmdbhelpers import TmdbSearcher
 from tmdbhelpers import kDefaultTimezone
-from pprint import pprint
+from tmdbhelpers import get_tmdb_cache
+from tmdbranking import rank_results
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import queue
+
+logger = logging.getLogger(__name__)
 
 kAutomateUpdateIntervalDays = 3
+kLogFormat = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+kDefaultMaxWorkers = 1
+# Upper bound on concurrent season writes for a single show. Calls are still
+# paced by the shared Notion scheduler.
+kMaxSeasonWriteWorkers = 4
+# Properties of the Shows/Watchlist and Seasons DB rows that the updater reads
+# or writes. Rows loaded from Notion only keep these.
+kShowRowProperties = {
+    "IMDB ID", "Original Title", "Tagline", "Plot", "Backdrop", "Release Date",
+    "Status", "Type", "Content Rating (US)", "Cast", "Creators",
+    "Production Companies", "Networks", "Watch Providers (US)", "Countries",
+    "Languages", "Genres", "Keywords", "Number of Seasons", "TMDB Rating",
+    "Shows DB Reference", "[IMPORT] Next Import Hint",
+    "[IMPORT] Last Import Date", "[IMPORT] Errors"
+}
+kSeasonRowProperties = {
+    "Season Index", "Show", "Air Date", "Finale Date", "Overview",
+    "Number of Episodes", "Total Runtime (mins)", "Per Episode Runtimes (mins)",
+    "Backdrop", "Watch Status", "[IMPORT] Last Import Date"
+}
+
+
+_log_listener = None
+
+
+def _stop_log_listener():
+  """Flush the queued log records and stop the background thread."""
+  global _log_listener
+  if _log_listener != None:
+    _log_listener.stop()
+    _log_listener = None
+
+
+atexit.register(_stop_log_listener)
+
+
+def configure_logging(level: str = "", queued: bool = True):
+  """Log to stdout at the given level, or LOG_LEVEL (default INFO). Per-row
+  and per-field messages are DEBUG. With queued, records are written by a
+  background thread, so a slow stdout never blocks the update workers."""
+  global _log_listener
+  _stop_log_listener()
+  handler = logging.StreamHandler(sys.stdout)
+  handler.setFormatter(logging.Formatter(kLogFormat))
+  root = logging.getLogger()
+  for old_handler in list(root.handlers):
+    root.removeHandler(old_handler)
+  root.setLevel((level or os.environ.get("LOG_LEVEL", "INFO")).upper())
+  if queued:
+    log_queue = queue.SimpleQueue()
+    root.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, handler)
+    _log_listener.start()
+  else:
+    root.addHandler(handler)
+
+
+def configure_connection_pools(max_workers: int):
+  """Size the shared Notion and TMDB connection pools for max_workers shows
+  being updated at once. Call once at startup, before any requests."""
+  configure_notion_client(max_connections=max_workers * kMaxSeasonWriteWorkers)
+  configure_tmdb_session(max_connections=max_workers * kMaxEntityFetchWorkers)
+
+
+def sort_search_results(results: list) -> list:
+  # sort results by vote average and then latest air date first
+  return rank_results(results)
 
 
 def search_from_tmdb(query: str):
   searcher = TmdbSearcher(query)
-  # sort results by vote average (outer sort) and then air date (inner sort)
-  latest_first = sorted(searcher.fetch_results(),
-                        key=lambda d: d["first_air_date"])
-  latest_first.reverse()
-  return sorted(latest_first, key=lambda d: 0 - d["vote_average"])
+  return sort_search_results(searcher.fetch_results())
+
+
+def search_from_tmdb_iter(query: str):
+  """Yield the search results page by page, each page sorted like
+  search_from_tmdb."""
+  searcher = TmdbSearcher(query)
+  for page_results in searcher.fetch_results_iter():
+    yield sort_search_results(page_results)
+
+
+async def search_from_tmdb_async(query: str, tmdb_client: AsyncTmdbClient):
+  """Async version of search_from_tmdb."""
+  return sort_search_results(await tmdb_client.search_tv(query))
+
+
+async def search_from_tmdb_async_iter(query: str,
+                                      tmdb_client: AsyncTmdbClient):
+  """Async version of search_from_tmdb_iter."""
+  async for page_results in tmdb_client.search_tv_iter(query):
+    yield sort_search_results(page_results)
+
+
+def _sanitize_multi_select_list(words: list) -> list:
+  clean_list = []
+  for word in words:
+    clean_list.append(word.replace(",", ""))
+  return clean_list
+
+
+def _fill_show_notion_row(show: NotionRow, tmdb: TmdbEntity):
+  """Set every show field to its value from TMDB. Fields that are missing (on
+  a new row) are created, so the row can be created in a single call."""
+  show.update_value(ColumnType.RICH_TEXT, "Original Title",
+                    tmdb.get_original_title())
+  show.update_value(ColumnType.RICH_TEXT, "Tagline", tmdb.get_tagline())
+  show.update_value(ColumnType.RICH_TEXT, "Plot", tmdb.get_plot())
+
+  if tmdb.get_backdrop_path_url():
+    show.update_value(ColumnType.FILES,
+                      "Backdrop",
+                      tmdb.get_backdrop_path_url(),
+                      title=tmdb.get_title())
+
+  show_release_date = tmdb.get_release_date()
+  if show_release_date != None:
+    show.update_value(ColumnType.DATE, "Release Date", show_release_date)
+
+  show.update_value(ColumnType.SELECT, "Status", tmdb.get_status())
+  show.update_value(ColumnType.SELECT, "Type", tmdb.get_type())
+
+  if tmdb.get_content_rating():
+    show.update_value(ColumnType.SELECT, "Content Rating (US)",
+                      tmdb.get_content_rating())
+
+  show.update_value(ColumnType.MULTI_SELECT, "Cast",
+                    _sanitize_multi_select_list(tmdb.get_cast()))
+  show.update_value(ColumnType.MULTI_SELECT, "Creators",
+                    _sanitize_multi_select_list(tmdb.get_creators()))
+  show.update_value(
+      ColumnType.MULTI_SELECT, "Production Companies",
+      _sanitize_multi_select_list(tmdb.get_production_companies()))
+  show.update_value(ColumnType.MULTI_SELECT, "Networks",
+                    _sanitize_multi_select_list(tmdb.get_networks()))
+  show.update_value(ColumnType.MULTI_SELECT, "Watch Providers (US)",
+                    _sanitize_multi_select_list(tmdb.get_watch_providers()))
+  show.update_value(ColumnType.MULTI_SELECT, "Countries",
+                    tmdb.get_countries())
+  show.update_value(ColumnType.MULTI_SELECT, "Languages",
+                    tmdb.get_languages())
+  show.update_value(ColumnType.MULTI_SELECT, "Genres", tmdb.get_genres())
+  show.update_value(ColumnType.MULTI_SELECT, "Keywords",
+                    _sanitize_multi_select_list(tmdb.get_keywords()))
+
+  show.update_value(ColumnType.NUMBER, "Number of Seasons",
+                    tmdb.get_number_of_seasons())
+  show.update_value(ColumnType.NUMBER, "TMDB Rating", tmdb.get_tmdb_rating())
+
+  show.update_value(ColumnType.DATE, "[IMPORT] Last Import Date",
+                    tmdb.get_import_date())
+  # A new row has no errors to clear.
+  if show.get_id():
+    show.clear_value(ColumnType.RICH_TEXT, "[IMPORT] Errors")
+
+
+class SeasonIndex():
+  """Seasons DB rows keyed by (show page ID, season number).
+
+  Keys are parsed straight from the raw rows, and a (compact) NotionRow is
+  only built for the seasons of the shows that are indexed.
+  """
+  __rows: dict
+
+  def __init__(self, season_rows: list, show_ids: set = None):
+    """Index season_rows (as returned by the Notion API). If show_ids is set,
+    seasons of other shows are skipped. Rows without a show or a season number
+    are skipped, and of rows with the same key the last one is kept."""
+    self.__rows = {}
+    for row in season_rows:
+      if row.get("archived") or row.get("in_trash"):
+        continue
+      key = self.__parse_key(row["properties"])
+      if key == None or (show_ids != None and not key[0] in show_ids):
+        continue
+      self.__rows[key] = NotionRow(row["id"],
+                                   row["properties"],
+                                   keep=kSeasonRowProperties)
+
+  ############################## Helper Functions ##############################
+
+  def __parse_key(self, properties: dict):
+    relation = properties["Show"].get("relation")
+    if not relation:
+      return None
+    title = properties["Season Index"].get("title")
+    if not title:
+      return None
+    # title looks like "Season 3"
+    words = title[0]["plain_text"].split(" ")
+    if len(words) != 2 or not words[1].isdigit():
+      return None
+    return (relation[0]["id"], int(words[1]))
+
+  ################################ API Functions ###############################
+
+  def __len__(self) -> int:
+    return len(self.__rows)
+
+  def get_row(self, show_id: str, season_number: int) -> NotionRow:
+    """Return the row of the season, or None if it doesn't exist yet."""
+    return self.__rows.get((show_id, season_number))
 
 
 class AddFromTmdb():
   __notion: Client
+  __async_notion: AsyncClient
   __tmdb_id: str
   __is_watchlist: bool
   __tmdb_entity: TmdbEntity
   __entity_available: bool
   __error_message: str
 
-  def __init__(self, tmdb_id: str = "", is_watchlist: bool = False):
-    self.__notion = Client(auth=os.environ["NOTION_TOKEN"])
+  def __init__(self,
+               tmdb_id: str = "",
+               is_watchlist: bool = False,
+               fetch_entity: bool = True,
+               async_notion: AsyncClient = None):
+    """With async_notion, the row is created through it (see
+    create_show_notion_row_async) and no sync client is made."""
+    self.__notion = get_notion_client() if async_notion == None else None
+    self.__async_notion = async_notion
     self.__tmdb_id = tmdb_id
     self.__is_watchlist = is_watchlist
     self.__entity_available = False
     self.__error_message = ""
 
+    if not fetch_entity:
+      return
     try:
       self.__tmdb_entity = TmdbEntity(tmdb_id=tmdb_id, force_update_cache=True)
       self.__entity_available = True
     except Exception as e:
-      pprint("Could not fetch TMDB Entity for TMDB ID: " + tmdb_id)
-      pprint("Exception: " + str(e))
-      self.__error_message = str(e)
+      self.__on_entity_error(e)
+
+  @classmethod
+  async def fetch_async(cls, tmdb_id: str, is_watchlist: bool,
+                        tmdb_client: AsyncTmdbClient, notion: AsyncClient):
+    """Async version of the constructor, fetches the entity without blocking.
+    The row is then created through notion."""
+    add_from_tmdb = cls(tmdb_id=tmdb_id,
+                        is_watchlist=is_watchlist,
+                        fetch_entity=False,
+                        async_notion=notion)
+    try:
+      add_from_tmdb.__tmdb_entity = await tmdb_client.fetch_entity(tmdb_id)
+      add_from_tmdb.__entity_available = True
+    except Exception as e:
+      add_from_tmdb.__on_entity_error(e)
+    return add_from_tmdb
 
   ############################## Helper Functions ##############################
 
-  def __sanitize_multi_select_list(self, words: list) -> list:
-    clean_list = []
-    for word in words:
-      clean_list.append(word.replace(",", ""))
-    return clean_list
+  def __on_entity_error(self, e: Exception):
+    logger.warning("Could not fetch TMDB Entity for TMDB ID %s: %s",
+                   self.__tmdb_id, e)
+    self.__error_message = str(e)
 
-  def __update_notion_row_with_error(self, imdb_id: str, error_msg: str,
-                                     row_id: str):
-    pprint(">>>> Updating Notion row WITH ERRORS for show with IMDB ID: " +
-           imdb_id)
-    new_row = NotionRow(row_id, {
-        "[IMPORT] Errors": {},
-        "[IMPORT] Last Import Date": {}
-    })
-    new_row.set_client(self.__notion)
+  def __notion_row_with_error(self, imdb_id: str, error_msg: str,
+                              row_id: str) -> NotionRow:
+    logger.warning("Updating Notion row WITH ERRORS for show with IMDB ID: %s",
+                   imdb_id)
+    new_row = NotionRow(row_id, {})
     new_row.update_value(ColumnType.RICH_TEXT, "[IMPORT] Errors", error_msg)
     new_row.update_value(
         ColumnType.DATE, "[IMPORT] Last Import Date",
         datetime.today().astimezone(kDefaultTimezone).strftime('%Y-%m-%d'))
-    new_row.update_db_row()
-
-  def __update_show_notion_row(self, show: NotionRow) -> str:
-    pprint(">>>> Updating Notion row for show with IMDB ID: " +
-           self.__tmdb_entity.get_imdb_id())
-
-    show.update_value(ColumnType.RICH_TEXT, "Original Title",
-                      self.__tmdb_entity.get_original_title())
-    show.update_value(ColumnType.RICH_TEXT, "Tagline",
-                      self.__tmdb_entity.get_tagline())
-    show.update_value(ColumnType.RICH_TEXT, "Plot",
-                      self.__tmdb_entity.get_plot())
-
-    if self.__tmdb_entity.get_backdrop_path_url():
-      show.update_value(ColumnType.FILES,
-                        "Backdrop",
-                        self.__tmdb_entity.get_backdrop_path_url(),
-                        title=self.__tmdb_entity.get_title())
-
-    show_release_date = self.__tmdb_entity.get_release_date()
-    if show_release_date != None:
-      show.update_value(ColumnType.DATE, "Release Date", show_release_date)
-
-    show.update_value(ColumnType.SELECT, "Status",
-                      self.__tmdb_entity.get_status())
-    show.update_value(ColumnType.SELECT, "Type", self.__tmdb_entity.get_type())
-
-    if self.__tmdb_entity.get_content_rating():
-      show.update_value(ColumnType.SELECT, "Content Rating (US)",
-                        self.__tmdb_entity.get_content_rating())
-
-    show.update_value(
-        ColumnType.MULTI_SELECT, "Cast",
-        self.__sanitize_multi_select_list(self.__tmdb_entity.get_cast()))
-    show.update_value(
-        ColumnType.MULTI_SELECT, "Creators",
-        self.__sanitize_multi_select_list(self.__tmdb_entity.get_creators()))
-    show.update_value(
-        ColumnType.MULTI_SELECT, "Production Companies",
-        self.__sanitize_multi_select_list(
-            self.__tmdb_entity.get_production_companies()))
-    show.update_value(
-        ColumnType.MULTI_SELECT, "Networks",
-        self.__sanitize_multi_select_list(self.__tmdb_entity.get_networks()))
-    show.update_value(
-        ColumnType.MULTI_SELECT, "Watch Providers (US)",
-        self.__sanitize_multi_select_list(
-            self.__tmdb_entity.get_watch_providers()))
-    show.update_value(ColumnType.MULTI_SELECT, "Countries",
-                      self.__tmdb_entity.get_countries())
-    show.update_value(ColumnType.MULTI_SELECT, "Languages",
-                      self.__tmdb_entity.get_languages())
-    show.update_value(ColumnType.MULTI_SELECT, "Genres",
-                      self.__tmdb_entity.get_genres())
-    show.update_value(
-        ColumnType.MULTI_SELECT, "Keywords",
-        self.__sanitize_multi_select_list(self.__tmdb_entity.get_keywords()))
-
-    show.update_value(ColumnType.NUMBER, "Number of Seasons",
-                      self.__tmdb_entity.get_number_of_seasons())
-    show.update_value(ColumnType.NUMBER, "TMDB Rating",
-                      self.__tmdb_entity.get_tmdb_rating())
-
-    show.update_value(ColumnType.DATE, "[IMPORT] Last Import Date",
-                      self.__tmdb_entity.get_import_date())
-
-    show.clear_value(ColumnType.RICH_TEXT, "[IMPORT] Errors")
-    if show.update_db_row():
-      self.__update_notion_row_with_error(self.__tmdb_entity.get_imdb_id(),
-                                          show.get_update_errors(),
-                                          show.get_id())
-    return show.get_update_errors()
+    return new_row
 
-  ################################ API Functions ###############################
-
-  def get_error_message(self):
-    return self.__error_message
-
-  def get_entity(self):
-    return self.__tmdb_entity
-
-  def get_imdb_id(self):
-    return self.__tmdb_entity.get_imdb_id()
+  def __update_notion_row_with_error(self, imdb_id: str, error_msg: str,
+                                     row_id: str):
+    new_row = self.__notion_row_with_error(imdb_id, error_msg, row_id)
+    new_row.set_client(self.__notion)
+    new_row.update_db_row()
 
-  def create_show_notion_row(self):
+  def __new_show_notion_row(self) -> NotionRow:
     # TODO: Add a lookup to check if this IMDB ID already exists
     if not self.__entity_available:
       raise ValueError("Entity is unavailable for TMDB ID: " + self.__tmdb_id)
     show = NotionRow("", {})
-    show.set_client(self.__notion)
     title = self.__tmdb_entity.get_title()
     imdb_id = self.__tmdb_entity.get_imdb_id()
 
-    pprint(">> Creating Notion row for show " + title + " with IMDB ID: " +
-           self.__tmdb_entity.get_imdb_id())
+    logger.info("Creating Notion row for show %s with IMDB ID: %s", title,
+                self.__tmdb_entity.get_imdb_id())
     show.create_field(ColumnType.TITLE, "Title", title)
     show.create_field(ColumnType.RICH_TEXT, "IMDB ID", [imdb_id])
     show.create_field(ColumnType.SELECT, "[IMPORT] Next Import Hint",
@@ -178,24 +340,75 @@ class AddFromTmdb():
     show.create_field(
         ColumnType.DATE, "Date Added",
         datetime.today().astimezone(kDefaultTimezone).strftime('%Y-%m-%d'))
-    # TODO: create other fields, will need notion functions
+    return show
+
+  def __check_basic_row_allowed(self, show: NotionRow):
+    # A create that failed in other ways (e.g. timed out) may still have added
+    # the row, and creating the basic row too would add it twice.
+    if not was_not_applied(show.get_write_error()):
+      raise RuntimeError("The row may or may not have been created: " +
+                         show.get_update_errors())
 
+  def __show_database_id_and_icon(self):
     db = os.environ["SHOWS_DB"]
     icon = "https://www.notion.so/icons/movie-clapboard-play_orange.svg"
     if self.__is_watchlist:
       db = os.environ["FUTURE_SHOWS_DB"]
       icon = "https://www.notion.so/icons/movie-clapboard-play_blue.svg"
+    return db, {"type": "external", "external": {"url": icon}}
 
-    show.create_new_db_row(db,
-                           icon={
-                               "type": "external",
-                               "external": {
-                                   "url": icon
-                               }
-                           })
+  ################################ API Functions ###############################
 
-    # Update the row right away to fill in all available data
-    self.__update_show_notion_row(show)
+  def get_error_message(self):
+    return self.__error_message
+
+  def get_entity(self):
+    return self.__tmdb_entity
+
+  def get_imdb_id(self):
+    return self.__tmdb_entity.get_imdb_id()
+
+  def create_show_notion_row(self):
+    """Create the row with every field filled in, in a single call. If Notion
+    rejects that, create a row with just the basic fields and record the
+    error. Raises if the row could not be created, or if it is unknown whether
+    it was."""
+    show = self.__new_show_notion_row()
+    _fill_show_notion_row(show, self.__tmdb_entity)
+    show.set_client(self.__notion)
+    db, icon = self.__show_database_id_and_icon()
+    if show.create_new_db_row(db, icon=icon):
+      return
+
+    self.__check_basic_row_allowed(show)
+    basic_show = self.__new_show_notion_row()
+    basic_show.set_client(self.__notion)
+    if not basic_show.create_new_db_row(db, icon=icon):
+      raise RuntimeError(basic_show.get_update_errors())
+    self.__update_notion_row_with_error(self.__tmdb_entity.get_imdb_id(),
+                                        show.get_update_errors(),
+                                        basic_show.get_id())
+
+  async def create_show_notion_row_async(self):
+    """Async version of create_show_notion_row, using the async client."""
+    notion = self.__async_notion
+    show = self.__new_show_notion_row()
+    _fill_show_notion_row(show, self.__tmdb_entity)
+    show.set_async_client(notion)
+    db, icon = self.__show_database_id_and_icon()
+    if await show.create_new_db_row_async(db, icon=icon):
+      return
+
+    self.__check_basic_row_allowed(show)
+    basic_show = self.__new_show_notion_row()
+    basic_show.set_async_client(notion)
+    if not await basic_show.create_new_db_row_async(db, icon=icon):
+      raise RuntimeError(basic_show.get_update_errors())
+    error_row = self.__notion_row_with_error(self.__tmdb_entity.get_imdb_id(),
+                                             show.get_update_errors(),
+                                             basic_show.get_id())
+    error_row.set_async_client(notion)
+    await error_row.update_db_row_async()
 
 
 class UpdateFromTmdb():
@@ -205,138 +418,264 @@ class UpdateFromTmdb():
   __input_imdb_ids: list
   __imdb_to_show: dict
   __show_id_to_imdb: dict
+  __season_index: SeasonIndex
   __is_watchlist: bool
-
-  def __init__(self, imdb_ids: list = [], is_watchlist: bool = False):
-    # TODO: Maybe we need multiple clients for better bandwidth?
-    self.__notion = Client(auth=os.environ["NOTION_TOKEN"])
+  __max_workers: int
+  __change_feed: TmdbChangeFeed
+  __metrics: RunMetrics
+  __change_set: NotionChangeSet
+  __use_mirror: bool
+  __resume: bool
+  __journal: RunJournal
+  __on_written = None
+  __progress_callback = None
+
+  def __init__(self,
+               imdb_ids: list = [],
+               is_watchlist: bool = False,
+               max_workers: int = kDefaultMaxWorkers,
+               use_mirror: bool = True,
+               change_set: NotionChangeSet = None,
+               resume: bool = False,
+               metrics: RunMetrics = None):
+    """max_workers bounds how many shows are updated at once. Each show is
+    still updated in order (show row before its seasons). With use_mirror, the
+    databases are read from a local mirror that only downloads changed rows,
+    otherwise only the rows needed for this run are queried from Notion.
+
+    With a change_set, the run is a dry run: TMDB data is only read from the
+    cache, and the writes are planned into change_set instead of being sent
+    (see NotionChangeSet.apply). Shows that are not cached are skipped.
+
+    Runs over the whole library keep a RunJournal of the rows they write. With
+    resume, an interrupted run is picked up from its journal: shows that
+    finished are skipped, and only the failed or pending ones are updated.
+    The journal is opened (and the databases loaded) when the update starts,
+    which raises RunInProgressError if another run over the whole library
+    (e.g. a server job and the nightly run) is still going.
+
+    Each run records into its own RunMetrics (or into metrics, if given) and
+    reports them when it is done, so runs that overlap (e.g. server jobs) keep
+    separate counts."""
+    if max_workers < 1:
+      raise ValueError("max_workers must be at least 1, got: " +
+                       str(max_workers))
+    self.__notion = get_notion_client()
     self.__is_watchlist = is_watchlist
-
-    if not is_watchlist:
-      pprint("Fetching all shows...")
-      self.__shows_db = notion_database_query_all(self.__notion,
-                                                  os.environ["SHOWS_DB"])
-      pprint("Fetching all seasons...")
-      self.__seasons_db = notion_database_query_all(self.__notion,
-                                                    os.environ["SEASONS_DB"])
-    else:
-      pprint("Fetching watchlist...")
-      self.__shows_db = notion_database_query_all(self.__notion,
-                                                  os.environ["FUTURE_SHOWS_DB"])
+    self.__max_workers = max_workers
+    if resume and (imdb_ids or change_set != None):
+      raise ValueError("Only runs over the whole library can be resumed")
+    self.__change_set = change_set
+    self.__metrics = metrics or RunMetrics()
 
     self.__input_imdb_ids = imdb_ids
+    self.__use_mirror = use_mirror
+    self.__resume = resume
+    self.__journal = None
     self.__imdb_to_show = {}
     self.__show_id_to_imdb = {}
+    self.__change_feed = TmdbChangeFeed()
 
   ############################## Helper Functions ##############################
 
-  def __sanitize_multi_select_list(self, words: list) -> list:
-    clean_list = []
-    for word in words:
-      clean_list.append(word.replace(",", ""))
-    return clean_list
+  ########################### Notion Query Functions ###########################
+
+  def __load_from_mirror(self):
+    # The rows this run writes or archives are stored back in the mirrors.
+    mirrors = []
+    if not self.__is_watchlist:
+      logger.info("Syncing shows...")
+      mirrors.append(
+          NotionDatabaseMirror(self.__notion, os.environ["SHOWS_DB"]))
+      self.__shows_db = mirrors[-1].query_all()
+      logger.info("Syncing seasons...")
+      mirrors.append(
+          NotionDatabaseMirror(self.__notion, os.environ["SEASONS_DB"]))
+      self.__seasons_db = mirrors[-1].query_all()
+    else:
+      logger.info("Syncing watchlist...")
+      mirrors.append(
+          NotionDatabaseMirror(self.__notion, os.environ["FUTURE_SHOWS_DB"]))
+      self.__shows_db = mirrors[-1].query_all()
+    self.__on_written = mirror_write_listener(mirrors)
+
+  def __load_from_queries(self):
+    # Only fetch the rows that can be updated in this run: the requested IMDB
+    # IDs, or else the shows that are due for an update (and watchlist rows
+    # that need to be deleted).
+    if self.__input_imdb_ids:
+      shows_filters = self.__imdb_id_filters(self.__input_imdb_ids)
+    else:
+      shows_filters = self.__due_show_filters()
+      # Interrupted shows may no longer look due, e.g. their import hint was
+      # already reset, so they are fetched by IMDB ID.
+      if self.__journal != None:
+        shows_filters += self.__imdb_id_filters(
+            self.__journal.get_retry_imdb_ids())
+
+    if not self.__is_watchlist:
+      logger.info("Fetching shows...")
+      self.__shows_db = self.__query_any_of(os.environ["SHOWS_DB"],
+                                            shows_filters)
+      logger.info("Fetching seasons for %d shows...",
+                  len(self.__shows_db["results"]))
+      self.__seasons_db = self.__query_any_of(
+          os.environ["SEASONS_DB"],
+          self.__show_relation_filters(self.__shows_db["results"]))
+    else:
+      if not self.__input_imdb_ids:
+        shows_filters.append({
+            "property": "Shows DB Reference",
+            "relation": {
+                "is_not_empty": True
+            }
+        })
+      logger.info("Fetching watchlist...")
+      self.__shows_db = self.__query_any_of(os.environ["FUTURE_SHOWS_DB"],
+                                            shows_filters)
+
+  def __query_any_of(self, database_id: str, filters: list) -> dict:
+    """Return the rows matching any of the filters. Filters are sent in chunks
+    to stay within Notion's limit on the size of compound filters."""
+    results = []
+    seen_ids = set()
+    for i in range(0, len(filters), kNotionMaxFilterConditions):
+      chunk = filters[i:i + kNotionMaxFilterConditions]
+      data = notion_database_query_all(self.__notion,
+                                       database_id,
+                                       filter={"or": chunk})
+      for row in data["results"]:
+        if row["id"] not in seen_ids:
+          seen_ids.add(row["id"])
+          results.append(row)
+    return {
+        "object": "list",
+        "results": results,
+        "next_cursor": None,
+        "has_more": False
+    }
+
+  def __imdb_id_filters(self, imdb_ids: list) -> list:
+    filters = []
+    for imdb_id in imdb_ids:
+      filters.append({"property": "IMDB ID", "rich_text": {"equals": imdb_id}})
+    return filters
+
+  def __due_show_filters(self) -> list:
+    """Server side version of the checks in __run_automated_update."""
+    last_due_date = (datetime.today().astimezone(kDefaultTimezone) -
+                     timedelta(days=kAutomateUpdateIntervalDays)).strftime(
+                         '%Y-%m-%d')
+    return [{
+        "property": "[IMPORT] Next Import Hint",
+        "select": {
+            "equals": "Update"
+        }
+    }, {
+        "property": "[IMPORT] Next Import Hint",
+        "select": {
+            "equals": "Force Update"
+        }
+    }, {
+        "property": "[IMPORT] Last Import Date",
+        "date": {
+            "is_empty": True
+        }
+    }, {
+        "and": [{
+            "property": "[IMPORT] Next Import Hint",
+            "select": {
+                "equals": "Automate"
+            }
+        }, {
+            "property": "[IMPORT] Last Import Date",
+            "date": {
+                "on_or_before": last_due_date
+            }
+        }]
+    }]
+
+  def __show_relation_filters(self, show_rows: list) -> list:
+    filters = []
+    for row in show_rows:
+      filters.append({"property": "Show", "relation": {"contains": row["id"]}})
+    return filters
+
+  ########################### Notion Write Functions ###########################
+  # In a dry run, writes are planned into the change set instead of sent.
+
+  def __write_row(self, row: NotionRow) -> str:
+    if self.__change_set != None:
+      self.__change_set.add_update(row)
+      return ""
+    row.set_on_written(self.__on_written)
+    return row.update_db_row()
+
+  def __create_row(self, row: NotionRow, database_id: str, icon: dict) -> str:
+    if self.__change_set != None:
+      self.__change_set.add_create(row, database_id, icon)
+      return ""
+    row.set_on_written(self.__on_written)
+    if not row.create_new_db_row(database_id, icon=icon):
+      return row.get_update_errors()
+    return ""
+
+  def __archive_row(self, row: NotionRow) -> str:
+    if self.__change_set != None:
+      self.__change_set.add_archive(row)
+      return ""
+    row.set_on_written(self.__on_written)
+    return row.delete_db_row()
 
   ########################## Notion Updater Functions ##########################
 
   def __update_notion_row_with_error(self, imdb_id: str, error_msg: str,
                                      row_id: str):
-    pprint(">>>> Updating Notion row WITH ERRORS for show with IMDB ID: " +
-           imdb_id)
-    new_row = NotionRow(row_id, {
-        "[IMPORT] Errors": {},
-        "[IMPORT] Last Import Date": {}
-    })
+    logger.warning("Updating Notion row WITH ERRORS for show with IMDB ID: %s",
+                   imdb_id)
+    new_row = NotionRow(row_id, {})
     new_row.set_client(self.__notion)
     new_row.update_value(ColumnType.RICH_TEXT, "[IMPORT] Errors", error_msg)
     new_row.update_value(
         ColumnType.DATE, "[IMPORT] Last Import Date",
         datetime.today().astimezone(kDefaultTimezone).strftime('%Y-%m-%d'))
-    new_row.update_db_row()
+    self.__write_row(new_row)
 
   def __update_show_notion_row(self, show: NotionRow, tmdb: TmdbEntity,
                                is_automated_update: bool) -> str:
-    pprint(">>>> Updating Notion row for show with IMDB ID: " +
-           tmdb.get_imdb_id())
-
-    show.update_value(ColumnType.RICH_TEXT, "Original Title",
-                      tmdb.get_original_title())
-    show.update_value(ColumnType.RICH_TEXT, "Tagline", tmdb.get_tagline())
-    show.update_value(ColumnType.RICH_TEXT, "Plot", tmdb.get_plot())
+    logger.info("Updating Notion row for show with IMDB ID: %s",
+                tmdb.get_imdb_id())
 
-    if tmdb.get_backdrop_path_url():
-      show.update_value(ColumnType.FILES,
-                        "Backdrop",
-                        tmdb.get_backdrop_path_url(),
-                        title=tmdb.get_title())
-
-    show_release_date = tmdb.get_release_date()
-    if show_release_date != None:
-      show.update_value(ColumnType.DATE, "Release Date", show_release_date)
-
-    show.update_value(ColumnType.SELECT, "Status", tmdb.get_status())
-    show.update_value(ColumnType.SELECT, "Type", tmdb.get_type())
-
-    if tmdb.get_content_rating():
-      show.update_value(ColumnType.SELECT, "Content Rating (US)",
-                        tmdb.get_content_rating())
-
-    show.update_value(ColumnType.MULTI_SELECT, "Cast",
-                      self.__sanitize_multi_select_list(tmdb.get_cast()))
-    show.update_value(ColumnType.MULTI_SELECT, "Creators",
-                      self.__sanitize_multi_select_list(tmdb.get_creators()))
-    show.update_value(
-        ColumnType.MULTI_SELECT, "Production Companies",
-        self.__sanitize_multi_select_list(tmdb.get_production_companies()))
-    show.update_value(ColumnType.MULTI_SELECT, "Networks",
-                      self.__sanitize_multi_select_list(tmdb.get_networks()))
-    show.update_value(
-        ColumnType.MULTI_SELECT, "Watch Providers (US)",
-        self.__sanitize_multi_select_list(tmdb.get_watch_providers()))
-    show.update_value(ColumnType.MULTI_SELECT, "Countries",
-                      tmdb.get_countries())
-    show.update_value(ColumnType.MULTI_SELECT, "Languages",
-                      tmdb.get_languages())
-    show.update_value(ColumnType.MULTI_SELECT, "Genres", tmdb.get_genres())
-    show.update_value(ColumnType.MULTI_SELECT, "Keywords",
-                      self.__sanitize_multi_select_list(tmdb.get_keywords()))
-
-    show.update_value(ColumnType.NUMBER, "Number of Seasons",
-                      tmdb.get_number_of_seasons())
-    show.update_value(ColumnType.NUMBER, "TMDB Rating", tmdb.get_tmdb_rating())
-
-    show.update_value(ColumnType.DATE, "[IMPORT] Last Import Date",
-                      tmdb.get_import_date())
+    _fill_show_notion_row(show, tmdb)
     # TODO: Ideally, this import hint update should be done after the seasons
     # are updated. Possible way to accomplish this is to update the show after
     # seasons.
     if not is_automated_update:
       show.update_value(ColumnType.SELECT, "[IMPORT] Next Import Hint",
                         "Check Status")
-    show.clear_value(ColumnType.RICH_TEXT, "[IMPORT] Errors")
-    if show.update_db_row():
+    if self.__write_row(show):
       self.__update_notion_row_with_error(tmdb.get_imdb_id(),
                                           show.get_update_errors(),
                                           show.get_id())
     return show.get_update_errors()
 
-  def __delete_show_notion_row(self, show: NotionRow, tmdb: TmdbEntity):
-    pprint(">>>> Deleting Notion row for show with IMDB ID: " +
-           tmdb.get_imdb_id())
-    show.delete_db_row()
-
-  def __update_season_notion_row(self,
-                                 show_id: str,
-                                 season: NotionRow,
-                                 tmdb: TmdbEntity,
-                                 set_unwatched: bool = False):
-    title = season.get_value(ColumnType.TITLE, "Season Index")[0]
-    season_number = int(title.split(" ")[1])  # title looks like "Season 3"
-    pprint(">> Updating Notion row for " + title + " for IMDB ID: " +
-           tmdb.get_imdb_id())
-
+  def __delete_show_notion_row(self, show: NotionRow, tmdb: TmdbEntity) -> str:
+    logger.info("Deleting Notion row for show with IMDB ID: %s",
+                tmdb.get_imdb_id())
+    return self.__archive_row(show)
+
+  def __fill_season_notion_row(self,
+                               show_id: str,
+                               season_number: int,
+                               season: NotionRow,
+                               tmdb: TmdbEntity,
+                               set_unwatched: bool = False):
+    """Set every season field to its value from TMDB. Fields that are missing
+    (on a new row) are created, so the row can be created in a single call."""
+    title = "Season " + str(season_number)
     season.update_value(ColumnType.RELATION,
                         "Show", [show_id],
-                        relation_db=self.__shows_db)
+                        relation_db=os.environ["SHOWS_DB"])
     season_air_date = tmdb.get_season_air_date(season_number)
     if season_air_date != None:
       season.update_value(ColumnType.DATE, "Air Date",
@@ -366,7 +705,13 @@ class UpdateFromTmdb():
 
     season.update_value(ColumnType.DATE, "[IMPORT] Last Import Date",
                         tmdb.get_import_date())
-    season.update_db_row()
+
+  def __update_season_notion_row(self, show_id: str, season_number: int,
+                                 season: NotionRow, tmdb: TmdbEntity):
+    logger.debug("Updating Notion row for Season %d for IMDB ID: %s",
+                 season_number, tmdb.get_imdb_id())
+    self.__fill_season_notion_row(show_id, season_number, season, tmdb)
+    return lambda: self.__write_row(season) or ""
 
   def __create_season_notion_row(self, show_id: str, season_number: int,
                                  tmdb: TmdbEntity):
@@ -374,14 +719,16 @@ class UpdateFromTmdb():
     season.set_client(self.__notion)
     title = "Season " + str(season_number)
 
-    pprint(">> Creating Notion row for " + title + " for IMDB ID: " +
-           tmdb.get_imdb_id())
+    logger.debug("Creating Notion row for %s for IMDB ID: %s", title,
+                 tmdb.get_imdb_id())
     season.create_field(ColumnType.TITLE, "Season Index", title)
-    season.create_field(ColumnType.RELATION, "Show", [show_id])
-    season.create_field(ColumnType.RICH_TEXT, "Overview",
-                        [tmdb.get_season_overview(season_number)])
-    # TODO: create other fields, will need notion functions
-    season.create_new_db_row(
+    self.__fill_season_notion_row(show_id,
+                                  season_number,
+                                  season,
+                                  tmdb,
+                                  set_unwatched=True)
+    return lambda: self.__create_row(
+        season,
         os.environ["SEASONS_DB"],
         icon={
             "type": "external",
@@ -390,10 +737,50 @@ class UpdateFromTmdb():
             }
         })
 
-    # Update the row right away to fill in all available data
-    self.__update_season_notion_row(show_id, season, tmdb, set_unwatched=True)
+  def __sync_seasons(self, imdb_id: str) -> list:
+    """Compute the new values of every season of the show, then write them.
+    New seasons are created with all their fields in one call, and the writes
+    run concurrently (still paced by the shared Notion scheduler). Seasons
+    journaled as written are skipped. Returns the errors of the writes."""
+    show = self.__imdb_to_show[imdb_id]
+    show_id = show["notion_row"].get_id()
+    writes = []
+    for s in range(1, show["tmdb_entity"].get_number_of_seasons() + 1):
+      if self.__journal != None and self.__journal.is_season_written(
+          imdb_id, s):
+        continue
+      season = self.__season_index.get_row(show_id, s)
+      if season != None:
+        season.set_client(self.__notion)
+        writes.append((s,
+                       self.__update_season_notion_row(show_id, s, season,
+                                                       show["tmdb_entity"])))
+      else:
+        writes.append((s,
+                       self.__create_season_notion_row(show_id, s,
+                                                       show["tmdb_entity"])))
 
-  def __cache_update_needed(self, import_hint: str,
+    def write_and_record(season_number: int, write) -> str:
+      err = write()
+      if err:
+        return "Season " + str(season_number) + ": " + err
+      if self.__journal != None:
+        self.__journal.record_season_written(imdb_id, season_number)
+      return ""
+
+    if len(writes) <= 1:
+      results = [write_and_record(s, write) for s, write in writes]
+    else:
+      with ThreadPoolExecutor(
+          max_workers=min(len(writes), kMaxSeasonWriteWorkers)) as executor:
+        write_and_record = bind_run_metrics(write_and_record)
+        results = [
+            future.result() for future in
+            [executor.submit(write_and_record, s, write) for s, write in writes]
+        ]
+    return [err for err in results if err]
+
+  def __cache_update_needed(self, imdb_id: str, import_hint: str,
                             date_last_updated: str) -> bool:
     if not date_last_updated:
       return True
@@ -404,7 +791,10 @@ class UpdateFromTmdb():
             date_last_updated, '%Y-%m-%d').astimezone(kDefaultTimezone)).days
     if import_hint == "Automate" and (days_since_last_update
                                       >= kAutomateUpdateIntervalDays):
-      return True
+      # Shows that TMDB reports as unchanged since the last import can reuse
+      # the cached data. Parts of it still expire on their own TTLs.
+      return self.__change_feed.has_changed(get_cached_tmdb_id(imdb_id),
+                                            date_last_updated)
     return False
 
   def __run_automated_update(self, import_hint: str,
@@ -424,74 +814,162 @@ class UpdateFromTmdb():
 
   def __process_shows(self):
     for result in self.__shows_db["results"]:
-      notion_row = NotionRow(result["id"], result["properties"])
+      notion_row = NotionRow(result["id"],
+                             result["properties"],
+                             keep=kShowRowProperties)
       notion_row.set_client(self.__notion)
       imdb_id = notion_row.get_value(ColumnType.RICH_TEXT, "IMDB ID")[0]
 
       # If only specific IDs are requested, no need to process everything
       if self.__input_imdb_ids and (not imdb_id in self.__input_imdb_ids):
         continue
+      # Shows finished by the interrupted run that is being resumed.
+      if self.__journal != None and self.__journal.is_finished(imdb_id):
+        self.__metrics.increment("updater.shows_resumed")
+        continue
 
-      import_hint = notion_row.get_value(ColumnType.SELECT,
-                                         "[IMPORT] Next Import Hint")
-      date_last_updated = notion_row.get_value(ColumnType.DATE,
-                                               "[IMPORT] Last Import Date")
-      try:
-        tmdb_entity = TmdbEntity(imdb_id=imdb_id,
-                                 force_update_cache=self.__cache_update_needed(
-                                     import_hint, date_last_updated or ""))
-      except Exception as e:
-        pprint("Could not fetch TMDB Entity for IMDB ID: " + imdb_id)
-        pprint("Exception: " + str(e))
-        tmdb_entity = {}
+      # The TMDB entity is fetched later by __fetch_tmdb_entity so that the
+      # fetch can run inside the worker pool along with the Notion updates.
+      self.__imdb_to_show[imdb_id] = {
+          "notion_row": notion_row,
+          "tmdb_entity": {},
+      }
       if not self.__is_watchlist:
-        self.__imdb_to_show[imdb_id] = {
-            "notion_row": notion_row,
-            "tmdb_entity": tmdb_entity,
-            "seasons_db_notion_rows": {}
-        }
         self.__show_id_to_imdb[notion_row.get_id()] = imdb_id
-      else:
-        self.__imdb_to_show[imdb_id] = {
-            "notion_row": notion_row,
-            "tmdb_entity": tmdb_entity,
-        }
+    # Only the compact rows are kept, the raw rows can be freed.
+    self.__shows_db = {}
+
+  def __fetch_tmdb_entity(self, imdb_id: str):
+    notion_row = self.__imdb_to_show[imdb_id]["notion_row"]
+    import_hint = notion_row.get_value(ColumnType.SELECT,
+                                       "[IMPORT] Next Import Hint")
+    date_last_updated = notion_row.get_value(ColumnType.DATE,
+                                             "[IMPORT] Last Import Date")
+    try:
+      with self.__metrics.time_phase("tmdb_fetch"):
+        tmdb_entity = TmdbEntity(
+            imdb_id=imdb_id,
+            force_update_cache=self.__cache_update_needed(
+                imdb_id, import_hint, date_last_updated or ""),
+            cache_only=self.__change_set != None)
+    except Exception as e:
+      logger.warning("Could not fetch TMDB Entity for IMDB ID %s: %s",
+                     imdb_id, e)
+      if self.__change_set != None:
+        self.__change_set.add_skipped(imdb_id, str(e))
+      tmdb_entity = {}
+    self.__imdb_to_show[imdb_id]["tmdb_entity"] = tmdb_entity
 
   def __process_seasons(self):
-    for result in self.__seasons_db["results"]:
-      notion_row = NotionRow(result["id"], result["properties"])
-      notion_row.set_client(self.__notion)
+    # Only the seasons of shows processed by __process_shows are indexed.
+    self.__season_index = SeasonIndex(self.__seasons_db["results"],
+                                      set(self.__show_id_to_imdb))
+    self.__seasons_db = {}
 
-      show_id = notion_row.get_value(ColumnType.RELATION, "Show")[0]
-      imdb_id = ""
-      # show_id will be missing from show_id_to_imdb if this show was not
-      # processed by __process_shows
-      if show_id in self.__show_id_to_imdb:
-        imdb_id = self.__show_id_to_imdb[show_id]
-      else:
-        continue
+  ########################## Per Show Update Functions #########################
 
-      season_index = notion_row.get_value(ColumnType.TITLE, "Season Index")[0]
-      self.__imdb_to_show[imdb_id]["seasons_db_notion_rows"][
-          season_index] = notion_row
+  def __run_for_each_show(self, update_fn) -> list:
+    """Run update_fn for every processed show, using up to max_workers threads.
+    Returns the merged error log, in the same order as the processed shows."""
+    imdb_ids = list(self.__imdb_to_show)
 
-  ################################ API Functions ###############################
+    def update_and_report(imdb_id: str) -> list:
+      try:
+        errors = update_fn(imdb_id)
+      except Exception as e:
+        # One show failing must not stop the updates of the others.
+        logger.exception("Update failed for IMDB ID %s: %s", imdb_id, e)
+        errors = ["Update failed for IMDB ID " + imdb_id + ": " + str(e)]
+      if self.__progress_callback:
+        self.__progress_callback(imdb_id, errors, len(imdb_ids))
+      return errors
+
+    if self.__max_workers == 1 or len(imdb_ids) <= 1:
+      per_show_errors = [update_and_report(imdb_id) for imdb_id in imdb_ids]
+    else:
+      with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+        per_show_errors = list(
+            executor.map(bind_run_metrics(update_and_report), imdb_ids))
 
-  def update_shows_and_seasons(self) -> list:
-    if self.__is_watchlist:
-      raise NotImplementedError(
-          "update_shows_and_seasons is not implemented for is_watchlist=True")
-    self.__process_shows()
-    self.__process_seasons()
     error_log = []
+    for errors in per_show_errors:
+      error_log.extend(errors)
+    return error_log
 
-    for imdb_id in self.__imdb_to_show:
-      if self.__imdb_to_show[imdb_id]["tmdb_entity"] == {}:
-        err = "No TMDB Entity found for IMDB ID: " + imdb_id
-        self.__update_notion_row_with_error(
-            imdb_id, err, self.__imdb_to_show[imdb_id]["notion_row"].get_id())
-        error_log.append(err)
-        continue
+  def __update_show_and_seasons(self, imdb_id: str) -> list:
+    errors = []
+    self.__fetch_tmdb_entity(imdb_id)
+    if self.__imdb_to_show[imdb_id]["tmdb_entity"] == {}:
+      if self.__change_set != None:
+        # Already recorded as skipped, nothing can be planned for the show.
+        return errors
+      err = "No TMDB Entity found for IMDB ID: " + imdb_id
+      self.__update_notion_row_with_error(
+          imdb_id, err, self.__imdb_to_show[imdb_id]["notion_row"].get_id())
+      errors.append(err)
+      self.__journal_show_finished(imdb_id, errors)
+      return errors
+    run_automated_update = self.__start_show_update(imdb_id)
+    if run_automated_update == None:
+      return errors
+
+    if not self.__journal_show_written(imdb_id):
+      with self.__metrics.time_phase("show_writes"):
+        err = self.__update_show_notion_row(
+            self.__imdb_to_show[imdb_id]["notion_row"],
+            self.__imdb_to_show[imdb_id]["tmdb_entity"], run_automated_update)
+      if err:
+        errors.append(err)
+      elif self.__journal != None:
+        self.__journal.record_show_written(imdb_id)
+
+    with self.__metrics.time_phase("season_writes"):
+      season_errors = self.__sync_seasons(imdb_id)
+    self.__metrics.increment("updater.shows_updated")
+    self.__show_finished(imdb_id, errors + season_errors)
+    return errors
+
+  def __update_watchlist_show(self, imdb_id: str) -> list:
+    self.__fetch_tmdb_entity(imdb_id)
+    if self.__imdb_to_show[imdb_id]["tmdb_entity"] == {}:
+      if self.__change_set != None:
+        return []
+      err = "No TMDB Entity found for IMDB ID: " + imdb_id
+      self.__update_notion_row_with_error(
+          imdb_id, err, self.__imdb_to_show[imdb_id]["notion_row"].get_id())
+      self.__journal_show_finished(imdb_id, [err])
+      return []
+    if self.__imdb_to_show[imdb_id]["notion_row"].get_value(
+        ColumnType.RELATION, "Shows DB Reference"):
+      err = self.__delete_show_notion_row(
+          self.__imdb_to_show[imdb_id]["notion_row"],
+          self.__imdb_to_show[imdb_id]["tmdb_entity"])
+      # A failed archive is retried by a resumed run.
+      self.__journal_show_finished(imdb_id, [err] if err else [])
+      return []
+
+    run_automated_update = self.__start_show_update(imdb_id)
+    if run_automated_update == None:
+      return []
+
+    with self.__metrics.time_phase("show_writes"):
+      err = self.__update_show_notion_row(
+          self.__imdb_to_show[imdb_id]["notion_row"],
+          self.__imdb_to_show[imdb_id]["tmdb_entity"], run_automated_update)
+    self.__metrics.increment("updater.shows_updated")
+    self.__show_finished(imdb_id, [err] if err else [])
+    return []
+
+  ############################# Run Journal Functions ##########################
+
+  def __start_show_update(self, imdb_id: str):
+    """Return whether the show gets an automated update, or None if it is not
+    due. Shows started by the interrupted run that is being resumed are
+    updated the same way as before, even if they no longer look due."""
+    run_automated_update = None
+    if self.__journal != None:
+      run_automated_update = self.__journal.get_started_automated(imdb_id)
+    if run_automated_update == None:
       import_hint = self.__imdb_to_show[imdb_id]["notion_row"].get_value(
           ColumnType.SELECT, "[IMPORT] Next Import Hint")
       date_last_updated = self.__imdb_to_show[imdb_id]["notion_row"].get_value(
@@ -500,29 +978,128 @@ class UpdateFromTmdb():
           import_hint, date_last_updated)
       if import_hint != "Update" and import_hint != "Force Update" and (
           not run_automated_update):
-        pprint("Skipping update for IMDB ID: " + imdb_id +
-               " with import_hint=" + str(import_hint))
-        continue
+        logger.debug("Skipping update for IMDB ID: %s with import_hint=%s",
+                     imdb_id, import_hint)
+        self.__metrics.increment("updater.shows_skipped")
+        return None
+    if self.__journal != None:
+      self.__journal.record_show_started(imdb_id, run_automated_update)
+    return run_automated_update
+
+  def __show_finished(self, imdb_id: str, errors: list):
+    # Only a show that was written without errors counts as checked against
+    # the change list, otherwise the next run would skip it.
+    if not errors:
+      self.__change_feed.record_checked(get_cached_tmdb_id(imdb_id))
+    self.__journal_show_finished(imdb_id, errors)
+
+  def __journal_show_written(self, imdb_id: str) -> bool:
+    return self.__journal != None and self.__journal.is_show_written(imdb_id)
+
+  def __journal_show_finished(self, imdb_id: str, errors: list):
+    if self.__journal != None:
+      self.__journal.record_show_finished(imdb_id, errors)
+
+  def __journal_run_finished(self):
+    if self.__journal != None:
+      self.__journal.record_run_finished()
+
+  def __start_run(self):
+    # The journal is only held while the run is going, and a resumed run
+    # needs it to know which shows to load.
+    if not self.__input_imdb_ids and self.__change_set == None:
+      self.__journal = RunJournal(
+          "watchlist" if self.__is_watchlist else "shows",
+          resume=self.__resume)
+    with self.__metrics.time_phase("query"):
+      if self.__use_mirror:
+        self.__load_from_mirror()
+      else:
+        self.__load_from_queries()
+
+  def __close_journal(self):
+    # Let the next run use the journal even if this one failed.
+    if self.__journal != None:
+      self.__journal.close()
+
+  def __fetch_change_feed(self):
+    # Targeted runs only refresh a few shows, which is cheaper than fetching
+    # the change list. Dry runs only read the cache, so they don't need it.
+    if self.__input_imdb_ids or self.__change_set != None:
+      return
+    # The change list has to reach back to the oldest check of the shows that
+    # are due for an automated update.
+    checked_dates = []
+    for imdb_id, show in self.__imdb_to_show.items():
+      import_hint = show["notion_row"].get_value(ColumnType.SELECT,
+                                                 "[IMPORT] Next Import Hint")
+      date_last_updated = show["notion_row"].get_value(
+          ColumnType.DATE, "[IMPORT] Last Import Date")
+      tmdb_id = get_cached_tmdb_id(imdb_id)
+      if tmdb_id and date_last_updated and self.__run_automated_update(
+          import_hint, date_last_updated):
+        checked_dates.append(
+            self.__change_feed.get_checked_date(tmdb_id, date_last_updated))
+    try:
+      self.__change_feed.fetch(min(checked_dates, default=""))
+    except Exception as e:
+      logger.warning(
+          "Could not fetch TMDB change list, refreshing all due shows: %s", e)
+
+  def __report_metrics(self, run_name: str):
+    """Print the run metrics and, if RUN_METRICS_DIR is set, export them as
+    JSON along with the Notion write and TMDB cache stats."""
+    cached = self.__metrics.get_counter("tmdb.entities_cached")
+    fetched = self.__metrics.get_counter("tmdb.entities_fetched")
+    if cached + fetched:
+      logger.info("TMDB entity cache hit rate: %.1f%%",
+                  100 * cached / (cached + fetched))
+    logger.info("Notion write stats: %s", get_notion_write_stats())
+    if self.__change_set != None:
+      run_name += "-plan"
+      logger.info("Planned changes: %s", self.__change_set.get_summary())
+    logger.info("%s", self.__metrics.format_summary())
+    metrics_dir = os.environ.get("RUN_METRICS_DIR")
+    if metrics_dir:
+      self.__metrics.export(
+          os.path.join(
+              metrics_dir, run_name + "-" +
+              datetime.now().strftime('%Y%m%d-%H%M%S') + ".json"), {
+                  "run": run_name,
+                  "notion_write_stats": get_notion_write_stats(),
+                  "tmdb_cache_stats": get_tmdb_cache().get_stats()
+              })
 
-      err = self.__update_show_notion_row(
-          self.__imdb_to_show[imdb_id]["notion_row"],
-          self.__imdb_to_show[imdb_id]["tmdb_entity"], run_automated_update)
-      if err:
-        error_log.append(err)
-
-      show_id = self.__imdb_to_show[imdb_id]["notion_row"].get_id()
-      num_seasons = self.__imdb_to_show[imdb_id][
-          "tmdb_entity"].get_number_of_seasons()
-      for s in range(1, num_seasons + 1):
-        season_index = "Season " + str(s)
-        if season_index in self.__imdb_to_show[imdb_id][
-            "seasons_db_notion_rows"]:
-          self.__update_season_notion_row(
-              show_id, self.__imdb_to_show[imdb_id]["seasons_db_notion_rows"]
-              [season_index], self.__imdb_to_show[imdb_id]["tmdb_entity"])
-        else:
-          self.__create_season_notion_row(
-              show_id, s, self.__imdb_to_show[imdb_id]["tmdb_entity"])
+  ################################ API Functions ###############################
+
+  def get_metrics(self) -> RunMetrics:
+    return self.__metrics
+
+  def set_progress_callback(self, progress_callback):
+    """Call progress_callback(imdb_id, errors, total_shows) after each show is
+    done. It may be called from several worker threads at once."""
+    self.__progress_callback = progress_callback
+
+  def update_shows_and_seasons(self) -> list:
+    if self.__is_watchlist:
+      raise NotImplementedError(
+          "update_shows_and_seasons is not implemented for is_watchlist=True")
+    with use_run_metrics(self.__metrics):
+      try:
+        self.__start_run()
+        with self.__metrics.time_phase("process_shows"):
+          self.__process_shows()
+        with self.__metrics.time_phase("process_seasons"):
+          self.__process_seasons()
+        with self.__metrics.time_phase("change_feed"):
+          self.__fetch_change_feed()
+        with self.__metrics.time_phase("update_shows"):
+          error_log = self.__run_for_each_show(self.__update_show_and_seasons)
+        self.__journal_run_finished()
+      finally:
+        self.__close_journal()
+      self.__metrics.increment("updater.show_errors", len(error_log))
+      self.__report_metrics("shows")
 
     # IMDB IDs that came as input but were not found in the Shows DB.
     if self.__input_imdb_ids:
@@ -537,33 +1114,16 @@ class UpdateFromTmdb():
     if not self.__is_watchlist:
       raise NotImplementedError(
           "update_watchlist is not implemented for is_watchlist=False")
-    self.__process_shows()
-
-    for imdb_id in self.__imdb_to_show:
-      if self.__imdb_to_show[imdb_id]["tmdb_entity"] == {}:
-        self.__update_notion_row_with_error(
-            imdb_id, "No TMDB Entity found for IMDB ID: " + imdb_id,
-            self.__imdb_to_show[imdb_id]["notion_row"].get_id())
-        continue
-      if self.__imdb_to_show[imdb_id]["notion_row"].get_value(
-          ColumnType.RELATION, "Shows DB Reference"):
-        self.__delete_show_notion_row(
-            self.__imdb_to_show[imdb_id]["notion_row"],
-            self.__imdb_to_show[imdb_id]["tmdb_entity"])
-        continue
-
-      import_hint = self.__imdb_to_show[imdb_id]["notion_row"].get_value(
-          ColumnType.SELECT, "[IMPORT] Next Import Hint")
-      date_last_updated = self.__imdb_to_show[imdb_id]["notion_row"].get_value(
-          ColumnType.DATE, "[IMPORT] Last Import Date")
-      run_automated_update = self.__run_automated_update(
-          import_hint, date_last_updated)
-      if import_hint != "Update" and import_hint != "Force Update" and (
-          not run_automated_update):
-        pprint("Skipping update for IMDB ID: " + imdb_id +
-               " with import_hint=" + str(import_hint))
-        continue
-
-      self.__update_show_notion_row(self.__imdb_to_show[imdb_id]["notion_row"],
-                                    self.__imdb_to_show[imdb_id]["tmdb_entity"],
-                                    run_automated_update)
\ No newline at end of file
+    with use_run_metrics(self.__metrics):
+      try:
+        self.__start_run()
+        with self.__metrics.time_phase("process_shows"):
+          self.__process_shows()
+        with self.__metrics.time_phase("change_feed"):
+          self.__fetch_change_feed()
+        with self.__metrics.time_phase("update_shows"):
+          self.__run_for_each_show(self.__update_watchlist_show)
+        self.__journal_run_finished()
+      finally:
+        self.__close_journal()
+      self.__report_metrics("watchlist")
@@ -0,0 +1,512 @@
+import asyncio
+import httpx
+import os
+import sys
+import threading
+import time
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_directory)
+sys.path.append(os.path.join(current_directory, "tmdb"))
+sys.path.append(os.path.join(current_directory, "notionhelpers"))
+sys.path.append(os.path.join(current_directory, "metrics"))
+
+from notion_client.errors import HTTPResponseError
+from notion_client.errors import RequestTimeoutError
+from notionhelpers import ColumnType
+from notionhelpers import NotionChangeSet
+from notionhelpers import configure_notion_scheduler
+from runjournal import RunInProgressError
+from tmdbhelpers import configure_tmdb_cache
+from tvshowsupdater import SeasonIndex
+from unittest import TestCase
+from unittest import mock
+from datetime import datetime
+import json
+import tempfile
+import tvshowsupdater
+
+kShowsDbId = "shows-db"
+kSeasonsDbId = "seasons-db"
+kFutureShowsDbId = "future-shows-db"
+_kListGetters = {
+    "get_cast", "get_creators", "get_production_companies", "get_networks",
+    "get_watch_providers", "get_countries", "get_languages", "get_genres",
+    "get_keywords"
+}
+
+# The other show columns the updater writes, all empty like in Notion.
+_kEmptyShowColumns = {
+    "Original Title": "rich_text",
+    "Tagline": "rich_text",
+    "Plot": "rich_text",
+    "Status": "select",
+    "Type": "select",
+    "Cast": "multi_select",
+    "Creators": "multi_select",
+    "Production Companies": "multi_select",
+    "Networks": "multi_select",
+    "Watch Providers (US)": "multi_select",
+    "Countries": "multi_select",
+    "Languages": "multi_select",
+    "Genres": "multi_select",
+    "Keywords": "multi_select",
+    "Number of Seasons": "number",
+    "TMDB Rating": "number"
+}
+_kListColumnTypes = {"rich_text", "multi_select"}
+
+
+def _show_page(imdb_id: str,
+               import_hint: str = "Update",
+               last_import_date: str = None) -> dict:
+  empty_columns = {
+      name: {
+          "type": col_type,
+          col_type: [] if col_type in _kListColumnTypes else None
+      } for name, col_type in _kEmptyShowColumns.items()
+  }
+  return {
+      "object": "page",
+      "id": "page-" + imdb_id,
+      "parent": {
+          "type": "database_id",
+          "database_id": kShowsDbId
+      },
+      "properties": {
+          **empty_columns,
+          "Title": {
+              "type": "title",
+              "title": [{
+                  "plain_text": "Show " + imdb_id
+              }]
+          },
+          "IMDB ID": {
+              "type": "rich_text",
+              "rich_text": [{
+                  "plain_text": imdb_id
+              }]
+          },
+          "[IMPORT] Next Import Hint": {
+              "type": "select",
+              "select": {
+                  "name": import_hint
+              }
+          },
+          "[IMPORT] Last Import Date": {
+              "type": "date",
+              "date": {
+                  "start": last_import_date
+              } if last_import_date else None
+          },
+          "[IMPORT] Errors": {
+              "type": "rich_text",
+              "rich_text": []
+          }
+      }
+  }
+
+
+def _season_page(page_id: str, show_ids: list, season_index: str) -> dict:
+  return {
+      "object": "page",
+      "id": page_id,
+      "properties": {
+          "Season Index": {
+              "type": "title",
+              "title": [{
+                  "plain_text": season_index
+              }] if season_index else []
+          },
+          "Show": {
+              "type": "relation",
+              "relation": [{
+                  "id": show_id
+              } for show_id in show_ids]
+          }
+      }
+  }
+
+
+class _FakeDatabases():
+
+  def __init__(self, rows: dict):
+    self.rows = rows
+
+  def query(self, database_id: str, **kwargs):
+    return {
+        "object": "list",
+        "results": self.rows.get(database_id, []),
+        "next_cursor": None,
+        "has_more": False
+    }
+
+
+class _FakePages():
+  """Records the pages that are created or updated, from any worker thread.
+  Creates raise the errors in create_errors, in order, then succeed."""
+
+  def __init__(self):
+    self.created = []
+    self.updated = []
+    self.create_errors = []
+    self.lock = threading.Lock()
+
+  def create(self, parent: dict, properties: dict, **kwargs):
+    with self.lock:
+      self.created.append(properties)
+      if self.create_errors:
+        raise self.create_errors.pop(0)
+      page_id = "created-" + str(len(self.created))
+    return {"object": "page", "id": page_id, "properties": {}}
+
+  def update(self, page_id: str, **kwargs):
+    with self.lock:
+      self.updated.append(page_id)
+    return {"object": "page", "id": page_id, "properties": {}}
+
+
+class _FakeAsyncPages():
+
+  def __init__(self, pages: _FakePages):
+    self.pages = pages
+
+  async def create(self, **kwargs):
+    return self.pages.create(**kwargs)
+
+  async def update(self, **kwargs):
+    return self.pages.update(**kwargs)
+
+
+class _FakeNotion():
+
+  def __init__(self, rows: dict):
+    self.databases = _FakeDatabases(rows)
+    self.pages = _FakePages()
+
+
+class _FakeAsyncNotion():
+
+  def __init__(self, notion: _FakeNotion):
+    self.pages = _FakeAsyncPages(notion.pages)
+
+
+def _http_error(status: int) -> HTTPResponseError:
+  return HTTPResponseError(httpx.Response(status))
+
+
+class _FakeTmdbEntity():
+  """Stands in for TmdbEntity: a show without seasons. Entities of
+  missing_imdb_ids can't be fetched, filling the rows of raising_imdb_ids
+  raises, and later shows take less time, so they finish first."""
+  missing_imdb_ids = set()
+  raising_imdb_ids = set()
+  delays = {}
+
+  def __init__(self, imdb_id: str = "", tmdb_id: str = "", **kwargs):
+    imdb_id = imdb_id or "tt" + tmdb_id
+    if imdb_id in _FakeTmdbEntity.missing_imdb_ids:
+      raise ValueError("Not found on TMDB")
+    self.imdb_id = imdb_id
+    time.sleep(_FakeTmdbEntity.delays.get(imdb_id, 0))
+
+  def get_imdb_id(self) -> str:
+    return self.imdb_id
+
+  def get_title(self) -> str:
+    return "Show " + self.imdb_id
+
+  def get_original_title(self) -> str:
+    if self.imdb_id in _FakeTmdbEntity.raising_imdb_ids:
+      raise RuntimeError("Unexpected TMDB data")
+    return "Show " + self.imdb_id
+
+  def get_number_of_seasons(self) -> int:
+    return 0
+
+  def get_import_date(self) -> str:
+    return "2026-10-18"
+
+  def __getattr__(self, name: str):
+    # The remaining show fields are left empty.
+    if name in _kListGetters:
+      return lambda: []
+    return lambda: None
+
+
+class _FakeAsyncTmdbClient():
+
+  async def fetch_entity(self, tmdb_id: str) -> _FakeTmdbEntity:
+    return _FakeTmdbEntity(tmdb_id=tmdb_id)
+
+
+class _UpdaterTestCase(TestCase):
+  """Runs UpdateFromTmdb over a few shows, with stub Notion and TMDB
+  clients."""
+
+  def setUp(self):
+    configure_tmdb_cache(cache_dir=tempfile.mkdtemp())
+    configure_notion_scheduler(requests_per_second=1000, burst_size=1000)
+    self.addCleanup(configure_notion_scheduler)
+    _FakeTmdbEntity.missing_imdb_ids = set()
+    _FakeTmdbEntity.raising_imdb_ids = set()
+    self.imdb_ids = ["tt" + str(i) for i in range(8)]
+    _FakeTmdbEntity.delays = {
+        imdb_id: 0.01 * (len(self.imdb_ids) - i)
+        for i, imdb_id in enumerate(self.imdb_ids)
+    }
+    self.notion = _FakeNotion(
+        {kShowsDbId: [_show_page(imdb_id) for imdb_id in self.imdb_ids]})
+    patches = [
+        mock.patch.object(tvshowsupdater, "get_notion_client",
+                          lambda: self.notion),
+        mock.patch.object(tvshowsupdater, "TmdbEntity", _FakeTmdbEntity),
+        mock.patch.dict(
+            os.environ, {
+                "SHOWS_DB": kShowsDbId,
+                "SEASONS_DB": kSeasonsDbId,
+                "FUTURE_SHOWS_DB": kFutureShowsDbId
+            })
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+
+
+
+class UpdateFromTmdbWorkers(_UpdaterTestCase):
+
+  def run_updater(self) -> list:
+    updater = tvshowsupdater.UpdateFromTmdb(imdb_ids=self.imdb_ids,
+                                            max_workers=4,
+                                            use_mirror=False)
+    finished = []
+    updater.set_progress_callback(
+        lambda imdb_id, errors, total_shows: finished.append(imdb_id))
+    error_log = updater.update_shows_and_seasons()
+    self.assertEqual(sorted(finished), self.imdb_ids)
+    # The shows finish out of order, the error log still follows the input.
+    self.assertNotEqual(finished, self.imdb_ids)
+    return error_log
+
+  def test_errors_are_merged_in_input_order(self):
+    _FakeTmdbEntity.missing_imdb_ids = {"tt6", "tt1", "tt4"}
+    self.assertEqual(self.run_updater(), [
+        "No TMDB Entity found for IMDB ID: tt1",
+        "No TMDB Entity found for IMDB ID: tt4",
+        "No TMDB Entity found for IMDB ID: tt6"
+    ])
+
+  def test_raising_show_does_not_stop_the_others(self):
+    _FakeTmdbEntity.raising_imdb_ids = {"tt2"}
+    _FakeTmdbEntity.missing_imdb_ids = {"tt5"}
+    self.assertEqual(self.run_updater(), [
+        "Update failed for IMDB ID tt2: Unexpected TMDB data",
+        "No TMDB Entity found for IMDB ID: tt5"
+    ])
+    written = set(self.notion.pages.updated)
+    for imdb_id in ["tt0", "tt1", "tt3", "tt4", "tt6", "tt7"]:
+      self.assertIn("page-" + imdb_id, written)
+    self.assertNotIn("page-tt2", written)
+
+
+class SeasonIndexRows(TestCase):
+
+  def test_rows_are_keyed_by_show_and_season_number(self):
+    index = SeasonIndex([
+        _season_page("s1", ["show-1"], "Season 1"),
+        _season_page("s2", ["show-1"], "Season 2"),
+        _season_page("s3", ["show-2"], "Season 1")
+    ])
+    self.assertEqual(len(index), 3)
+    self.assertEqual(index.get_row("show-1", 2).get_id(), "s2")
+    self.assertEqual(index.get_row("show-2", 1).get_id(), "s3")
+    self.assertEqual(
+        index.get_row("show-1", 1).get_value(ColumnType.TITLE,
+                                             "Season Index"), ["Season 1"])
+    self.assertIsNone(index.get_row("show-2", 2))
+
+  def test_rows_without_show_or_season_number_are_skipped(self):
+    index = SeasonIndex([
+        _season_page("no-show", [], "Season 1"),
+        _season_page("no-title", ["show-1"], ""),
+        _season_page("no-number", ["show-1"], "Season"),
+        _season_page("specials", ["show-1"], "Season Specials"),
+        _season_page("long-title", ["show-1"], "Season 1 Part 2")
+    ])
+    self.assertEqual(len(index), 0)
+
+  def test_archived_rows_and_other_shows_are_skipped(self):
+    archived = dict(_season_page("archived", ["show-1"], "Season 1"),
+                    archived=True)
+    trashed = dict(_season_page("trashed", ["show-1"], "Season 2"),
+                   in_trash=True)
+    index = SeasonIndex(
+        [archived, trashed,
+         _season_page("other", ["show-2"], "Season 1")],
+        show_ids={"show-1"})
+    self.assertEqual(len(index), 0)
+
+  def test_last_row_with_duplicate_key_is_kept(self):
+    index = SeasonIndex([
+        _season_page("first", ["show-1"], "Season 1"),
+        _season_page("second", ["show-1"], "Season 1")
+    ])
+    self.assertEqual(len(index), 1)
+    self.assertEqual(index.get_row("show-1", 1).get_id(), "second")
+
+
+class UpdateFromTmdbPlanning(_UpdaterTestCase):
+  """Dry runs, as done by plan_from_tmdb.py."""
+
+  def plan(self) -> NotionChangeSet:
+    change_set = NotionChangeSet()
+    updater = tvshowsupdater.UpdateFromTmdb(imdb_ids=self.imdb_ids,
+                                            max_workers=4,
+                                            use_mirror=False,
+                                            change_set=change_set)
+    updater.update_shows_and_seasons()
+    return change_set
+
+  def test_planning_writes_nothing(self):
+    _FakeTmdbEntity.missing_imdb_ids = {"tt3"}
+    change_set = self.plan()
+    self.assertEqual(self.notion.pages.created, [])
+    self.assertEqual(self.notion.pages.updated, [])
+    summary = change_set.get_summary()
+    self.assertEqual(summary["rows_to_update"], len(self.imdb_ids) - 1)
+    self.assertEqual(summary["skipped"], 1)
+
+  def test_applied_plan_writes_planned_rows(self):
+    errors = self.plan().apply(self.notion, max_workers=2)
+    self.assertEqual(errors, [])
+    self.assertEqual(sorted(self.notion.pages.updated),
+                     ["page-" + imdb_id for imdb_id in self.imdb_ids])
+
+
+class UpdateFromTmdbJournal(_UpdaterTestCase):
+  """Runs over the whole library, which keep a RunJournal."""
+
+  def setUp(self):
+    super().setUp()
+    journal_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(journal_dir.cleanup)
+    self.journal_path = os.path.join(journal_dir.name, "shows.jsonl")
+    patch = mock.patch.dict(os.environ, {"RUN_JOURNAL_DIR": journal_dir.name})
+    patch.start()
+    self.addCleanup(patch.stop)
+
+  def new_updater(self):
+    return tvshowsupdater.UpdateFromTmdb(use_mirror=False)
+
+  def test_journal_is_only_locked_while_running(self):
+    first, second = self.new_updater(), self.new_updater()
+    overlapping_errors = []
+
+    def run_second(imdb_id: str, errors: list, total_shows: int):
+      if not overlapping_errors:
+        with self.assertRaises(RunInProgressError) as e:
+          second.update_shows_and_seasons()
+        overlapping_errors.append(e.exception)
+
+    first.set_progress_callback(run_second)
+    self.assertEqual(first.update_shows_and_seasons(), [])
+    self.assertEqual(len(overlapping_errors), 1)
+    # Once the first run is done, the second one can run.
+    self.assertEqual(self.new_updater().update_shows_and_seasons(), [])
+
+  def test_shows_that_are_not_due_are_not_journaled(self):
+    today = datetime.now().strftime('%Y-%m-%d')
+    self.notion.databases.rows[kShowsDbId] = [
+        _show_page("tt0"),
+        _show_page("tt1", "Automate", today),
+        _show_page("tt2", "Check Status", today),
+        _show_page("tt3")
+    ]
+    self.assertEqual(self.new_updater().update_shows_and_seasons(), [])
+    with open(self.journal_path) as f:
+      journaled = [json.loads(line).get("imdb_id") for line in f]
+    self.assertEqual(set(journaled) - {None}, {"tt0", "tt3"})
+
+
+class AddFromTmdbCreateFallback(TestCase):
+
+  def setUp(self):
+    configure_tmdb_cache(cache_dir=tempfile.mkdtemp())
+    # Errors are not retried, so each create below is sent once.
+    configure_notion_scheduler(requests_per_second=1000,
+                               burst_size=1000,
+                               max_retries=0)
+    self.addCleanup(configure_notion_scheduler)
+    _FakeTmdbEntity.missing_imdb_ids = set()
+    _FakeTmdbEntity.raising_imdb_ids = set()
+    _FakeTmdbEntity.delays = {}
+    self.notion = _FakeNotion({})
+    patches = [
+        mock.patch.object(tvshowsupdater, "get_notion_client",
+                          lambda: self.notion),
+        mock.patch.object(tvshowsupdater, "TmdbEntity", _FakeTmdbEntity),
+        mock.patch.dict(os.environ, {
+            "SHOWS_DB": kShowsDbId,
+            "FUTURE_SHOWS_DB": kFutureShowsDbId
+        })
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+
+  def create(self, error: Exception):
+    self.notion.pages.create_errors = [error]
+    tvshowsupdater.AddFromTmdb(tmdb_id="1",
+                               is_watchlist=True).create_show_notion_row()
+
+  def create_async(self, error: Exception):
+    self.notion.pages.create_errors = [error]
+
+    async def add():
+      add_from_tmdb = await tvshowsupdater.AddFromTmdb.fetch_async(
+          tmdb_id="1",
+          is_watchlist=True,
+          tmdb_client=_FakeAsyncTmdbClient(),
+          notion=_FakeAsyncNotion(self.notion))
+      await add_from_tmdb.create_show_notion_row_async()
+
+    # The async path only writes through the async client.
+    with mock.patch.object(tvshowsupdater, "get_notion_client") as get_client:
+      asyncio.run(add())
+    get_client.assert_not_called()
+
+  def assert_basic_row_created(self):
+    self.assertEqual(len(self.notion.pages.created), 2)
+    self.assertIn("Cast", self.notion.pages.created[0])
+    self.assertNotIn("Cast", self.notion.pages.created[1])
+    # The error is recorded on the basic row.
+    self.assertEqual(self.notion.pages.updated, ["created-2"])
+
+  def test_rejected_create_falls_back_to_basic_row(self):
+    self.create(_http_error(400))
+    self.assert_basic_row_created()
+
+  def test_create_that_was_not_applied_falls_back_to_basic_row(self):
+    self.create(_http_error(503))
+    self.assert_basic_row_created()
+
+  def test_server_error_is_raised_without_second_create(self):
+    with self.assertRaises(RuntimeError):
+      self.create(_http_error(500))
+    self.assertEqual(len(self.notion.pages.created), 1)
+    self.assertEqual(self.notion.pages.updated, [])
+
+  def test_timeout_is_raised_without_second_create(self):
+    with self.assertRaises(RuntimeError):
+      self.create(RequestTimeoutError())
+    self.assertEqual(len(self.notion.pages.created), 1)
+
+  def test_async_rejected_create_falls_back_to_basic_row(self):
+    self.create_async(_http_error(429))
+    self.assert_basic_row_created()
+
+  def test_async_server_error_is_raised_without_second_create(self):
+    with self.assertRaises(RuntimeError):
+      self.create_async(_http_error(502))
+    self.assertEqual(len(self.notion.pages.created), 1)
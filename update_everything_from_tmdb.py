@@ -1,16 +1,27 @@
+import logging
+import os
 import sys
-from pprint import pprint
-from datetime import datetime
 from tvshowsupdater import UpdateFromTmdb
+from tvshowsupdater import configure_connection_pools
+from tvshowsupdater import configure_logging
 
-pprint("+++++++++++ Starting update_from_tmdb run at " +
-       str(datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+# With --resume, each run picks up where the interrupted one stopped.
+resume = "--resume" in sys.argv[1:]
 
-updater = UpdateFromTmdb()
+configure_logging()
+logging.info("+++++++++++ Starting update_from_tmdb run")
+
+# Shows are independent of each other, so update several of them at once.
+max_workers = int(os.environ.get("UPDATE_MAX_WORKERS", "8"))
+# Both updaters share the same keep-alive connections.
+configure_connection_pools(max_workers)
+
+updater = UpdateFromTmdb(max_workers=max_workers, resume=resume)
 updater.update_shows_and_seasons()
 
-pprint("+++++++++++ Starting update_watchlist_from_tmdb run at " +
-       str(datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+logging.info("+++++++++++ Starting update_watchlist_from_tmdb run")
 
-updater = UpdateFromTmdb(is_watchlist=True)
+updater = UpdateFromTmdb(is_watchlist=True,
+                         max_workers=max_workers,
+                         resume=resume)
 updater.update_watchlist()
\ No newline at end of file
@@ -1,12 +1,14 @@
+import logging
 import sys
-from pprint import pprint
-from datetime import datetime
 from tvshowsupdater import UpdateFromTmdb
+from tvshowsupdater import configure_logging
 
-input_imdb_ids = sys.argv[1:]
+# With --resume, a full run picks up where the interrupted one stopped.
+resume = "--resume" in sys.argv[1:]
+input_imdb_ids = [arg for arg in sys.argv[1:] if arg != "--resume"]
 
-pprint("+++++++++++ Starting update_from_tmdb run at " +
-       str(datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+configure_logging()
+logging.info("+++++++++++ Starting update_from_tmdb run")
 
-updater = UpdateFromTmdb(imdb_ids=input_imdb_ids)
+updater = UpdateFromTmdb(imdb_ids=input_imdb_ids, resume=resume)
 updater.update_shows_and_seasons()
\ No newline at end of file
@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from tvshowsupdater import UpdateFromTmdb
+import logging
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Update jobs share the Notion rate limit, so running many of them at once
+# doesn't make them finish any sooner.
+kDefaultJobWorkers = 2
+kMaxFinishedJobs = 100
+
+
+class UpdateJob():
+  """State of one update run, safe to read while the run is in progress."""
+  __job_id: str
+  __imdb_ids: list
+  __status: str
+  __progress: list
+  __total_shows: int
+  __error_log: list
+  __submitted_at: str
+  __finished_at: str
+  __lock: threading.Lock
+
+  def __init__(self, imdb_ids: list):
+    self.__job_id = uuid.uuid4().hex
+    self.__imdb_ids = imdb_ids
+    self.__status = "queued"
+    self.__progress = []
+    self.__total_shows = 0
+    self.__error_log = []
+    self.__submitted_at = self.__now()
+    self.__finished_at = ""
+    self.__lock = threading.Lock()
+
+  def __now(self) -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+  ############################## Getter Functions ##############################
+
+  def get_id(self) -> str:
+    return self.__job_id
+
+  def is_finished(self) -> bool:
+    return self.__status in ["done", "failed"]
+
+  def to_dict(self, progress_since: int = 0) -> dict:
+    """Return the job state. Only progress entries from index progress_since
+    onwards are included, so pollers can fetch just what is new."""
+    with self.__lock:
+      return {
+          "job_id": self.__job_id,
+          "imdb_ids": self.__imdb_ids,
+          "status": self.__status,
+          "total_shows": self.__total_shows,
+          "shows_done": len(self.__progress),
+          "progress_since": progress_since,
+          "progress": self.__progress[progress_since:],
+          "error_log": self.__error_log,
+          "submitted_at": self.__submitted_at,
+          "finished_at": self.__finished_at,
+      }
+
+  ############################## Update Functions ##############################
+
+  def run(self, max_workers: int):
+    with self.__lock:
+      self.__status = "running"
+    try:
+      updater = UpdateFromTmdb(imdb_ids=self.__imdb_ids,
+                               max_workers=max_workers)
+      updater.set_progress_callback(self.__report_progress)
+      error_log = updater.update_shows_and_seasons()
+      status = "done"
+    except Exception as e:
+      logger.exception("Update job %s failed with exception: %s",
+                       self.__job_id, e)
+      error_log = ["Update failed: " + str(e)]
+      status = "failed"
+    with self.__lock:
+      self.__error_log = error_log
+      self.__status = status
+      self.__finished_at = self.__now()
+
+  def __report_progress(self, imdb_id: str, errors: list, total_shows: int):
+    with self.__lock:
+      self.__total_shows = total_shows
+      self.__progress.append({"imdb_id": imdb_id, "errors": errors})
+
+
+class UpdateJobQueue():
+  """Runs UpdateFromTmdb jobs in the background on a bounded worker pool.
+
+  Submitting the same IMDB IDs as a job that is still queued or running
+  returns that job instead of starting another one.
+  """
+  __executor: ThreadPoolExecutor
+  __update_max_workers: int
+  __jobs: OrderedDict
+  __active_jobs: dict
+  __lock: threading.Lock
+
+  def __init__(self,
+               max_workers: int = kDefaultJobWorkers,
+               update_max_workers: int = 1):
+    self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+    self.__update_max_workers = update_max_workers
+    self.__jobs = OrderedDict()
+    self.__active_jobs = {}
+    self.__lock = threading.Lock()
+
+  def __job_key(self, imdb_ids: list) -> tuple:
+    return tuple(sorted(set(imdb_ids)))
+
+  def __run(self, job: UpdateJob, key: tuple):
+    try:
+      job.run(self.__update_max_workers)
+    finally:
+      with self.__lock:
+        self.__active_jobs.pop(key, None)
+        self.__forget_finished_jobs()
+
+  def __forget_finished_jobs(self):
+    # Must be called with the lock held.
+    finished = [
+        job_id for job_id in self.__jobs if self.__jobs[job_id].is_finished()
+    ]
+    for job_id in finished[:max(0, len(finished) - kMaxFinishedJobs)]:
+      del self.__jobs[job_id]
+
+  ################################ API Functions ###############################
+
+  def submit(self, imdb_ids: list) -> str:
+    """Queue an update for imdb_ids (all shows if empty) and return the job
+    ID right away."""
+    key = self.__job_key(imdb_ids)
+    with self.__lock:
+      if key in self.__active_jobs:
+        return self.__active_jobs[key].get_id()
+      job = UpdateJob(imdb_ids)
+      self.__jobs[job.get_id()] = job
+      self.__active_jobs[key] = job
+    self.__executor.submit(self.__run, job, key)
+    return job.get_id()
+
+  def get_job_status(self, job_id: str, progress_since: int = 0) -> dict:
+    """Return the state of the job, or None for unknown job IDs."""
+    with self.__lock:
+      job = self.__jobs.get(job_id)
+    if job == None:
+      return None
+    return job.to_dict(progress_since)
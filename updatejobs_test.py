@@ -0,0 +1,122 @@
+import os
+import sys
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_directory)
+
+from unittest import TestCase
+from unittest import mock
+import threading
+import time
+import updatejobs
+
+kWaitTimeoutSecs = 5
+
+
+class _FakeUpdater():
+  """Stands in for UpdateFromTmdb. Each show reports its progress once
+  release is set, and shows in failing_imdb_ids report an error. A run over
+  raising_imdb_ids raises."""
+  release = threading.Event()
+  started = threading.Semaphore(0)
+  failing_imdb_ids = set()
+  raising_imdb_ids = []
+
+  def __init__(self, imdb_ids: list, max_workers: int):
+    self.imdb_ids = imdb_ids
+    self.progress_callback = None
+
+  def set_progress_callback(self, progress_callback):
+    self.progress_callback = progress_callback
+
+  def update_shows_and_seasons(self) -> list:
+    _FakeUpdater.started.release()
+    if self.imdb_ids == _FakeUpdater.raising_imdb_ids:
+      raise RuntimeError("Notion is down")
+    error_log = []
+    for imdb_id in self.imdb_ids:
+      _FakeUpdater.release.wait(kWaitTimeoutSecs)
+      errors = ["Failed " + imdb_id
+               ] if imdb_id in _FakeUpdater.failing_imdb_ids else []
+      error_log.extend(errors)
+      self.progress_callback(imdb_id, errors, len(self.imdb_ids))
+    return error_log
+
+
+class UpdateJobQueueStates(TestCase):
+
+  def setUp(self):
+    _FakeUpdater.release = threading.Event()
+    _FakeUpdater.started = threading.Semaphore(0)
+    _FakeUpdater.failing_imdb_ids = set()
+    _FakeUpdater.raising_imdb_ids = []
+    patch = mock.patch.object(updatejobs, "UpdateFromTmdb", _FakeUpdater)
+    patch.start()
+    self.addCleanup(patch.stop)
+    self.queue = updatejobs.UpdateJobQueue(max_workers=1)
+
+  def wait_until_finished(self, job_id: str) -> dict:
+    deadline = time.time() + kWaitTimeoutSecs
+    while time.time() < deadline:
+      status = self.queue.get_job_status(job_id)
+      if status["status"] in ["done", "failed"]:
+        return status
+      time.sleep(0.01)
+    self.fail("Job " + job_id + " did not finish")
+
+  def test_same_imdb_ids_share_a_job_until_it_finishes(self):
+    job_id = self.queue.submit(["tt2", "tt1"])
+    self.assertEqual(self.queue.submit(["tt1", "tt2", "tt1"]), job_id)
+    self.assertNotEqual(self.queue.submit(["tt1"]), job_id)
+    _FakeUpdater.release.set()
+    self.wait_until_finished(job_id)
+    self.assertNotEqual(self.queue.submit(["tt1", "tt2"]), job_id)
+
+  def test_status_and_progress_follow_the_run(self):
+    _FakeUpdater.failing_imdb_ids = {"tt2"}
+    blocking_job_id = self.queue.submit(["tt0"])
+    job_id = self.queue.submit(["tt1", "tt2"])
+    self.assertTrue(_FakeUpdater.started.acquire(timeout=kWaitTimeoutSecs))
+    # The only worker is busy, so the second job waits its turn.
+    self.assertEqual(self.queue.get_job_status(blocking_job_id)["status"],
+                     "running")
+    self.assertEqual(self.queue.get_job_status(job_id)["status"], "queued")
+
+    _FakeUpdater.release.set()
+    status = self.wait_until_finished(job_id)
+    self.assertEqual(status["status"], "done")
+    self.assertEqual(status["total_shows"], 2)
+    self.assertEqual(status["shows_done"], 2)
+    self.assertEqual(status["error_log"], ["Failed tt2"])
+    self.assertNotEqual(status["finished_at"], "")
+    self.assertEqual(
+        self.queue.get_job_status(job_id, progress_since=1)["progress"],
+        [{
+            "imdb_id": "tt2",
+            "errors": ["Failed tt2"]
+        }])
+
+  def test_raising_run_marks_job_failed(self):
+    _FakeUpdater.raising_imdb_ids = ["tt1"]
+    status = self.wait_until_finished(self.queue.submit(["tt1"]))
+    self.assertEqual(status["status"], "failed")
+    self.assertEqual(status["error_log"], ["Update failed: Notion is down"])
+
+  def test_unknown_job_has_no_status(self):
+    self.assertIsNone(self.queue.get_job_status("unknown"))
+
+  def test_oldest_finished_jobs_are_forgotten(self):
+    _FakeUpdater.release.set()
+    with mock.patch.object(updatejobs, "kMaxFinishedJobs", 2):
+      job_ids = []
+      for i in range(4):
+        job_ids.append(self.queue.submit(["tt" + str(i)]))
+        self.wait_until_finished(job_ids[-1])
+      # The queue forgets old jobs just after the last one reads as finished.
+      deadline = time.time() + kWaitTimeoutSecs
+      while self.queue.get_job_status(job_ids[1]) != None:
+        self.assertLess(time.time(), deadline)
+        time.sleep(0.01)
+    self.assertIsNone(self.queue.get_job_status(job_ids[0]))
+    self.assertIsNotNone(self.queue.get_job_status(job_ids[2]))
+    self.assertIsNotNone(self.queue.get_job_status(job_ids[3]))